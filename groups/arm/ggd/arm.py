@@ -59,8 +59,17 @@ import utils
 from . import arm_servo_ids
 from gg_group_setup import GroupConfigFile
 
-from stages import ArmStages, NO_BOX_FOUND
-from servo.servode import Servo, ServoProtocol, ServoGroup
+from stages import ArmStages, NO_BOX_FOUND, MAX_IMAGE_WIDTH, MAX_IMAGE_HEIGHT
+from stages import make_tracker, make_change_detector, make_frame_source
+from debug_images import DebugImageWriter
+from vision_worker import VisionWorker
+from edges import THRESHOLDS
+import chroma
+import calibration
+import goal_table
+import kinematics
+from servo.servode import Servo, ServoProtocol, ServoGroup, RegisterCache
+from servo.emulator import BusEmulator
 
 
 dir_path = os.path.dirname(os.path.realpath(__file__))
@@ -74,6 +83,10 @@ log.addHandler(handler)
 log.setLevel(logging.INFO)
 
 commands = ['run', 'stop']
+ARM_TELEMETRY_REGISTERS = [
+    'present_speed', 'present_position', 'present_load', 'goal_position',
+    'moving', 'present_temperature', 'torque_limit'
+]
 
 should_loop = True
 
@@ -206,24 +219,20 @@ def _arm_message(servo_group):
     data = []
     for servo in servo_group:
         log.debug("[_arm_message] servo:{0}".format(servo))
+        # the registers lie together in the control table, so they are read
+        # with one block read per servo
+        values = servo_group[servo].read_registers(ARM_TELEMETRY_REGISTERS)
         data.append({
             "sensor_id": "arm_servo_id_{0:02d}".format(
                 servo_group[servo].servo_id),
             "ts": datetime.datetime.now().isoformat(),
-            "present_speed":
-                servo_group[servo]['present_speed'],
-            "present_position":
-                servo_group[servo]['present_position'],
-            "present_load":
-                servo_group[servo]['present_load'],
-            "goal_position":
-                servo_group[servo]['goal_position'],
-            "moving":
-                servo_group[servo]['moving'],
-            "present_temperature":
-                servo_group[servo]['present_temperature'],
-            "torque_limit":
-                servo_group[servo]['torque_limit']
+            "present_speed": values['present_speed'],
+            "present_position": values['present_position'],
+            "present_load": values['present_load'],
+            "goal_position": values['goal_position'],
+            "moving": values['moving'],
+            "present_temperature": values['present_temperature'],
+            "torque_limit": values['torque_limit']
         })
 
     msg = {
@@ -241,7 +250,12 @@ class ArmControlThread(threading.Thread):
     # TODO move control into Lambda pending being able to access serial port
 
     def __init__(self, servo_group, event, stage_topic, mqtt_client,
-                 master_shadow, args=(), kwargs={}):
+                 master_shadow, debug_writer=None, frame_source=None,
+                 stream_find=False, tracker=None, image_width=MAX_IMAGE_WIDTH,
+                 image_height=MAX_IMAGE_HEIGHT, coarse_scale=1,
+                 vision_worker=None, change_detector=None, threshold='fixed',
+                 chroma_table=None, remap_table=None, goals=None,
+                 geometry=None, args=(), kwargs={}):
         super(ArmControlThread, self).__init__(
             name="arm_control_thread", args=args, kwargs=kwargs
         )
@@ -259,6 +273,20 @@ class ArmControlThread(threading.Thread):
         self.mqtt_client = mqtt_client
         self.master_shadow = master_shadow
         self.found_box = None
+        self.debug_writer = debug_writer
+        self.frame_source = frame_source
+        self.stream_find = stream_find
+        self.tracker = tracker
+        self.image_width = image_width
+        self.image_height = image_height
+        self.coarse_scale = coarse_scale
+        self.vision_worker = vision_worker
+        self.change_detector = change_detector
+        self.threshold = threshold
+        self.chroma_table = chroma_table
+        self.remap_table = remap_table
+        self.goals = goals
+        self.geometry = geometry
 
         self.master_shadow.shadowRegisterDeltaCallback(self.shadow_mgr)
         log.debug("[arm.__init__] shadowRegisterDeltaCallback()")
@@ -321,7 +349,7 @@ class ArmControlThread(threading.Thread):
         self.mqtt_client.publish(
             self.stage_topic, _stage_message("home", "begin"), 0
         )
-        stage_result = arm.stage_home()
+        stage_result = arm.stage_home(should_run=self.cmd_event)
         self.mqtt_client.publish(
             self.stage_topic, _stage_message("home", "end", stage_result), 0
         )
@@ -330,7 +358,16 @@ class ArmControlThread(threading.Thread):
 
     def find(self):
         log.debug("[act.find] [begin]")
-        arm = ArmStages(self.sg)
+        arm = ArmStages(self.sg, debug_writer=self.debug_writer,
+                        frame_source=self.frame_source, tracker=self.tracker,
+                        image_width=self.image_width,
+                        image_height=self.image_height,
+                        coarse_scale=self.coarse_scale,
+                        vision_worker=self.vision_worker,
+                        change_detector=self.change_detector,
+                        threshold=self.threshold,
+                        chroma_table=self.chroma_table,
+                        remap_table=self.remap_table)
         loop = True
         self.found_box = NO_BOX_FOUND
         stage_result = NO_BOX_FOUND
@@ -338,7 +375,8 @@ class ArmControlThread(threading.Thread):
             self.stage_topic, _stage_message("find", "begin"), 0
         )
         while self.cmd_event.is_set() and loop is True:
-            stage_result = arm.stage_find()
+            stage_result = arm.stage_find(should_run=self.cmd_event,
+                                          stream=self.stream_find)
             if stage_result['x'] and stage_result['y']:  # X & Y start as none
                 log.info("[act.find] found box:{0}".format(stage_result))
                 self.found_box = stage_result
@@ -350,7 +388,8 @@ class ArmControlThread(threading.Thread):
                     self.found_box
                 ))
                 log.info("[act.find] no box:{0}".format(stage_result))
-                time.sleep(1)
+                if not self.stream_find:
+                    time.sleep(1)
 
         # TODO get image upload working with discovery based interaction
         # # upload the image file just before stage complete
@@ -381,7 +420,7 @@ class ArmControlThread(threading.Thread):
 
     def pick(self):
         log.debug("[act.pick] [begin]")
-        arm = ArmStages(self.sg)
+        arm = ArmStages(self.sg, goals=self.goals, geometry=self.geometry)
         self.mqtt_client.publish(
             self.stage_topic, _stage_message("pick", "begin"), 0
         )
@@ -389,7 +428,8 @@ class ArmControlThread(threading.Thread):
         self.found_box = NO_BOX_FOUND
         log.info("[act.pick] pick_box:{0}".format(pick_box))
         log.info("[act.pick] self.found_box:{0}".format(self.found_box))
-        stage_result = arm.stage_pick(previous_results=pick_box,
+        stage_result = arm.stage_pick(should_run=self.cmd_event,
+                                      previous_results=pick_box,
                                       cartesian=False)
         self.mqtt_client.publish(
             self.stage_topic, _stage_message("pick", "end", stage_result), 0
@@ -403,7 +443,7 @@ class ArmControlThread(threading.Thread):
         self.mqtt_client.publish(
             self.stage_topic, _stage_message("sort", "begin"), 0
         )
-        stage_result = arm.stage_sort()
+        stage_result = arm.stage_sort(should_run=self.cmd_event)
         self.mqtt_client.publish(
             self.stage_topic, _stage_message("sort", "end", stage_result), 0
         )
@@ -451,6 +491,17 @@ class ArmControlThread(threading.Thread):
                     stage_result = self.control_stages[stage]()
                     log.info("[run] stage:'{0}' res:'{1}'".format(
                         stage, stage_result))
+                    if 'timed_out' in stage_result:
+                        # the arm is not where the next stage expects it,
+                        # so start again from home
+                        log.warning("[run] stage:'{0}' timed out".format(
+                            stage))
+                        break
+                    if 'unreachable' in stage_result:
+                        # nothing was picked up, so there is nothing to sort
+                        log.warning("[run] stage:'{0}' target unreachable"
+                                    .format(stage))
+                        break
                 else:
                     # Here is where the Arm will be stopped
                     self.stop_arm()
@@ -509,17 +560,117 @@ if __name__ == "__main__":
                         help="Modify the default telemetry sample frequency.")
     parser.add_argument('--debug', default=False, action='store_true',
                         help="Activate debug output.")
+    parser.add_argument('--debug_images', default=False, action='store_true',
+                        help="Save the images processed while finding boxes.")
+    parser.add_argument('--stream_find', default=False, action='store_true',
+                        help="Stream camera frames while finding boxes instead "
+                             "of capturing one frame per second.")
+    parser.add_argument('--track_find', default=False, action='store_true',
+                        help="Track the box found from frame to frame and "
+                             "search around it first.")
+    parser.add_argument('--image_width', default=MAX_IMAGE_WIDTH, type=int,
+                        help="The width of the frames used to find boxes.")
+    parser.add_argument('--image_height', default=MAX_IMAGE_HEIGHT, type=int,
+                        help="The height of the frames used to find boxes.")
+    parser.add_argument('--coarse_scale', default=1, type=int,
+                        help="Find boxes in frames this many times smaller, "
+                             "then refine their position at full size.")
+    parser.add_argument('--vision_worker', default=False, action='store_true',
+                        help="Find boxes in a separate process so finding "
+                             "does not stall telemetry.")
+    parser.add_argument('--skip_static', default=False, action='store_true',
+                        help="Skip finding boxes in frames while the belt is "
+                             "static and empty.")
+    parser.add_argument('--find_threshold', default='fixed',
+                        choices=THRESHOLDS,
+                        help="How the edge threshold of each frame is chosen "
+                             "while finding boxes.")
+    parser.add_argument('--chroma_table',
+                        help="Find boxes by their colour using the chroma "
+                             "table in this '.npy' file instead of by their "
+                             "edges.")
+    parser.add_argument('--remap_table',
+                        help="Correct the coordinates of the boxes found "
+                             "with the remap table in this '.npy' file, "
+                             "made by `calibration.py build`.")
+    parser.add_argument('--goal_table',
+                        help="Look up the goals of each pick in the goal "
+                             "table in this '.npy' file, made by "
+                             "`python -m arm.ggd.goal_table build`.")
+    parser.add_argument('--kinematics', default=False, action='store_true',
+                        help="Solve the goals of each pick by inverse "
+                             "kinematics when there is no goal table.")
+    parser.add_argument('--geometry',
+                        help="The JSON file of the measured geometry of the "
+                             "arm, needed by --kinematics.")
+    parser.add_argument('--emulate', default=False, action='store_true',
+                        help="Drive emulated servos instead of the servo "
+                             "bus, and find objects in generated frames.")
+    parser.add_argument('--frames_dir',
+                        help="With --emulate, find objects in the frames "
+                             "recorded in this directory.")
+    parser.add_argument('--sensor_max_age', default=0.0, type=float,
+                        help="Answer reads of the servos' sensor registers "
+                             "from values read at most this many seconds "
+                             "ago.")
     pa = parser.parse_args()
+    if pa.kinematics and pa.geometry is None:
+        parser.error("--kinematics needs the --geometry of the arm")
     if pa.debug:
         log.setLevel(logging.DEBUG)
         logging.getLogger('servode').setLevel(logging.DEBUG)
 
+    tracker = None
+    if pa.track_find:
+        tracker = make_tracker(pa.image_width, pa.image_height)
+    change_detector = None
+    if pa.skip_static:
+        change_detector = make_change_detector(pa.image_width, pa.image_height)
+    chroma_table = None
+    if pa.chroma_table is not None:
+        chroma_table = chroma.load_table(pa.chroma_table)
+    remap_table = None
+    if pa.remap_table is not None:
+        # memory-mapped, the table is shared with the page cache
+        remap_table = calibration.load_table(pa.remap_table)
+    goals = None
+    if pa.goal_table is not None:
+        goals = goal_table.load_table(pa.goal_table)
+    geometry = None
+    if pa.kinematics:
+        geometry = kinematics.load_geometry(pa.geometry)
+
+    # start the worker before any other thread so the forked worker inherits
+    # no locks held by those threads
+    vision_worker = None
+    if pa.vision_worker:
+        vision_worker = VisionWorker(
+            width=pa.image_width, height=pa.image_height,
+            coarse_scale=pa.coarse_scale, tracker=tracker,
+            change_detector=change_detector, debug_images=pa.debug_images,
+            threshold=pa.find_threshold, chroma_table=chroma_table)
+        vision_worker.start()
+
     local_mqtt, remote_mqtt, m_shadow = initialize(
         pa.device_name, pa.config_file, pa.root_ca, pa.certificate,
         pa.private_key, pa.group_ca_path
     )
 
-    with ServoProtocol() as sp:
+    debug_image_writer = None
+    if pa.debug_images and vision_worker is None:
+        debug_image_writer = DebugImageWriter()
+        debug_image_writer.start()
+
+    # keep the end-effector camera open for the life of the arm process
+    camera = make_frame_source(pa.image_width, pa.image_height,
+                               emulate=pa.emulate, frames_dir=pa.frames_dir)
+
+    backend = None
+    if pa.emulate:
+        backend = BusEmulator(arm_servo_ids)
+
+    register_cache = RegisterCache(max_age=pa.sensor_max_age)
+    with ServoProtocol(backend=backend, cache=register_cache) as sp:
         for servo_id in arm_servo_ids:
             sp.ping(servo=servo_id)
 
@@ -538,7 +689,14 @@ if __name__ == "__main__":
         )
         act = ArmControlThread(
             sg, cmd_event, stage_topic=pa.stage_topic,
-            mqtt_client=remote_mqtt, master_shadow=m_shadow
+            mqtt_client=remote_mqtt, master_shadow=m_shadow,
+            debug_writer=debug_image_writer, frame_source=camera,
+            stream_find=pa.stream_find, tracker=tracker,
+            image_width=pa.image_width, image_height=pa.image_height,
+            coarse_scale=pa.coarse_scale, vision_worker=vision_worker,
+            change_detector=change_detector, threshold=pa.find_threshold,
+            chroma_table=chroma_table, remap_table=remap_table, goals=goals,
+            geometry=geometry
         )
         amt.start()
         act.start()
@@ -554,6 +712,13 @@ if __name__ == "__main__":
         amt.join()
         act.join()
 
+    log.info("[__main__] register cache:{0}".format(register_cache.stats()))
+    camera.close()
+    if vision_worker is not None:
+        vision_worker.close()
+    if debug_image_writer is not None:
+        debug_image_writer.close()
+
     local_mqtt.disconnect()
     remote_mqtt.disconnect()
     time.sleep(2)
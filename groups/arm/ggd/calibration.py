@@ -0,0 +1,250 @@
+#!/usr/bin/env python
+
+# Copyright 2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You may not
+# use this file except in compliance with the License. A copy of the License is
+# located at
+#     http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is distributed on
+# an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+# express or implied. See the License for the specific language governing
+# permissions and limitations under the License.
+
+"""
+Camera calibration of the coordinates of the objects found by the arm.
+
+A remap table holds, for every pixel of a frame, the corrected coordinates of
+that pixel in the calibration frame the goal calculations were tuned with. The
+table is computed once by removing the radial distortion of the end-effector
+camera's lens and then mapping the undistorted pixels onto the workspace with a
+homography, fitted to marks whose positions are known. It is saved as a '.npy'
+file and memory-mapped when the arm starts, so the coordinates of each
+detection are corrected with a single table lookup.
+
+Coordinates follow the `ImageProcessor`: x counts right from the left column
+and y counts up from the bottom row. The table itself is stored in image order,
+one row of (x, y) pairs per row of the frame from the top row down.
+
+This command-line has two commands:
+* `build` - compute a remap table from lens parameters and, optionally, a file
+    of calibration marks
+* `lookup` - print the corrected coordinates of a pixel
+
+A marks file is a JSON file of the frame and workspace coordinates of at least
+four marks, where the workspace coordinates are given in the calibration
+frame:
+    { "marks": [ [frame_x, frame_y, workspace_x, workspace_y], ... ] }
+
+To learn more about the command line type: `python calibration.py --help`
+"""
+from __future__ import print_function
+
+import json
+import argparse
+import numpy as np
+
+CALIBRATION_WIDTH = 96  # frame width the goal calculations were tuned with
+CALIBRATION_HEIGHT = 96  # frame height the goal calculations were tuned with
+UNDISTORT_ITERATIONS = 10
+
+
+def undistort(x, y, width, height, k1=0.0, k2=0.0, focal=None):
+    """
+    Remove the radial distortion of the lens from pixel coordinates.
+
+    :param x: the x of the distorted pixels, counted right from the left column
+    :param y: the y of the distorted pixels, counted down from the top row
+    :param width: the width of the frame
+    :param height: the height of the frame
+    :param k1: the second order radial distortion coefficient, negative for
+        barrel distortion
+    :param k2: the fourth order radial distortion coefficient
+    :param focal: the focal length of the lens in pixels of the frame
+        [default: None, the width of the frame]
+    :return: the undistorted x, y as float arrays
+    """
+    if focal is None:
+        focal = float(width)
+    cx = (width - 1) / 2.0
+    cy = (height - 1) / 2.0
+    xd = (np.asarray(x, dtype=np.float64) - cx) / focal
+    yd = (np.asarray(y, dtype=np.float64) - cy) / focal
+    # the distortion has no closed form inverse, so iterate towards it
+    xu, yu = xd, yd
+    for _ in range(UNDISTORT_ITERATIONS):
+        r2 = xu * xu + yu * yu
+        scale = 1.0 + k1 * r2 + k2 * r2 * r2
+        xu = xd / scale
+        yu = yd / scale
+    return xu * focal + cx, yu * focal + cy
+
+
+def fit_homography(src, dst):
+    """
+    Fit the homography mapping points onto other points by least squares.
+
+    :param src: an (n, 2) array of points, n >= 4
+    :param dst: an (n, 2) array of the points they map to
+    :return: a 3 x 3 homography
+    """
+    src = np.asarray(src, dtype=np.float64)
+    dst = np.asarray(dst, dtype=np.float64)
+    if len(src) < 4 or src.shape != dst.shape:
+        raise ValueError("A homography needs at least four pairs of points.")
+    rows = []
+    for (x, y), (u, v) in zip(src, dst):
+        rows.append([x, y, 1, 0, 0, 0, -u * x, -u * y, -u])
+        rows.append([0, 0, 0, x, y, 1, -v * x, -v * y, -v])
+    # the homography is the right singular vector of the smallest value
+    _, _, vt = np.linalg.svd(np.asarray(rows))
+    h = vt[-1].reshape(3, 3)
+    return h / h[2, 2]
+
+
+def apply_homography(h, x, y):
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    w = h[2, 0] * x + h[2, 1] * y + h[2, 2]
+    return ((h[0, 0] * x + h[0, 1] * y + h[0, 2]) / w,
+            (h[1, 0] * x + h[1, 1] * y + h[1, 2]) / w)
+
+
+def scale_homography(width, height):
+    """
+    The homography that scales a frame of the given size to the calibration
+    frame, the mapping used when there are no calibration marks.
+    """
+    return np.array([[float(CALIBRATION_WIDTH) / width, 0, 0],
+                     [0, float(CALIBRATION_HEIGHT) / height, 0],
+                     [0, 0, 1]])
+
+
+def build_table(width, height, k1=0.0, k2=0.0, focal=None, marks=None):
+    """
+    Compute the remap table of frames of the given size.
+
+    :param width: the width of the frames
+    :param height: the height of the frames
+    :param k1: see `undistort`
+    :param k2: see `undistort`
+    :param focal: see `undistort`
+    :param marks: a list of [frame_x, frame_y, workspace_x, workspace_y] of
+        four or more calibration marks, with y counted up from the bottom row
+        [default: None, scale the undistorted frame to the calibration frame]
+    :return: a (height, width, 2) float32 array holding the corrected (x, y) of
+        each pixel, with y counted up
+    """
+    rows, cols = np.mgrid[0:height, 0:width]
+    # a pixel on image row r has a y of height - r, as in `coord_y`
+    x, y = undistort(cols, rows, width, height, k1, k2, focal)
+    y = height - y
+    if marks is None:
+        h = scale_homography(width, height)
+    else:
+        marks = np.asarray(marks, dtype=np.float64)
+        mark_x, mark_y = undistort(marks[:, 0], height - marks[:, 1], width,
+                                   height, k1, k2, focal)
+        h = fit_homography(np.column_stack([mark_x, height - mark_y]),
+                           marks[:, 2:4])
+    table = np.empty((height, width, 2), dtype=np.float32)
+    table[:, :, 0], table[:, :, 1] = apply_homography(h, x, y)
+    return table
+
+
+def save_table(filename, table):
+    np.save(filename, np.asarray(table, dtype=np.float32))
+
+
+def load_table(filename):
+    """
+    Memory-map a remap table saved by `save_table`, so only the pages that are
+    looked up are read from disk.
+
+    :return: the read-only remap table
+    """
+    table = np.load(filename, mmap_mode='r')
+    if table.ndim != 3 or table.shape[2] != 2:
+        raise ValueError("Remap table:{0} has shape {1} not (h, w, 2)".format(
+            filename, table.shape))
+    return table
+
+
+def remap(table, x, y):
+    """
+    Correct the coordinates of an object found in a frame.
+
+    :param table: the remap table of the frame size
+    :param x: the x of the object, counted right from the left column
+    :param y: the y of the object, counted up from the bottom row as in
+        `coord_y`
+    :return: the corrected x, y in the calibration frame
+    """
+    height, width = table.shape[:2]
+    row = min(max(int(height - y), 0), height - 1)
+    col = min(max(int(x), 0), width - 1)
+    corrected = table[row, col]
+    return float(corrected[0]), float(corrected[1])
+
+
+def _build(cli):
+    marks = None
+    if cli.marks is not None:
+        with open(cli.marks) as f:
+            marks = json.load(f)['marks']
+    table = build_table(cli.width, cli.height, k1=cli.k1, k2=cli.k2,
+                        focal=cli.focal, marks=marks)
+    save_table(cli.table_file, table)
+    print("wrote {0}x{1} remap table to:{2}".format(
+        cli.width, cli.height, cli.table_file))
+
+
+def _lookup(cli):
+    table = load_table(cli.table_file)
+    print("x:{0:.2f} y:{1:.2f}".format(*remap(table, cli.x, cli.y)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Calibrate the coordinates of the boxes found by the arm',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    subparsers = parser.add_subparsers()
+
+    build_parser = subparsers.add_parser(
+        'build',
+        description='Compute a remap table and save it.',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    build_parser.add_argument('table_file',
+                              help="The '.npy' file to write the table to.")
+    build_parser.add_argument('--width', default=96, type=int,
+                              help="The width of the frames.")
+    build_parser.add_argument('--height', default=96, type=int,
+                              help="The height of the frames.")
+    build_parser.add_argument('--k1', default=0.0, type=float,
+                              help="Second order radial distortion of the "
+                                   "lens, negative for barrel distortion.")
+    build_parser.add_argument('--k2', default=0.0, type=float,
+                              help="Fourth order radial distortion of the "
+                                   "lens.")
+    build_parser.add_argument('--focal', type=float,
+                              help="Focal length of the lens in pixels. "
+                                   "[default: the width of the frames]")
+    build_parser.add_argument('--marks',
+                              help="A JSON file of calibration marks. "
+                                   "[default: scale to the calibration "
+                                   "frame]")
+    build_parser.set_defaults(func=_build)
+
+    lookup_parser = subparsers.add_parser(
+        'lookup',
+        description='Print the corrected coordinates of a pixel.',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    lookup_parser.add_argument('table_file',
+                               help="The '.npy' file of the table.")
+    lookup_parser.add_argument('x', type=int, help="The x of the pixel.")
+    lookup_parser.add_argument('y', type=int, help="The y of the pixel.")
+    lookup_parser.set_defaults(func=_lookup)
+
+    args = parser.parse_args()
+    args.func(args)
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+
+# Copyright 2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You may not
+# use this file except in compliance with the License. A copy of the License is
+# located at
+#     http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is distributed on
+# an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+# express or implied. See the License for the specific language governing
+# permissions and limitations under the License.
+
+"""
+Frame differencing to skip finding objects in a static, empty scene.
+
+Each frame's luminance is compared with a running average of the previous
+frames. While the belt is empty, frames hardly differ from that background,
+so the `ImageProcessor` can skip the edge and label stages and report no
+object. A frame is processed whenever enough of its pixels have changed or an
+object was found in the last processed frame.
+
+Skipped frames slowly update the background to follow changes in lighting. A
+processed frame in which nothing was found is known to show the empty scene and
+updates the background quickly, so the background recovers soon after a box
+has been removed.
+
+The frames skipped and processed are counted so idle savings can be reported.
+"""
+import logging
+import numpy as np
+
+log = logging.getLogger('change_detector')
+log.addHandler(logging.NullHandler())
+
+
+class ChangeDetector(object):
+    """
+    Detector of changes between a frame and a running background model.
+    """
+
+    def __init__(self, min_size=200, pixel_threshold=12, min_changed=0.01,
+                 learning_rate=0.05, empty_learning_rate=0.25):
+        """
+
+        :param min_size: a processed frame whose largest object has this many
+            pixels or fewer found nothing
+        :param pixel_threshold: the luminance difference from the background
+            at which a pixel has changed
+        :param min_changed: the fraction of pixels that must change for a frame
+            to be processed
+        :param learning_rate: the weight of a skipped frame, or of a frame in
+            which an object was found, in the background
+        :param empty_learning_rate: the weight of a processed frame in which
+            nothing was found in the background
+        """
+        super(ChangeDetector, self).__init__()
+        self.min_size = min_size
+        self.pixel_threshold = pixel_threshold
+        self.min_changed = min_changed
+        self.learning_rate = learning_rate
+        self.empty_learning_rate = empty_learning_rate
+        self.background = None
+        self._frame = None
+        self.found = True  # nothing is known until a frame is processed
+        self.changed_pixels = 0
+        self.processed = 0
+        self.skipped = 0
+
+    def should_process(self, luma):
+        """
+        Compare a frame with the background.
+
+        :param luma: the luminance plane of the frame
+        :return: True if the frame must be processed, False if it can be
+            skipped
+        """
+        frame = np.asarray(luma, dtype=np.float32)
+        if self.background is None or self.background.shape != frame.shape:
+            self.background = frame.copy()
+            self.changed_pixels = frame.size
+        else:
+            self.changed_pixels = int(np.count_nonzero(
+                np.abs(frame - self.background) > self.pixel_threshold))
+
+        if (not self.found and
+                self.changed_pixels < self.min_changed * frame.size):
+            self._learn(frame, self.learning_rate)
+            self.skipped += 1
+            return False
+        self._frame = frame
+        self.processed += 1
+        return True
+
+    def record(self, max_pixel_count):
+        """
+        Record the size of the largest object found in the frame just
+        processed.
+        """
+        self.found = max_pixel_count > self.min_size
+        if self._frame is not None:
+            rate = self.learning_rate
+            if not self.found:
+                rate = self.empty_learning_rate
+            self._learn(self._frame, rate)
+            self._frame = None
+
+    def _learn(self, frame, rate):
+        # move the background towards the frame
+        self.background += rate * (frame - self.background)
+
+    def reset(self):
+        self.background = None
+        self._frame = None
+        self.found = True
+
+    def counters(self):
+        return {
+            'frames_processed': self.processed,
+            'frames_skipped': self.skipped
+        }
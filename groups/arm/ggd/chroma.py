@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+
+# Copyright 2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You may not
+# use this file except in compliance with the License. A copy of the License is
+# located at
+#     http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is distributed on
+# an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+# express or implied. See the License for the specific language governing
+# permissions and limitations under the License.
+
+"""
+Segmentation of boxes by their colour using the U and V planes of a frame.
+
+A chroma table is a 256 x 256 boolean array indexed by the U and V values of a
+pixel, which is True where that colour is the colour of a box. The table is
+built once, from the expected box colour or from sample pixels of boxes, and
+saved as a '.npy' file. Each frame is then segmented with one table lookup per
+chroma pixel instead of the edge pipeline. Colour changes little with lighting
+and the grey belt has no colour, so the table separates boxes from the belt
+under most lighting and regardless of the belt's texture.
+
+The U and V planes of a YUV420 frame are half the width and height of its
+luminance plane, so a segmented mask is half the size of the frame.
+
+This command-line has two commands:
+* `build` - build a table of the colours within an ellipse around a U, V
+* `sample` - build a table from the colours of a region of recorded frames
+
+To learn more about the command line type: `python chroma.py --help`
+"""
+from __future__ import print_function
+
+import argparse
+import numpy as np
+
+WHITE = 255
+BLACK = 0
+BOX_U = 108  # U of the brown cardboard boxes
+BOX_V = 150  # V of the brown cardboard boxes
+
+
+def ellipse_table(u, v, radius_u=16, radius_v=None):
+    """
+    Build a chroma table of the colours within an ellipse around a colour.
+
+    :param u: the U of the centre of the ellipse
+    :param v: the V of the centre of the ellipse
+    :param radius_u: the radius of the ellipse along U
+    :param radius_v: the radius of the ellipse along V [default: radius_u]
+    :return: the chroma table
+    """
+    if radius_v is None:
+        radius_v = radius_u
+    us, vs = np.mgrid[0:256, 0:256].astype(np.float64)
+    return (((us - u) / radius_u) ** 2 + ((vs - v) / radius_v) ** 2) <= 1.0
+
+
+def sample_table(u, v, radius=4, min_count=1):
+    """
+    Build a chroma table of the colours of sample pixels and of the colours
+    near them.
+
+    :param u: the U values of the sample pixels
+    :param v: the V values of the sample pixels
+    :param radius: the distance from a sampled colour still in the table
+    :param min_count: the samples of a colour needed for it to be in the table
+    :return: the chroma table
+    """
+    u = np.asarray(u, dtype=np.uint8).ravel()
+    v = np.asarray(v, dtype=np.uint8).ravel()
+    counts = np.bincount(u.astype(np.int32) * 256 + v, minlength=256 * 256)
+    sampled = counts.reshape(256, 256) >= min_count
+
+    padded = np.zeros((256 + 2 * radius, 256 + 2 * radius), dtype=bool)
+    padded[radius:-radius or None, radius:-radius or None] = sampled
+    table = np.zeros((256, 256), dtype=bool)
+    for du in range(-radius, radius + 1):
+        for dv in range(-radius, radius + 1):
+            if du * du + dv * dv <= radius * radius:
+                table |= padded[radius + du:radius + du + 256,
+                                radius + dv:radius + dv + 256]
+    return table
+
+
+def save_table(filename, table):
+    np.save(filename, np.asarray(table, dtype=bool))
+
+
+def load_table(filename):
+    """
+    Load a chroma table saved by `save_table`.
+
+    :return: the chroma table
+    """
+    table = np.load(filename)
+    if table.shape != (256, 256):
+        raise ValueError("Chroma table:{0} is {1} not (256, 256)".format(
+            filename, table.shape))
+    return table.astype(bool)
+
+
+def segment(table, u, v):
+    """
+    Segment the pixels of a frame by their colour.
+
+    :param table: the chroma table
+    :param u: the U plane of the frame
+    :param v: the V plane of the frame
+    :return: the mask of the U, V planes, WHITE where the colour is in the
+        table and BLACK elsewhere
+    """
+    return np.where(table[u, v], WHITE, BLACK).astype(np.uint8)
+
+
+def _build(cli):
+    table = ellipse_table(cli.u, cli.v, cli.radius_u, cli.radius_v)
+    save_table(cli.table_file, table)
+    print("wrote table of {0} colours to:{1}".format(
+        np.count_nonzero(table), cli.table_file))
+
+
+def _sample(cli):
+    from frame_source import DirectorySource
+    source = DirectorySource(cli.frames_dir, width=cli.width,
+                             height=cli.height)
+    x0, y0, x1, y1 = cli.region
+    us = []
+    vs = []
+    for _ in range(len(source)):
+        source.capture()
+        u, v = source.chroma()
+        # the region is given in frame pixels and the planes are half size
+        us.append(u[y0 // 2:y1 // 2, x0 // 2:x1 // 2])
+        vs.append(v[y0 // 2:y1 // 2, x0 // 2:x1 // 2])
+    table = sample_table(np.concatenate([a.ravel() for a in us]),
+                         np.concatenate([a.ravel() for a in vs]),
+                         radius=cli.radius, min_count=cli.min_count)
+    save_table(cli.table_file, table)
+    print("wrote table of {0} colours to:{1}".format(
+        np.count_nonzero(table), cli.table_file))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Build the chroma table used to segment boxes by colour',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    subparsers = parser.add_subparsers()
+
+    build_parser = subparsers.add_parser(
+        'build',
+        description='Build a table of the colours around a U, V.',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    build_parser.add_argument('table_file',
+                              help="The '.npy' file to write the table to.")
+    build_parser.add_argument('--u', default=BOX_U, type=int,
+                              help="The U of the box colour.")
+    build_parser.add_argument('--v', default=BOX_V, type=int,
+                              help="The V of the box colour.")
+    build_parser.add_argument('--radius_u', default=16, type=float,
+                              help="How far U may be from the box colour.")
+    build_parser.add_argument('--radius_v', type=float,
+                              help="How far V may be from the box colour. "
+                                   "[default: radius_u]")
+    build_parser.set_defaults(func=_build)
+
+    sample_parser = subparsers.add_parser(
+        'sample',
+        description='Build a table from the colours of a box in recorded '
+                    'frames.',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    sample_parser.add_argument('table_file',
+                               help="The '.npy' file to write the table to.")
+    sample_parser.add_argument('frames_dir',
+                               help="The directory of recorded frames.")
+    sample_parser.add_argument('--region', nargs=4, type=int, required=True,
+                               metavar=('X0', 'Y0', 'X1', 'Y1'),
+                               help="The region of the frames covered by a "
+                                    "box, X1 and Y1 excluded.")
+    sample_parser.add_argument('--width', default=96, type=int,
+                               help="The width of the frames.")
+    sample_parser.add_argument('--height', default=96, type=int,
+                               help="The height of the frames.")
+    sample_parser.add_argument('--radius', default=4, type=int,
+                               help="How far a colour may be from a sampled "
+                                    "colour.")
+    sample_parser.add_argument('--min_count', default=1, type=int,
+                               help="Samples of a colour needed to keep it.")
+    sample_parser.set_defaults(func=_sample)
+
+    args = parser.parse_args()
+    args.func(args)
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+
+# Copyright 2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You may not
+# use this file except in compliance with the License. A copy of the License is
+# located at
+#     http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is distributed on
+# an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+# express or implied. See the License for the specific language governing
+# permissions and limitations under the License.
+
+"""
+Asynchronous writer of the debug images produced by the `ImageProcessor`.
+
+Images are copied onto a bounded queue and encoded as PNG files by a background
+thread, so the arm never waits on PNG encoding or SD card writes while finding
+objects. When the queue is full new images are dropped and counted instead.
+"""
+import os
+import logging
+import threading
+try:
+    import queue as Queue
+except ImportError:
+    import Queue
+import numpy as np
+import png
+
+log = logging.getLogger('debug_images')
+log.addHandler(logging.NullHandler())
+
+_STOP = object()
+
+
+class DebugImageWriter(threading.Thread):
+    """
+    Thread that writes greyscale debug images to PNG files.
+    """
+
+    def __init__(self, directory='img', max_queued=12):
+        """
+
+        :param directory: the directory into which the PNG files are written
+        :param max_queued: the number of images waiting to be written before
+            further images are dropped
+        """
+        super(DebugImageWriter, self).__init__(name="debug_image_writer")
+        self.daemon = True
+        self.directory = directory
+        self.queue = Queue.Queue(maxsize=max_queued)
+        self.written = 0
+        self.dropped = 0
+
+    def submit(self, filename, rows):
+        """
+        Queue an image to be written without blocking the caller.
+
+        :param filename: the name of the PNG file within the writer's directory
+        :param rows: the greyscale image as a 2D array or a list of rows. The
+            image is copied so the caller may reuse it immediately.
+        :return: the path the image will be written to, or None if the image
+            was dropped
+        """
+        name = os.path.join(self.directory, filename)
+        try:
+            self.queue.put_nowait((name, np.array(rows, dtype=np.uint8)))
+        except Queue.Full:
+            self.dropped += 1
+            log.debug("[submit] queue full, dropped:{0}".format(name))
+            return None
+        return name
+
+    def close(self):
+        """
+        Write the images already queued and stop the writer thread.
+        """
+        self.queue.put(_STOP)
+        self.join()
+        log.info("[close] written:{0} dropped:{1}".format(
+            self.written, self.dropped))
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is _STOP:
+                break
+            name, image = item
+            try:
+                with open(name, 'wb') as f:
+                    w = png.Writer(image.shape[1], image.shape[0],
+                                   greyscale=True)
+                    w.write(f, image)
+                self.written += 1
+            except IOError as ioe:
+                log.error("[run] could not write:{0} error:{1}".format(
+                    name, ioe))
@@ -0,0 +1,270 @@
+#!/usr/bin/env python
+
+# Copyright 2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You may not
+# use this file except in compliance with the License. A copy of the License is
+# located at
+#     http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is distributed on
+# an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+# express or implied. See the License for the specific language governing
+# permissions and limitations under the License.
+
+"""
+Edge detection engines used by the `ImageProcessor`.
+
+Each engine implements the same pipeline over a luminance image:
+* `horizontal` - absolute difference of each pixel and its right neighbour
+* `vertical` - absolute difference of each pixel and its lower neighbour
+* `fuse` - hypotenuse of the horizontal and vertical edges, clamped to 255
+* `black_and_white` - 255 where the fused edge meets the threshold, else 0
+* `spread` - grow the white pixels so nearby edges touch
+
+The `PythonEngine` is the original nested-loop implementation operating on
+lists of rows and is kept as the reference. The `NumpyEngine` computes the same
+pipeline with array operations and produces bit-identical results.
+
+The threshold used by `black_and_white` is either the fixed `EDGE_THRESHOLD` or
+is computed once per frame from the histogram of the fused edges, see
+`frame_threshold`, so the binarization follows the lighting of the scene.
+"""
+import math
+import numpy as np
+
+EDGE_THRESHOLD = 18  # fused edge value at which a pixel is considered white
+THRESHOLD_FLOOR = 12  # lowest threshold an adaptive method may choose
+EDGE_PERCENTILE = 98.8  # percentile of fused edges below the threshold
+THRESHOLDS = ('fixed', 'otsu', 'percentile')
+WHITE = 255
+BLACK = 0
+
+
+def _new_rows(width, height):
+    rows = []
+    for _ in range(height):
+        rows.append([0] * width)
+    return rows
+
+
+def difference(a, b):
+    if a >= b:
+        return a - b
+    else:
+        return b - a
+
+
+def fusion(a, b):
+    a_ = int(a)
+    b_ = int(b)
+    tmp = round(math.sqrt(a_ * a_ + b_ * b_))
+    if tmp <= 255:
+        return int(tmp)
+    else:
+        return 255
+
+
+def neighbors(xy, max_x, max_y):
+    n_list = []
+    xx, yy = xy
+    for y_ in range(-1, 2, 1):
+        for x_ in range(-1, 2, 1):
+            res_x = xx + x_
+            res_y = yy + y_
+            if max_x > res_x >= 0 and max_y > res_y >= 0:
+                n_list.append((res_x, res_y))
+    return n_list
+
+
+def otsu_threshold(edges, floor=THRESHOLD_FLOOR):
+    """
+    Otsu's threshold of a fused edge image, which best separates the histogram
+    of edge values into a background and an edge class.
+
+    :param edges: the fused edges as a 2D array-like of values from 0 to 255
+    :param floor: the lowest threshold returned
+    :return: the threshold, edges at or above it are white
+    """
+    hist = np.bincount(np.asarray(edges, dtype=np.uint8).ravel(),
+                       minlength=256).astype(np.float64)
+    p = hist / hist.sum()
+    omega = np.cumsum(p)  # weight of the classes at or below each value
+    mu = np.cumsum(p * np.arange(256))
+    mu_total = mu[-1]
+    denominator = omega * (1.0 - omega)
+    denominator[denominator == 0] = np.inf
+    between = (mu_total * omega - mu) ** 2 / denominator
+    return max(int(np.argmax(between)) + 1, floor)
+
+
+def percentile_threshold(edges, percentile=EDGE_PERCENTILE,
+                         floor=THRESHOLD_FLOOR):
+    """
+    The threshold that makes white the edges above a percentile of all edges.
+
+    :param edges: the fused edges as a 2D array-like of values from 0 to 255
+    :param percentile: the percentile of edges that stay black
+    :param floor: the lowest threshold returned
+    :return: the threshold, edges at or above it are white
+    """
+    hist = np.bincount(np.asarray(edges, dtype=np.uint8).ravel(),
+                       minlength=256)
+    below = np.cumsum(hist)
+    value = int(np.searchsorted(below, below[-1] * percentile / 100.0))
+    return max(value + 1, floor)
+
+
+def frame_threshold(edges, method='fixed'):
+    """
+    The threshold to make a frame's fused edges black and white.
+
+    :param edges: the fused edges as a 2D array-like of values from 0 to 255
+    :param method: 'fixed' for `EDGE_THRESHOLD`, 'otsu' or 'percentile'
+    :return: the threshold, edges at or above it are white
+    """
+    if method == 'fixed':
+        return EDGE_THRESHOLD
+    if method == 'otsu':
+        return otsu_threshold(edges)
+    if method == 'percentile':
+        return percentile_threshold(edges)
+    raise ValueError("Unknown threshold method:{0}".format(method))
+
+
+class PythonEngine(object):
+    """
+    The reference edge pipeline using pure-Python loops over lists of rows.
+    """
+    name = 'python'
+
+    def horizontal(self, raw_rows):
+        height = len(raw_rows)
+        width = len(raw_rows[0])
+        rows = _new_rows(width, height)
+        for j in range(height):
+            for i in range(width):
+                if i + 1 <= width - 1:
+                    rows[j][i] = difference(raw_rows[j][i],
+                                            raw_rows[j][i + 1])
+                else:
+                    rows[j][i] = difference(raw_rows[j][i],
+                                            raw_rows[j][i - 1])
+        return rows
+
+    def vertical(self, raw_rows):
+        height = len(raw_rows)
+        width = len(raw_rows[0])
+        rows = _new_rows(width, height)
+        for j in range(height):
+            for i in range(width):
+                if j + 1 <= height - 1:
+                    rows[j][i] = difference(raw_rows[j][i],
+                                            raw_rows[j + 1][i])
+                else:
+                    rows[j][i] = difference(raw_rows[j][i],
+                                            raw_rows[j - 1][i])
+        return rows
+
+    def fuse(self, hrows, vrows):
+        height = len(hrows)
+        width = len(hrows[0])
+        rows = _new_rows(width, height)
+        for j in range(height):
+            for i in range(width):
+                rows[j][i] = fusion(hrows[j][i], vrows[j][i])
+        return rows
+
+    def black_and_white(self, edge_rows, threshold=EDGE_THRESHOLD):
+        height = len(edge_rows)
+        width = len(edge_rows[0])
+        rows = _new_rows(width, height)
+        for j in range(height):
+            for i in range(width):
+                if edge_rows[j][i] >= threshold:
+                    rows[j][i] = WHITE
+                else:
+                    rows[j][i] = BLACK
+        return rows
+
+    def spread(self, bw_rows):
+        height = len(bw_rows)
+        width = len(bw_rows[0])
+        rows = _new_rows(width, height)
+        for j in range(height):
+            for i in range(width):
+                if bw_rows[j][i] == WHITE:
+                    for tmp_x, tmp_y in neighbors((i, j), width, height):
+                        rows[tmp_y][tmp_x] = WHITE
+                else:
+                    rows[j][i] = BLACK
+        return rows
+
+
+class NumpyEngine(object):
+    """
+    The edge pipeline computed with NumPy array operations on a 2D luminance
+    array.
+    """
+    name = 'numpy'
+
+    def horizontal(self, luma):
+        luma = np.asarray(luma, dtype=np.int16)
+        rows = np.empty(luma.shape, dtype=np.uint8)
+        rows[:, :-1] = np.abs(luma[:, :-1] - luma[:, 1:])
+        rows[:, -1] = rows[:, -2]
+        return rows
+
+    def vertical(self, luma):
+        luma = np.asarray(luma, dtype=np.int16)
+        rows = np.empty(luma.shape, dtype=np.uint8)
+        rows[:-1, :] = np.abs(luma[:-1, :] - luma[1:, :])
+        rows[-1, :] = rows[-2, :]
+        return rows
+
+    def fuse(self, h_edges, v_edges):
+        h = h_edges.astype(np.int32)
+        v = v_edges.astype(np.int32)
+        # the square root of an integer is never exactly x.5, so adding one
+        # half and truncating rounds the same way Python's `round` does
+        fused = np.floor(np.sqrt(h * h + v * v) + 0.5)
+        return np.minimum(fused, 255).astype(np.uint8)
+
+    def black_and_white(self, edges, threshold=EDGE_THRESHOLD):
+        return np.where(edges >= threshold, WHITE, BLACK).astype(np.uint8)
+
+    def spread(self, bw):
+        """
+        Spread each white pixel into its neighbours exactly as the reference
+        loop does. That loop visits pixels in row order and writes black over
+        any pixel that is itself black, which undoes the spread from the
+        neighbours already visited. So a pixel ends up white only when it, its
+        right neighbour or one of its three lower neighbours is white.
+        """
+        white = bw == WHITE
+        padded = np.zeros((white.shape[0] + 1, white.shape[1] + 2), dtype=bool)
+        padded[:-1, 1:-1] = white
+        spread = white.copy()
+        spread |= padded[:-1, 2:]   # right
+        spread |= padded[1:, :-2]   # lower left
+        spread |= padded[1:, 1:-1]  # lower
+        spread |= padded[1:, 2:]    # lower right
+        return np.where(spread, WHITE, BLACK).astype(np.uint8)
+
+
+ENGINES = {
+    PythonEngine.name: PythonEngine,
+    NumpyEngine.name: NumpyEngine
+}
+
+
+def get_engine(name):
+    """
+    Get an edge engine instance by name.
+
+    :param name: 'numpy' or 'python'
+    :return: the edge engine
+    """
+    if name not in ENGINES:
+        raise ValueError("Unknown edge engine:{0}".format(name))
+    return ENGINES[name]()
@@ -0,0 +1,502 @@
+#!/usr/bin/env python
+
+# Copyright 2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You may not
+# use this file except in compliance with the License. A copy of the License is
+# located at
+#     http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is distributed on
+# an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+# express or implied. See the License for the specific language governing
+# permissions and limitations under the License.
+
+"""
+Sources of the frames processed by the `ImageProcessor`.
+
+Every source delivers the luminance plane of each frame as a 2D uint8 array,
+oriented the way the `ImageProcessor` expects to see it. The U and V planes of
+the last frame, at half the width and height of the frame, are given by
+`chroma()` for segmenting boxes by their colour.
+
+* `PiCameraSource` - the live end-effector camera
+* `DirectorySource` - a directory of recorded PNG or raw YUV frames
+* `SyntheticSource` - generated scenes of boxes on a belt
+
+A `PiCameraSource` keeps the end-effector camera open for the life of the arm
+process so a find attempt does not pay for camera start-up and warm-up. Every
+capture is written into the same YUV buffer and the luminance and chroma planes
+are exposed as flipped NumPy views of that buffer, so no pixel is copied.
+Frames can be captured one at a time or streamed continuously from the camera's
+video port.
+
+The recorded and synthetic sources need no camera, so the vision pipeline can
+be run and benchmarked headless.
+"""
+import os
+import logging
+import numpy as np
+import png
+
+try:
+    import picamera
+except ImportError:
+    picamera = None
+
+log = logging.getLogger('frame_source')
+log.addHandler(logging.NullHandler())
+
+
+def _frame_size(width, height):
+    # the camera pads YUV frames to a width multiple of 32 and a height
+    # multiple of 16
+    return (width + 31) // 32 * 32, (height + 15) // 16 * 16
+
+
+def _yuv_planes(data, width, height):
+    # the Y, U and V planes of a padded YUV420 frame, cropped to the captured
+    # frame and flipped horizontally and vertically
+    frame_width, frame_height = _frame_size(width, height)
+    size = frame_width * frame_height
+    y_plane = data[:size].reshape(frame_height, frame_width)[:height, :width]
+    chroma_shape = (frame_height // 2, frame_width // 2)
+    chroma_size = size // 4
+    u_plane = data[size:size + chroma_size].reshape(chroma_shape)
+    v_plane = data[size + chroma_size:size + 2 * chroma_size].reshape(
+        chroma_shape)
+    chroma_height, chroma_width = chroma_size_of(width, height)
+    return (y_plane[::-1, ::-1],
+            u_plane[:chroma_height, :chroma_width][::-1, ::-1],
+            v_plane[:chroma_height, :chroma_width][::-1, ::-1])
+
+
+def chroma_size_of(width, height):
+    """
+    The size of the U and V planes of a frame.
+
+    :return: the (height, width) of each chroma plane
+    """
+    return (height + 1) // 2, (width + 1) // 2
+
+
+def subsample(plane):
+    """
+    Halve the width and height of a full size plane, as the camera does to the
+    U and V planes of a YUV420 frame.
+
+    :param plane: a (height, width) array
+    :return: a uint8 array of the mean of each 2 x 2 block of the plane
+    """
+    height, width = plane.shape
+    if height % 2 or width % 2:
+        plane = np.pad(plane, ((0, height % 2), (0, width % 2)), 'edge')
+    blocks = plane.reshape(plane.shape[0] // 2, 2, plane.shape[1] // 2, 2)
+    return np.clip(np.round(blocks.mean(axis=(1, 3))), 0, 255).astype(
+        np.uint8)
+
+
+class FrameSource(object):
+    """
+    The frame source interface used by the `ImageProcessor`.
+    """
+
+    def __init__(self, width, height):
+        super(FrameSource, self).__init__()
+        self.width = width
+        self.height = height
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def capture(self):
+        """
+        Capture one frame.
+
+        :return: the luminance plane of the frame as a (height, width) array
+        """
+        raise NotImplementedError("capture() not implemented.")
+
+    def chroma(self):
+        """
+        The chroma of the last frame captured.
+
+        :return: the U and V planes of the frame, each an array of the size
+            given by `chroma_size_of`
+        """
+        raise NotImplementedError("chroma() not implemented.")
+
+    def frames(self):
+        """
+        Deliver frames continuously.
+
+        :return: a generator yielding the luminance plane of each frame
+        """
+        while True:
+            yield self.capture()
+
+    def close(self):
+        pass
+
+
+class PiCameraSource(FrameSource):
+    """
+    A long-lived PiCamera capturing YUV frames into a reused buffer.
+    """
+
+    def __init__(self, width=96, height=96, use_video_port=False):
+        """
+
+        :param width: the width of the captured frames
+        :param height: the height of the captured frames
+        :param use_video_port: capture through the faster video port instead of
+            the still port. [default: False]
+        """
+        super(PiCameraSource, self).__init__(width, height)
+        if picamera is None:
+            raise EnvironmentError("picamera is required by PiCameraSource.")
+
+        self.use_video_port = use_video_port
+        self.camera = picamera.PiCamera(resolution=(width, height))
+        self.camera.hflip = True
+        self.camera.vflip = True
+
+        frame_width, frame_height = _frame_size(width, height)
+        self._buffer = np.empty(frame_width * frame_height * 3 // 2,
+                                dtype=np.uint8)
+        # flipped views of each plane of the buffer
+        self.luma, self.u, self.v = _yuv_planes(self._buffer, width, height)
+        log.info("[PiCameraSource.__init__] resolution:{0}x{1}".format(
+            width, height))
+
+    def capture(self):
+        """
+        Capture a frame into the source's buffer.
+
+        :return: the flipped luminance plane of the frame. This is a view of
+            the buffer, so it is overwritten by the next capture.
+        """
+        self.camera.capture(self._buffer, 'yuv',
+                            use_video_port=self.use_video_port)
+        self.camera._set_led(True)
+        return self.luma
+
+    def chroma(self):
+        """
+        The chroma of the last frame captured.
+
+        :return: the flipped U and V planes of the frame. These are views of
+            the buffer, so they are overwritten by the next capture.
+        """
+        return self.u, self.v
+
+    def frames(self):
+        """
+        Stream frames continuously from the camera's video port into the
+        source's buffer.
+
+        :return: a generator yielding the flipped luminance plane of each frame
+            as it arrives. Close the generator to stop streaming.
+        """
+        self.camera._set_led(True)
+        for _ in self.camera.capture_continuous(
+                self._buffer, 'yuv', use_video_port=True):
+            yield self.luma
+
+    def close(self):
+        log.info("[PiCameraSource.close] closing camera")
+        self.camera.close()
+
+
+def read_png(filename, chroma=False):
+    """
+    Read a PNG file as a luminance array. Colour images are converted using the
+    same weights the camera uses for its YUV planes.
+
+    :param filename: the PNG file to read
+    :param chroma: also return the U and V planes of the image. The planes of
+        a greyscale image hold no colour. [default: False]
+    :return: a (height, width) uint8 array, or the luminance, U and V arrays
+        if chroma is True
+    """
+    width, height, rows, info = png.Reader(filename=filename).asDirect()
+    planes = info['planes']
+    pixels = np.vstack([np.asarray(row, dtype=np.float64) for row in rows])
+    pixels = pixels.reshape(height, width, planes)
+    if info['bitdepth'] != 8:
+        pixels *= 255.0 / (2 ** info['bitdepth'] - 1)
+    if planes >= 3:
+        red, green, blue = pixels[:, :, 0], pixels[:, :, 1], pixels[:, :, 2]
+        luma = 0.299 * red + 0.587 * green + 0.114 * blue
+    else:
+        luma = pixels[:, :, 0]
+    luma = np.clip(np.round(luma), 0, 255).astype(np.uint8)
+    if not chroma:
+        return luma
+
+    if planes >= 3:
+        u = subsample(128.0 - 0.168736 * red - 0.331264 * green + 0.5 * blue)
+        v = subsample(128.0 + 0.5 * red - 0.418688 * green - 0.081312 * blue)
+    else:
+        u = np.full(chroma_size_of(width, height), 128, dtype=np.uint8)
+        v = u.copy()
+    return luma, u, v
+
+
+def yuv_to_rgb(luma, u, v):
+    """
+    Convert the planes of a frame to an RGB image, the inverse of the
+    conversion made by `read_png`.
+
+    :param luma: the (height, width) luminance plane
+    :param u: the U plane, at full or half size
+    :param v: the V plane, at full or half size
+    :return: a (height, width, 3) uint8 array
+    """
+    height, width = luma.shape
+    if u.shape != luma.shape:
+        u = np.repeat(np.repeat(u, 2, axis=0), 2, axis=1)[:height, :width]
+        v = np.repeat(np.repeat(v, 2, axis=0), 2, axis=1)[:height, :width]
+    y = luma.astype(np.float64)
+    u = u.astype(np.float64) - 128.0
+    v = v.astype(np.float64) - 128.0
+    rgb = np.dstack([y + 1.402 * v,
+                     y - 0.344136 * u - 0.714136 * v,
+                     y + 1.772 * u])
+    return np.clip(np.round(rgb), 0, 255).astype(np.uint8)
+
+
+def read_yuv(filename, width, height, chroma=False):
+    """
+    Read a raw YUV420 frame as captured by the camera, padding included, and
+    flip it the same way a `PiCameraSource` does.
+
+    :param filename: the raw YUV file to read
+    :param width: the width of the captured frame
+    :param height: the height of the captured frame
+    :param chroma: also return the U and V planes of the frame.
+        [default: False]
+    :return: a (height, width) uint8 array, or the luminance, U and V arrays
+        if chroma is True
+    """
+    frame_width, frame_height = _frame_size(width, height)
+    data = np.fromfile(filename, dtype=np.uint8,
+                       count=frame_width * frame_height * 3 // 2)
+    planes = [np.ascontiguousarray(plane)
+              for plane in _yuv_planes(data, width, height)]
+    if not chroma:
+        return planes[0]
+    return tuple(planes)
+
+
+class DirectorySource(FrameSource):
+    """
+    Frames recorded as files in a directory, delivered in filename order.
+
+    PNG files are expected to hold frames as the `ImageProcessor` sees them,
+    such as the 'raw.png' debug image. Files ending in '.yuv' are raw camera
+    captures and are flipped like a live capture. The chroma of a colour PNG
+    is converted from its RGB values.
+    """
+    EXTENSIONS = ('.png', '.yuv')
+
+    def __init__(self, directory, width=96, height=96, loop=False):
+        """
+
+        :param directory: the directory containing the frame files
+        :param width: the width of the frames
+        :param height: the height of the frames
+        :param loop: start again at the first frame after the last frame
+            [default: False]
+        """
+        super(DirectorySource, self).__init__(width, height)
+        self.directory = directory
+        self.loop = loop
+        self.filenames = sorted(
+            os.path.join(directory, name) for name in os.listdir(directory)
+            if os.path.splitext(name)[1].lower() in self.EXTENSIONS)
+        if len(self.filenames) == 0:
+            raise IOError("No frames found in directory:{0}".format(
+                directory))
+
+        # frames are read up front so they are delivered at full speed
+        self._frames = []
+        self._chroma = []
+        for name in self.filenames:
+            luma, u, v = self._read(name)
+            self._frames.append(luma)
+            self._chroma.append((u, v))
+        self.index = 0
+        self._last = 0
+        self.filename = None
+        log.info("[DirectorySource.__init__] read {0} frames from:{1}".format(
+            len(self._frames), directory))
+
+    def _read(self, filename):
+        if filename.lower().endswith('.yuv'):
+            planes = read_yuv(filename, self.width, self.height, chroma=True)
+        else:
+            planes = read_png(filename, chroma=True)
+        luma = planes[0]
+        if luma.shape != (self.height, self.width):
+            raise ValueError("Frame:{0} is {1}x{2} not {3}x{4}".format(
+                filename, luma.shape[1], luma.shape[0],
+                self.width, self.height))
+        return planes
+
+    def __len__(self):
+        return len(self._frames)
+
+    def capture(self):
+        """
+        Deliver the next recorded frame.
+
+        :return: the luminance plane of the frame
+        """
+        if self.index >= len(self._frames):
+            if not self.loop:
+                raise EOFError("No more frames in directory:{0}".format(
+                    self.directory))
+            self.index = 0
+
+        self.filename = self.filenames[self.index]
+        luma = self._frames[self.index]
+        self._last = self.index
+        self.index += 1
+        return luma
+
+    def chroma(self):
+        """
+        The chroma of the last frame delivered.
+
+        :return: the U and V planes of the frame
+        """
+        return self._chroma[self._last]
+
+    def frames(self):
+        """
+        Deliver the recorded frames in order.
+
+        :return: a generator yielding the luminance plane of each frame. It
+            stops after the last frame unless the source loops.
+        """
+        while self.loop or self.index < len(self._frames):
+            yield self.capture()
+
+
+class SyntheticSource(FrameSource):
+    """
+    Generated scenes of bright, brown boxes on a darker, grey belt.
+
+    The boxes, noise and lighting of each frame are random but repeatable for a
+    given seed. The centre of every box in the last frame is kept in `truth`.
+    The chroma of a frame is generated when it is first asked for. By default
+    the boxes stay where they were first drawn and only the noise changes, as
+    when the camera looks at a still belt, so a tracker can confirm a box and
+    a change detector can skip unchanged frames. The default noise is low
+    enough for the fixed edge threshold to find the boxes.
+    """
+
+    def __init__(self, width=96, height=96, boxes=1, box_size=(16, 32),
+                 noise=3.0, lighting=1.0, gradient=0.0, belt=60, box=180,
+                 seed=None, belt_chroma=(128, 128), box_chroma=(108, 150),
+                 fixed=True):
+        """
+
+        :param width: the width of the generated frames
+        :param height: the height of the generated frames
+        :param boxes: the number of boxes in each frame
+        :param box_size: the smallest and largest side of a box in pixels
+        :param noise: standard deviation of the sensor noise in each frame
+        :param lighting: the brightness of the scene, 1.0 is normal lighting
+        :param gradient: how much darker the bottom of the scene is than the
+            top, as a fraction of the scene's brightness
+        :param belt: the luminance of the belt under normal lighting
+        :param box: the luminance of a box under normal lighting
+        :param seed: the seed of the random generator [default: None]
+        :param belt_chroma: the U, V of the belt under normal lighting
+        :param box_chroma: the U, V of a box under normal lighting
+        :param fixed: keep the boxes of the first frame in every frame
+            [default: True, otherwise each frame has new boxes]
+        """
+        super(SyntheticSource, self).__init__(width, height)
+        self.boxes = boxes
+        self.box_size = box_size
+        self.noise = noise
+        self.lighting = lighting
+        self.gradient = gradient
+        self.belt = belt
+        self.box = box
+        self.rs = np.random.RandomState(seed)
+        # chroma noise has its own generator so the luminance of each frame
+        # does not depend on whether chroma was asked for
+        self.chroma_rs = np.random.RandomState(
+            None if seed is None else seed + 1)
+        self.belt_chroma = belt_chroma
+        self.box_chroma = box_chroma
+        self.fixed = fixed
+        self.truth = []
+        self._rects = []
+        self._chroma = None
+
+    def capture(self):
+        """
+        Generate the next frame.
+
+        :return: the luminance plane of the frame. The centres of its boxes as
+            (x, y) pixel coordinates are kept in `truth`.
+        """
+        frame = np.full((self.height, self.width), self.belt,
+                        dtype=np.float64)
+        self._chroma = None
+        if not (self.fixed and self._rects):
+            self.truth = []
+            self._rects = []
+            min_size, max_size = self.box_size
+            for _ in range(self.boxes):
+                box_w = self.rs.randint(min_size, max_size + 1)
+                box_h = self.rs.randint(min_size, max_size + 1)
+                x = self.rs.randint(0, self.width - box_w + 1)
+                y = self.rs.randint(0, self.height - box_h + 1)
+                self._rects.append((x, y, box_w, box_h))
+                self.truth.append(
+                    (x + (box_w - 1) / 2.0, y + (box_h - 1) / 2.0))
+        for x, y, box_w, box_h in self._rects:
+            frame[y:y + box_h, x:x + box_w] = self.box
+
+        frame *= self._shade()
+        if self.noise > 0:
+            frame += self.rs.normal(0, self.noise, frame.shape)
+        return np.clip(frame, 0, 255).astype(np.uint8)
+
+    def _shade(self):
+        # the brightness of each row of the scene
+        shade = 1.0 - self.gradient * np.linspace(0, 1, self.height)
+        return self.lighting * shade[:, np.newaxis]
+
+    def chroma(self):
+        """
+        The chroma of the last frame generated.
+
+        :return: the U and V planes of the frame
+        """
+        if self._chroma is not None:
+            return self._chroma
+
+        planes = []
+        shade = self._shade()
+        for belt, box in zip(self.belt_chroma, self.box_chroma):
+            # colour is the offset from 128, which fades with the light
+            plane = np.full((self.height, self.width), belt - 128.0)
+            for x, y, box_w, box_h in self._rects:
+                plane[y:y + box_h, x:x + box_w] = box - 128.0
+            plane *= shade
+            if self.noise > 0:
+                plane += self.chroma_rs.normal(0, self.noise / 2.0,
+                                               plane.shape)
+            planes.append(subsample(plane + 128.0))
+        self._chroma = tuple(planes)
+        return self._chroma
@@ -0,0 +1,243 @@
+#!/usr/bin/env python
+
+# Copyright 2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You may not
+# use this file except in compliance with the License. A copy of the License is
+# located at
+#     http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is distributed on
+# an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+# express or implied. See the License for the specific language governing
+# permissions and limitations under the License.
+
+"""
+Precomputed servo goals of every pixel of a frame.
+
+A pick turns the coordinates of the object found into base, femur and tibia
+goals with `cartesian_goals` or `polar_goals`. A frame has only a few thousand
+pixels, so a goal table holds the goals of every pixel, computed once with the
+same functions, and a pick looks its goals up instead. The goals may be
+computed from coordinates corrected by a remap table, see `calibration`.
+
+The table is a uint16 array of shape (2, height + 1, width, 3) saved as a
+'.npy' file. The first index is 0 for cartesian and 1 for polar goals, the
+second is the y of the pixel counted up from the bottom row as in `coord_y`,
+and the third is its x. Each entry holds the (base, femur, tibia) goals.
+
+The goals may also be solved by inverse kinematics, see `kinematics`, for
+every pixel at once, with the geometry measured for the arm. The table then
+holds the same goals for both modes.
+
+The table must be built again whenever the constants of the goal functions
+change. The goal functions live with the arm's `stages`, so the table is built
+by running this module from the 'groups' directory:
+    python -m arm.ggd.goal_table build goals.npy [--remap_table remap.npy]
+        [--kinematics --geometry geometry.json]
+
+To learn more about the command line type:
+`python -m arm.ggd.goal_table --help`
+"""
+from __future__ import print_function
+
+import logging
+import argparse
+import numpy as np
+
+import calibration
+import kinematics
+
+CARTESIAN = 0
+POLAR = 1
+MAX_GOAL = 1023  # the largest goal position of the arm's servos
+
+
+def build_table(width, height, cartesian_goals, polar_goals,
+                remap_table=None):
+    """
+    Compute the goals of every pixel of frames of the given size.
+
+    :param width: the width of the frames
+    :param height: the height of the frames
+    :param cartesian_goals: the function giving the cartesian goals of x, y,
+        width and height
+    :param polar_goals: the function giving the polar goals of x, y, width and
+        height
+    :param remap_table: a remap table of the frame size used to correct each
+        pixel before its goals are computed [default: None]
+    :return: the goal table
+    """
+    table = np.zeros((2, height + 1, width, 3), dtype=np.uint16)
+    for y in range(height + 1):
+        for x in range(width):
+            goal_x, goal_y, goal_width, goal_height = x, y, width, height
+            if remap_table is not None:
+                goal_x, goal_y = calibration.remap(remap_table, x, y)
+                goal_width = calibration.CALIBRATION_WIDTH
+                goal_height = calibration.CALIBRATION_HEIGHT
+                # pixels corrected beyond the calibration frame take the
+                # goals of its edge
+                goal_x = min(max(goal_x, 0.0), goal_width)
+                goal_y = min(max(goal_y, 0.0), goal_height)
+            for mode, goals in ((CARTESIAN, cartesian_goals),
+                                (POLAR, polar_goals)):
+                goal = goals(goal_x, goal_y, goal_width, goal_height)
+                if min(goal) < 0 or max(goal) > MAX_GOAL:
+                    raise ValueError(
+                        "Goals:{0} of x:{1} y:{2} are out of range".format(
+                            goal, x, y))
+                table[mode, y, x] = goal
+    return table
+
+
+def build_kinematics_table(width, height, geometry, remap_table=None):
+    """
+    Solve the goals of every pixel of frames of the given size by inverse
+    kinematics, in one call.
+
+    :param width: the width of the frames
+    :param height: the height of the frames
+    :param geometry: the measured `ArmGeometry` of the arm
+    :param remap_table: see `build_table`
+    :return: the goal table
+    """
+    ys, xs = np.mgrid[0:height + 1, 0:width]
+    if remap_table is None:
+        goal_x = xs * float(calibration.CALIBRATION_WIDTH) / width
+        goal_y = ys * float(calibration.CALIBRATION_HEIGHT) / height
+    else:
+        corrected = remap_table[np.clip(height - ys, 0, height - 1), xs]
+        # as in `build_table`, clipped to the calibration frame
+        goal_x = np.clip(corrected[:, :, 0], 0,
+                         calibration.CALIBRATION_WIDTH)
+        goal_y = np.clip(corrected[:, :, 1], 0,
+                         calibration.CALIBRATION_HEIGHT)
+    goals, reachable = kinematics.pixel_goals(goal_x, goal_y, geometry)
+    if not reachable.all():
+        raise ValueError("{0} pixels cannot be reached".format(
+            np.count_nonzero(~reachable)))
+    table = np.empty((2, height + 1, width, 3), dtype=np.uint16)
+    table[:] = goals.reshape(height + 1, width, 3)
+    return table
+
+
+def save_table(filename, table):
+    np.save(filename, np.asarray(table, dtype=np.uint16))
+
+
+def load_table(filename):
+    """
+    Load a goal table saved by `save_table`.
+
+    :return: the goal table
+    """
+    table = np.load(filename)
+    if table.ndim != 4 or table.shape[0] != 2 or table.shape[3] != 3:
+        raise ValueError(
+            "Goal table:{0} has shape {1} not (2, h + 1, w, 3)".format(
+                filename, table.shape))
+    return table
+
+
+def frame_size(table):
+    """
+    The size of the frames a goal table was built for.
+
+    :return: (width, height)
+    """
+    return table.shape[2], table.shape[1] - 1
+
+
+def lookup(table, x, y, cartesian=True):
+    """
+    Look up the goals of an object found in a frame.
+
+    :param table: the goal table of the frame size
+    :param x: the x of the object, counted right from the left column
+    :param y: the y of the object, counted up from the bottom row
+    :param cartesian: give the cartesian (True) or polar (False) goals
+    :return: the base, femur and tibia goals
+    """
+    height = table.shape[1] - 1
+    width = table.shape[2]
+    row = min(max(int(y), 0), height)
+    col = min(max(int(x), 0), width - 1)
+    base, femur, tibia = table[CARTESIAN if cartesian else POLAR, row, col]
+    return int(base), int(femur), int(tibia)
+
+
+def _build(cli):
+    remap_table = None
+    width, height = cli.width, cli.height
+    if cli.remap_table is not None:
+        remap_table = calibration.load_table(cli.remap_table)
+        height, width = remap_table.shape[:2]
+    if cli.kinematics:
+        table = build_kinematics_table(
+            width, height, kinematics.load_geometry(cli.geometry),
+            remap_table=remap_table)
+    else:
+        # the goal functions live with the stages, which need the servo
+        # library and the arm package, see the module docstring
+        from stages import cartesian_goals, polar_goals
+        # every pixel would log its goals
+        logging.getLogger('stages').setLevel(logging.WARNING)
+        logging.getLogger().setLevel(logging.WARNING)
+        table = build_table(width, height, cartesian_goals, polar_goals,
+                            remap_table)
+    save_table(cli.table_file, table)
+    print("wrote {0}x{1} goal table to:{2}".format(
+        width, height, cli.table_file))
+
+
+def _lookup(cli):
+    table = load_table(cli.table_file)
+    print("base:{0} femur:{1} tibia:{2}".format(
+        *lookup(table, cli.x, cli.y, cartesian=not cli.polar)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Precompute the servo goals of every pixel of a frame',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    subparsers = parser.add_subparsers()
+
+    build_parser = subparsers.add_parser(
+        'build',
+        description='Build a goal table from the goal functions.',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    build_parser.add_argument('table_file',
+                              help="The '.npy' file to write the table to.")
+    build_parser.add_argument('--width', default=96, type=int,
+                              help="The width of the frames.")
+    build_parser.add_argument('--height', default=96, type=int,
+                              help="The height of the frames.")
+    build_parser.add_argument('--remap_table',
+                              help="Correct each pixel with the remap table "
+                                   "in this '.npy' file, whose size is then "
+                                   "the size of the frames.")
+    build_parser.add_argument('--kinematics', action='store_true',
+                              help="Solve the goals by inverse kinematics "
+                                   "instead of the goal functions.")
+    build_parser.add_argument('--geometry',
+                              help="The JSON file of the measured geometry "
+                                   "of the arm, needed by --kinematics.")
+    build_parser.set_defaults(func=_build)
+
+    lookup_parser = subparsers.add_parser(
+        'lookup',
+        description='Print the goals of a pixel.',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    lookup_parser.add_argument('table_file',
+                               help="The '.npy' file of the table.")
+    lookup_parser.add_argument('x', type=int, help="The x of the pixel.")
+    lookup_parser.add_argument('y', type=int, help="The y of the pixel.")
+    lookup_parser.add_argument('--polar', action='store_true',
+                               help="Print the polar goals.")
+    lookup_parser.set_defaults(func=_lookup)
+
+    args = parser.parse_args()
+    if getattr(args, 'kinematics', False) and args.geometry is None:
+        parser.error("--kinematics needs the --geometry of the arm")
+    args.func(args)
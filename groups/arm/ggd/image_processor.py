@@ -1,8 +1,9 @@
-import picamera
-import picamera.array
-import png
-import math
-from pixel_object import PixelObject
+import time
+import numpy as np
+import edges
+import chroma
+import labeller
+from frame_source import PiCameraSource
 
 """
 Image processor that can find the edges in a PNG image captured by a PiCamera.
@@ -11,293 +12,363 @@ Image processor that can find the edges in a PNG image captured by a PiCamera.
 
 class ImageProcessor:
 
-    def __init__(self, res_width=96, res_height=96):
-        self.camera = picamera.PiCamera(resolution=(res_width, res_height))
-        # TODO propagate configurable resolution through '96' logic below
+    def __init__(self, res_width=96, res_height=96, engine='numpy',
+                 debug_writer=None, source=None, tracker=None, roi_margin=8,
+                 coarse_scale=1, change_detector=None, threshold='fixed',
+                 chroma_table=None):
+        """
 
-        self.camera.hflip = True
-        self.camera.vflip = True
+        :param res_width: the width of the captured frames
+        :param res_height: the height of the captured frames
+        :param engine: the edge engine to use, 'numpy' or 'python'
+        :param debug_writer: a started `DebugImageWriter` used to save the
+            image of each processing step. [default: None, no images saved]
+        :param source: a long-lived `FrameSource`, such as a `PiCameraSource`
+            or a headless `DirectorySource` or `SyntheticSource`, which stays
+            open when this processor is closed. [default: None, the processor
+            opens and closes its own camera]
+        :param tracker: a long-lived `CentroidTracker`. When the tracker is
+            following an object, only the region around that object is
+            processed and the full frame is processed only if the object is
+            not found in the region. [default: None, always process the full
+            frame]
+        :param roi_margin: the pixels added around the tracked object to make
+            the region that is processed
+        :param coarse_scale: find the largest object in a copy of the frame
+            this many times smaller, then process only the region around that
+            object at full size. [default: 1, process the full frame at full
+            size]
+        :param change_detector: a long-lived `ChangeDetector`. Frames that
+            hardly differ from the background while nothing has been found are
+            skipped and report no object. [default: None, process every frame]
+        :param threshold: how the edge threshold of each frame is chosen,
+            'fixed', 'otsu' or 'percentile'. [default: 'fixed']
+        :param chroma_table: a chroma table of the box colour, see `chroma`.
+            Objects are then found by looking up the U, V of each pixel in the
+            table instead of by their edges, and are solid rather than
+            outlines. The source must give the chroma of its frames.
+            [default: None, find objects by their edges]
+        """
+        self.owns_source = source is None
+        if source is None:
+            source = PiCameraSource(width=res_width, height=res_height)
+        self.source = source
         self.res_width = res_width
         self.res_height = res_height
-        self.stream = picamera.array.PiYUVArray(self.camera)
         self.pixelObjList = []
-        self.object_id_center = 0
-        self.pixelObjList.append(PixelObject(self.next_obj_id()))
         self.max_pixel_count = 0
         self.largest_object_id = 0
         self.largest_X = 0
         self.largest_Y = 0
+        self.largest_object = None
         self.filename = ''
+        self.engine = edges.get_engine(engine)
+        self.debug_writer = debug_writer
+        self.timings = dict()  # seconds spent in each stage of the last frame
+        self.tracker = tracker
+        self.roi_margin = roi_margin
+        self.roi = None  # the region processed in the last frame, if any
+        self.coarse_scale = coarse_scale
+        self.change_detector = change_detector
+        self.skipped = False  # the last frame was skipped
+        if threshold not in edges.THRESHOLDS:
+            raise ValueError("Unknown threshold method:{0}".format(threshold))
+        self.threshold_method = threshold
+        self.threshold = edges.EDGE_THRESHOLD  # the last threshold used
+        self.chroma_table = chroma_table
+        self.roi_hits = 0
+        self.roi_misses = 0
 
     def close(self):
         print('[ImageProcessor.close] flushing')
         self.pixelObjList = []
-        self.object_id_center = 0
         self.max_pixel_count = 0
         self.largest_object_id = 0
         self.largest_X = 0
         self.largest_Y = 0
-        self.camera.close()
-
-    def next_obj_id(self):
-        self.object_id_center += 1
-        return self.object_id_center
+        if self.owns_source:
+            self.source.close()
 
     def capture_frame(self):
-        self.stream = picamera.array.PiYUVArray(self.camera)
-        self.camera.capture(self.stream, 'yuv')
-        self.camera._set_led(True)
+        # the source gives the flipped luminance plane of the frame
+        luma = self.source.capture()
+        self.process_frame(luma, self._chroma())
 
-        self.pixelObjList = []
-        self.object_id_center = 0
-        self.pixelObjList.append(PixelObject(self.next_obj_id()))
-
-        rows = []
-        for _ in range(self.res_height):
-            rows.append(range(self.res_width))
-
-        # flip image horizontally
-        for j, j_ in enumerate(range(self.res_width-1, -1, -1)):
-            # now flip vertically
-            for i, i_ in enumerate(range(self.res_height-1, -1, -1)):
-                rows[j][i] = self.stream.array[j_][i_][0]
-
-        self.filename = self.save_PNG('raw.png', rows)
-        self.spread_white_pixels(
-            self.make_black_and_white(
-                self.fuse_horizontal_and_vertical(
-                    self.get_horizontal_edges(rows),
-                    self.get_vertical_edges(rows)))
-        )
+    def stream_frames(self):
+        """
+        Process frames continuously as the source delivers them.
+
+        :return: a generator that yields the `max_pixel_count` of each frame
+            once the frame has been processed
+        """
+        for luma in self.source.frames():
+            self.process_frame(luma, self._chroma())
+            yield self.max_pixel_count
+
+    def _chroma(self):
+        # the U, V planes of the frame just captured, when they are used
+        if self.chroma_table is None:
+            return None
+        return self.source.chroma()
+
+    def process_frame(self, luma, uv=None):
+        """
+        Find the objects in a frame.
+
+        :param luma: the luminance plane of the frame
+        :param uv: the U and V planes of the frame, needed when segmenting by
+            chroma [default: None]
+        """
+        self.timings = dict.fromkeys(self.timings, 0.0)
+        self.skipped = False
+        if self.change_detector is not None:
+            start = time.time()
+            process = self.change_detector.should_process(luma)
+            self.timings['change'] = time.time() - start
+            if not process:
+                # the scene is still empty
+                self.skipped = True
+                self.pixelObjList = []
+                self.select_largest_object()
+                self.roi = None
+                if self.tracker is not None:
+                    self.tracker.update(None)
+                return
+
+        self.filename = self.save_PNG('raw.png', luma)
+
+        roi = None
+        if self.chroma_table is not None:
+            # a lookup of the whole frame costs less than searching a region
+            self.detect_chroma(uv)
+        elif self.tracker is not None:
+            roi = self.tracker.roi(self.roi_margin, self.res_width,
+                                   self.res_height)
+        if roi is not None:
+            self.detect(luma, roi)
+            if self._found_in(roi):
+                self.roi_hits += 1
+            else:
+                # the tracked object has left the region, search everywhere
+                self.roi_misses += 1
+                roi = None
+        if roi is None and self.chroma_table is None:
+            if self.coarse_scale > 1:
+                roi = self.detect_coarse_to_fine(luma)
+            else:
+                self.detect(luma)
+        self.roi = roi
+
+        if self.tracker is not None:
+            self.tracker.update(self.largest_object)
+        if self.change_detector is not None:
+            self.change_detector.record(self.max_pixel_count)
+
+    def detect(self, luma, roi=None):
+        """
+        Find the objects in a frame or in a region of a frame.
+
+        :param luma: the luminance plane of the frame
+        :param roi: the region to search as (x0, y0, x1, y1) where x1 and y1
+            are excluded [default: None, search the whole frame]
+        """
+        origin = (0, 0)
+        rows = luma
+        if roi is not None:
+            x0, y0, x1, y1 = roi
+            origin = (x0, y0)
+            rows = luma[y0:y1, x0:x1]
+        if self.engine.name == 'python':
+            rows = rows.tolist()
+
+        start = time.time()
+        hrows = self.get_horizontal_edges(rows)
+        vrows = self.get_vertical_edges(rows)
+        self.timings['edge'] = self.timings.get('edge', 0.0) + (
+            time.time() - start)
+
+        rows = self._timed('fuse', self.fuse_horizontal_and_vertical,
+                           hrows, vrows)
+        rows = self._timed('threshold', self.make_black_and_white, rows)
+        rows = self._timed('dilate', self.spread_white_pixels, rows)
+        self._timed('label', self.identify_pixel_objects, rows, origin)
+        self._timed('centroid', self.select_largest_object)
+
+    def detect_chroma(self, uv):
+        """
+        Find the objects in a frame whose colour is in the chroma table.
+
+        :param uv: the U and V planes of the frame
+        """
+        if uv is None:
+            raise ValueError("Segmenting by chroma needs the U, V planes.")
+        u, v = uv
+        rows = self._timed('segment', self.segment_by_chroma, u, v)
+        self._timed('label', self.identify_pixel_objects, rows)
+        self._timed('centroid', self.select_largest_object)
+
+    def detect_coarse_to_fine(self, luma):
+        """
+        Find the largest object in a smaller copy of the frame, then find the
+        objects at full size in the region around it.
+
+        :param luma: the luminance plane of the frame
+        :return: the region searched at full size as (x0, y0, x1, y1), or None
+            if no object was found in the smaller frame
+        """
+        start = time.time()
+        scale = self.coarse_scale
+        height = self.res_height // scale
+        width = self.res_width // scale
+        # each pixel of the smaller frame is the mean of a scale x scale block
+        blocks = luma[:height * scale, :width * scale].reshape(
+            height, scale, width, scale).astype(np.uint32)
+        small = ((blocks.sum(axis=(1, 3)) + scale * scale // 2) //
+                 (scale * scale)).astype(np.uint8)
+        if self.engine.name == 'python':
+            small = small.tolist()
+
+        engine = self.engine
+        fused = engine.fuse(engine.horizontal(small), engine.vertical(small))
+        mask = engine.spread(engine.black_and_white(
+            fused, edges.frame_threshold(fused, self.threshold_method)))
+        candidate = None
+        for obj in labeller.label_objects(mask):
+            if candidate is None or (
+                    obj.numberOfPixels > candidate.numberOfPixels):
+                candidate = obj
+        self.timings['coarse'] = self.timings.get('coarse', 0.0) + (
+            time.time() - start)
+
+        if candidate is None:
+            self.pixelObjList = []
+            self.select_largest_object()
+            return None
+
+        min_x, min_y, max_x, max_y = candidate.bbox
+        margin = self.roi_margin
+        roi = (max(min_x * scale - margin, 0),
+               max(min_y * scale - margin, 0),
+               min((max_x + 1) * scale + margin, self.res_width),
+               min((max_y + 1) * scale + margin, self.res_height))
+        self.detect(luma, roi)
+        return roi
+
+    def _timed(self, stage, func, *args):
+        # call func and add the time it took to the time of the stage
+        start = time.time()
+        result = func(*args)
+        self.timings[stage] = self.timings.get(stage, 0.0) + (
+            time.time() - start)
+        return result
+
+    def _found_in(self, roi):
+        # True if the largest object is large enough for the tracker and lies
+        # inside the region, away from any side cut through the frame
+        if not self.tracker.is_detection(self.largest_object):
+            return False
+        x0, y0, x1, y1 = roi
+        min_x, min_y, max_x, max_y = self.largest_object.bbox
+        return ((x0 == 0 or min_x > x0 + 1) and
+                (y0 == 0 or min_y > y0 + 1) and
+                (x1 == self.res_width or max_x < x1 - 2) and
+                (y1 == self.res_height or max_y < y1 - 2))
 
     def get_horizontal_edges(self, raw_rows):
         # get horizontal edges
-        rows = []
-        for _ in range(96):
-            rows.append(range(96))
-        for j in range(96):
-            for i in range(96):
-                if i + 1 <= 95:
-                    rows[j][i] = self.difference(raw_rows[j][i],
-                                                 raw_rows[j][i + 1])
-                else:
-                    rows[j][i] = self.difference(raw_rows[j][i],
-                                                 raw_rows[j][i - 1])
-
+        rows = self.engine.horizontal(raw_rows)
         self.save_PNG('processed_1.png', rows)
         return rows
 
-    def get_vertical_edges(self, rawrows):
+    def get_vertical_edges(self, raw_rows):
         # get vertical edges
-        rows = []
-        for _ in range(96):
-            rows.append(range(96))
-        for j in range(96):
-            for i in range(96):
-                if j + 1 <= 95:
-                    rows[j][i] = self.difference(
-                        rawrows[j][i], rawrows[j + 1][i])
-                else:
-                    rows[j][i] = self.difference(
-                        rawrows[j][i], rawrows[j - 1][i])
-
+        rows = self.engine.vertical(raw_rows)
         self.save_PNG('processed_2.png', rows)
         return rows
 
     def fuse_horizontal_and_vertical(self, hrows, vrows):
         # fuse the horizontal edge-image with the vertical edge-image
-        rows = []
-        for _ in range(96):
-            rows.append(range(96))
-        for j in range(96):
-            for i in range(96):
-                rows[j][i] = self.fusion(hrows[j][i], vrows[j][i])
-
+        rows = self.engine.fuse(hrows, vrows)
         self.save_PNG('processed_3.png', rows)
         return rows
 
     def make_black_and_white(self, edge_rows):
         # make the image dual in color (black and white)
-        threshold = 18
-
-        rows = []
-        for _ in range(96):
-            rows.append(range(96))
-        for j in range(96):
-            for i in range(96):
-                if edge_rows[j][i] >= threshold:
-                    rows[j][i] = 255
-                else:
-                    rows[j][i] = 0
-
+        self.threshold = edges.frame_threshold(edge_rows,
+                                               self.threshold_method)
+        rows = self.engine.black_and_white(edge_rows, self.threshold)
         self.save_PNG('processed_4.png', rows)
         return rows
 
     def spread_white_pixels(self, bw_rows):
         # make all the white pixels spread out one more pixel
-        rows = []
-        for _ in range(96):
-            rows.append(range(96))
-        for j in range(96):
-            for i in range(96):
-                if bw_rows[j][i] == 255:
-                    tmp_list = self.neighbors((i, j), 96, 96)
-                    for ent in tmp_list:
-                        tmp_x, tmp_y = ent
-                        rows[tmp_y][tmp_x] = 255
-                else:
-                    rows[j][i] = 0
-
+        rows = self.engine.spread(bw_rows)
         self.save_PNG('processed_4_5.png', rows)
+        return rows
 
-        self.identify_pixel_objects(rows)
-
-    def identify_pixel_objects(self, bw_rows):
-        # make PixelObjects when pixels are direct 8-neighbours of each other
-        for j in range(96):
-            for i in range(96):
-                if bw_rows[j][i] == 255:  # if the pixel is white
-                    tmp_list = []
-                    for ent in self.neighbors((i, j), 96, 96):
-                        tmp_x, tmp_y = ent
-                        if bw_rows[tmp_y][tmp_x] == 255:  # if pixel is white
-                            tmp_list.append(ent)
-                    # print tmp_list
-                    flag = False
-                    for obj in self.pixelObjList:
-                        # make a new PixelObj whenever a Pixel isn't connected
-                        # to an object
-                        if obj.check_xy_set(tmp_list) is True:
-                            flag = True
-                    if flag is False:
-                        self.pixelObjList.append(
-                            PixelObject(self.next_obj_id()))
-                        for obj in self.pixelObjList:
-                            obj.check_xy_set(tmp_list)
-        for obj in self.pixelObjList:
-            rows = []
-            for _ in range(96):
-                rows.append(range(96))
-            for j in range(96):
-                for i in range(96):
-                    if (i, j) in obj.XYset:
-                        rows[j][i] = 255
-                    else:
-                        rows[j][i] = 0
-                        # self.save_PNG(string.join([str(obj.id_), 'processed_5.png'], ''), rows)
-        self.merge_overlapping_pixel_objects()
-
-    def merge_overlapping_pixel_objects(self):
-        # merge objects with overlapping x-y tuples together
-        center = 0
-        max_entry = len(self.pixelObjList) - 1
-        # old_len = len(self.pixelObjList)
-        # flag = False
-        while center < max_entry:
-            tmp = self.check_overlap(center)
-            if tmp is False:
-                center += 1
-            else:
-                for ent in self.pixelObjList[tmp].XYset:
-                    self.pixelObjList[center].XYset.add(ent)
-                del self.pixelObjList[tmp]
-                max_entry = len(self.pixelObjList) - 1
+    def segment_by_chroma(self, u, v):
+        # look up the colour of each pixel, then grow the half size mask of
+        # the chroma planes to the size of the frame
+        mask = chroma.segment(self.chroma_table, u, v)
+        rows = np.repeat(np.repeat(mask, 2, axis=0), 2, axis=1)[
+            :self.res_height, :self.res_width]
+        self.save_PNG('chroma.png', rows)
+        return rows
+
+    def identify_pixel_objects(self, bw_rows, origin=(0, 0)):
+        # make PixelObjects of pixels that are 8-connected to each other
+        self.pixelObjList = labeller.label_objects(
+            bw_rows, origin=origin, height=self.res_height)
 
+    def select_largest_object(self):
+        # the first object found with the most pixels is the largest object
+        self.max_pixel_count = 0
+        self.largest_object_id = 0
+        self.largest_X = 0
+        self.largest_Y = 0
+        self.largest_object = None
         for obj in self.pixelObjList:
-            object_pixels = obj.count_pixel()
-            # if self.max_pixel_count == 0:
-            #     results['max_pixel_count'] = object_pixels
-            #     results['object_id'] = obj.id_
-            if object_pixels > self.max_pixel_count:
-                self.max_pixel_count = object_pixels
+            if obj.numberOfPixels > self.max_pixel_count:
+                self.max_pixel_count = obj.numberOfPixels
+                self.largest_object = obj
                 self.largest_object_id = obj.id_
-                x, y = obj.compute_mean_coord()
-                self.largest_X = x
-                self.largest_Y = y
-
-            # print obj.XYset
-            rows = []
-            for _ in range(96):
-                rows.append(range(96))
-            for j in range(96):
-                for i in range(96):
-                    if (i, j) in obj.XYset:
-                        rows[j][i] = 255
-                    else:
-                        rows[j][i] = 0
-                        # self.save_PNG(string.join([str(obj.id_), 'pixpro.png'], ''), rows)
-
-        # print("nmbr of pre Objects:{0}".format(old_len))
+                self.largest_X = obj.coord_x
+                self.largest_Y = obj.coord_y
+
         self.new_one_pixel_png()
 
+    def largest_features(self):
+        """
+        The features of the largest object of the last frame, gathered while
+        it was labelled.
+
+        :return: see `PixelObject.features`, or None if no object was found
+        """
+        if self.largest_object is None:
+            return None
+        return self.largest_object.features()
+
     def new_one_pixel_png(self):
         """
         make a new png with 1 pixel per object at their respective center
         :return:
         """
-        tmp_pos_list = []
+        if self.debug_writer is None:
+            return
 
+        rows = np.zeros((self.res_height, self.res_width), dtype=np.uint8)
         for obj in self.pixelObjList:
-            print("X:{0} Y:{1}".format(obj.coord_x, obj.coord_y))
-            tmp_pos_list.append((obj.coord_x, obj.coord_real_y))
-
-        rows = []
-        for _ in range(96):
-            rows.append(range(96))
-        for j in range(96):
-            for i in range(96):
-                if (i, j) in tmp_pos_list:
-                    rows[j][i] = 255
-                else:
-                    rows[j][i] = 0
+            rows[obj.coord_real_y][obj.coord_x] = 255
 
         self.save_PNG('PixelObjectPos.png', rows)
 
-    def check_overlap(self, counter):
-        """
-        check for overlapping x-y tuples in sets in 2 distinct objects
-        return the listNumber for the object with overlapping pixels if there
-        are overlapping pixels return False if not
+    def save_PNG(self, filename, rws):
         """
-        max_entry = len(self.pixelObjList) - 1
-        for ent1 in self.pixelObjList[counter].XYset:
-            for i in range(counter + 1, max_entry + 1, 1):
-                for ent2 in self.pixelObjList[i].XYset:
-                    if ent1 == ent2:
-                        return i
-        return False
+        Hand the image to the debug writer, if there is one.
 
-    def save_PNG(self, filename, rws):
-        # print("[save_PNG] filename:{0} rws:{1}".format(filename, rws))
-        name = 'img/{0}'.format(filename)
-        f = open(name, 'wb')
-        w = png.Writer(96, 96, greyscale=True)
-        w.write(f, rws)
-        f.close()
-        return name
-
-    def difference(self, a, b):
-        if a >= b:
-            return a - b
-        else:
-            return b - a
-
-    def fusion(self, a, b):
-        a_ = int(a)
-        b_ = int(b)
-        tmp = round(math.sqrt(a_ * a_ + b_ * b_))
-        if tmp <= 255:
-            return int(tmp)
-        else:
-            return 255
-
-    def neighbors(self, (x, y), max_x, max_y):
-        n_list = []
-        xx, yy = (x, y)
-        for y_ in range(-1, 2, 1):
-            for x_ in range(-1, 2, 1):
-                res_x = xx + x_
-                res_y = yy + y_
-                if max_x > res_x >= 0 and max_y > res_y >= 0:
-                    n_list.append((res_x, res_y))
-        return n_list
+        :return: the name of the file the image will be written to, or None if
+            the image will not be written
+        """
+        if self.debug_writer is None:
+            return None
+        return self.debug_writer.submit(filename, rws)
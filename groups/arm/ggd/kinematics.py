@@ -0,0 +1,267 @@
+#!/usr/bin/env python
+
+# Copyright 2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You may not
+# use this file except in compliance with the License. A copy of the License is
+# located at
+#     http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is distributed on
+# an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+# express or implied. See the License for the specific language governing
+# permissions and limitations under the License.
+
+"""
+Inverse kinematics of the arm's base, femur and tibia.
+
+The base turns the arm about a vertical axis. The two femur servos move
+together as the shoulder and the tibia servo is the elbow, so the femur and
+tibia form a two link arm in the vertical plane the base points along. Given
+points in the workspace, `solve` finds the base, femur and tibia goals that put
+the end-effector on each point, for whole arrays of points in one NumPy call,
+and checks each goal against the limits of its joint.
+
+Workspace points are in millimetres from the base's axis at the height of the
+belt: x to the right, y forward and z up. Joint angles are converted to goals
+with the zero position and direction of each servo, so the `ArmGeometry` must
+be measured for each arm. The defaults are nominal and do not match the goals
+the arm was tuned with, so goals that drive an arm are solved with a geometry
+measured for it and loaded by `load_geometry` from a JSON file such as:
+    { "shoulder_height": 70.0, "femur": 110.0, "tibia": 140.0,
+      "base_zero": 210, "base_sign": 1, "femur_zero": 512, "femur_sign": -1,
+      "tibia_zero": 512, "tibia_sign": -1, "base_limits": [210, 810],
+      "femur_limits": [250, 620], "tibia_limits": [100, 600],
+      "mm_per_pixel": 1.0, "frame_origin": [-48.0, 120.0],
+      "pick_height": 15.0 }
+
+This command-line has one command:
+* `plan` - solve a grid of points of the calibration frame and report how many
+    are reachable, and how long the solve took
+
+To learn more about the command line type: `python kinematics.py --help`
+"""
+from __future__ import print_function
+
+import json
+import time
+import argparse
+import numpy as np
+
+UNITS_PER_DEGREE = 1024 / 300.0  # an AX-12 turns 300 degrees over 1024 goals
+GEOMETRY_FIELDS = (
+    'shoulder_height', 'femur', 'tibia', 'base_zero', 'base_sign',
+    'femur_zero', 'femur_sign', 'tibia_zero', 'tibia_sign', 'base_limits',
+    'femur_limits', 'tibia_limits', 'mm_per_pixel', 'frame_origin',
+    'pick_height'
+)
+
+
+class ArmGeometry(object):
+    """
+    The dimensions of an arm, where its servos' goals are zero and the ranges
+    its servos may be driven through.
+    """
+
+    def __init__(self, shoulder_height=70.0, femur=110.0, tibia=140.0,
+                 base_zero=210, base_sign=1, femur_zero=512, femur_sign=-1,
+                 tibia_zero=512, tibia_sign=-1, base_limits=(210, 810),
+                 femur_limits=(250, 620), tibia_limits=(100, 600),
+                 mm_per_pixel=1.0, frame_origin=(-48.0, 120.0),
+                 pick_height=15.0):
+        """
+
+        :param shoulder_height: the height in mm of the femur's joint above
+            the belt
+        :param femur: the length in mm from the femur's joint to the tibia's
+        :param tibia: the length in mm from the tibia's joint to the grip
+        :param base_zero: the base goal pointing along x, to the right
+        :param base_sign: 1 if the base goal grows turning towards y
+        :param femur_zero: the femur goal holding the femur upright
+        :param femur_sign: 1 if the femur goal grows leaning forward
+        :param tibia_zero: the tibia goal holding the tibia straight on from
+            the femur
+        :param tibia_sign: 1 if the tibia goal grows bending down
+        :param base_limits: the (lowest, highest) goal of the base
+        :param femur_limits: the (lowest, highest) goal of the femurs
+        :param tibia_limits: the (lowest, highest) goal of the tibia
+        :param mm_per_pixel: the size on the belt of a pixel of the
+            calibration frame
+        :param frame_origin: the (x, y) in mm of the bottom left pixel of the
+            calibration frame
+        :param pick_height: the height in mm above the belt of a grip
+        """
+        super(ArmGeometry, self).__init__()
+        self.shoulder_height = shoulder_height
+        self.femur = femur
+        self.tibia = tibia
+        self.base_zero = base_zero
+        self.base_sign = base_sign
+        self.femur_zero = femur_zero
+        self.femur_sign = femur_sign
+        self.tibia_zero = tibia_zero
+        self.tibia_sign = tibia_sign
+        self.base_limits = base_limits
+        self.femur_limits = femur_limits
+        self.tibia_limits = tibia_limits
+        self.mm_per_pixel = mm_per_pixel
+        self.frame_origin = frame_origin
+        self.pick_height = pick_height
+
+
+DEFAULT_GEOMETRY = ArmGeometry()
+
+
+def load_geometry(filename):
+    """
+    Load the measured `ArmGeometry` of an arm from a JSON file. The file must
+    give every parameter of `ArmGeometry`, so that no nominal value is used.
+
+    :param filename: the JSON file, see the module docstring
+    :return: the `ArmGeometry`
+    """
+    with open(filename) as f:
+        measured = json.load(f)
+    missing = [field for field in GEOMETRY_FIELDS if field not in measured]
+    unknown = [field for field in measured if field not in GEOMETRY_FIELDS]
+    if missing or unknown:
+        raise ValueError(
+            "Geometry:{0} is missing:{1} and has unknown:{2}".format(
+                filename, missing, unknown))
+    values = dict()
+    for field in GEOMETRY_FIELDS:
+        value = measured[field]
+        if isinstance(value, list):
+            value = tuple(value)
+        values[str(field)] = value
+    return ArmGeometry(**values)
+
+
+def pixel_to_workspace(x, y, geometry=DEFAULT_GEOMETRY):
+    """
+    The point on the belt seen at pixels of the calibration frame.
+
+    :param x: the x of the pixels, counted right from the left column
+    :param y: the y of the pixels, counted up from the bottom row
+    :return: the x, y of the points in mm as float arrays
+    """
+    origin_x, origin_y = geometry.frame_origin
+    return (origin_x + np.asarray(x, dtype=np.float64) * geometry.mm_per_pixel,
+            origin_y + np.asarray(y, dtype=np.float64) * geometry.mm_per_pixel)
+
+
+def solve(x, y, z, geometry=DEFAULT_GEOMETRY):
+    """
+    Find the goals that put the end-effector on points of the workspace.
+
+    :param x: the x of the points in mm
+    :param y: the y of the points in mm
+    :param z: the z of the points in mm
+    :param geometry: the `ArmGeometry` of the arm
+    :return: an (n, 3) int array of the base, femur and tibia goals of each
+        point, and a bool array that is True where the point can be reached
+        within the limits of every joint. The goals of a point that cannot be
+        reached are clipped to the limits and must not be used.
+    """
+    x, y, z = np.broadcast_arrays(np.asarray(x, dtype=np.float64),
+                                  np.asarray(y, dtype=np.float64),
+                                  np.asarray(z, dtype=np.float64))
+    x = x.ravel()
+    y = y.ravel()
+    z = z.ravel()
+    femur = geometry.femur
+    tibia = geometry.tibia
+
+    base = np.degrees(np.arctan2(y, x))
+    # the femur and tibia reach along the plane the base points along
+    r = np.hypot(x, y)
+    h = z - geometry.shoulder_height
+    cos_bend = (r * r + h * h - femur * femur - tibia * tibia) / (
+        2 * femur * tibia)
+    reachable = np.abs(cos_bend) <= 1.0
+    bend = np.arccos(np.clip(cos_bend, -1.0, 1.0))
+    # the femur's angle from upright is the angle of the point from upright,
+    # less the angle the bent tibia adds
+    lean = np.arctan2(r, h) - np.arctan2(tibia * np.sin(bend),
+                                         femur + tibia * np.cos(bend))
+
+    goals = np.column_stack([
+        geometry.base_zero + geometry.base_sign * base * UNITS_PER_DEGREE,
+        geometry.femur_zero +
+        geometry.femur_sign * np.degrees(lean) * UNITS_PER_DEGREE,
+        geometry.tibia_zero +
+        geometry.tibia_sign * np.degrees(bend) * UNITS_PER_DEGREE
+    ])
+    goals = np.round(goals)
+    limits = np.array([geometry.base_limits, geometry.femur_limits,
+                       geometry.tibia_limits], dtype=np.float64)
+    within = ((goals >= limits[:, 0]) & (goals <= limits[:, 1])).all(axis=1)
+    goals = np.clip(goals, limits[:, 0], limits[:, 1]).astype(np.int32)
+    return goals, reachable & within
+
+
+def forward(goals, geometry=DEFAULT_GEOMETRY):
+    """
+    Find where goals put the end-effector, the inverse of `solve`.
+
+    :param goals: an (n, 3) array of base, femur and tibia goals
+    :return: the x, y, z of the end-effector in mm as float arrays
+    """
+    goals = np.asarray(goals, dtype=np.float64).reshape(-1, 3)
+    base = np.radians((goals[:, 0] - geometry.base_zero) /
+                      (geometry.base_sign * UNITS_PER_DEGREE))
+    lean = np.radians((goals[:, 1] - geometry.femur_zero) /
+                      (geometry.femur_sign * UNITS_PER_DEGREE))
+    bend = np.radians((goals[:, 2] - geometry.tibia_zero) /
+                      (geometry.tibia_sign * UNITS_PER_DEGREE))
+    r = geometry.femur * np.sin(lean) + geometry.tibia * np.sin(lean + bend)
+    h = geometry.femur * np.cos(lean) + geometry.tibia * np.cos(lean + bend)
+    return (r * np.cos(base), r * np.sin(base),
+            h + geometry.shoulder_height)
+
+
+def pixel_goals(x, y, geometry=DEFAULT_GEOMETRY):
+    """
+    Find the goals that pick objects seen at pixels of the calibration frame.
+
+    :param x: the x of the pixels, counted right from the left column
+    :param y: the y of the pixels, counted up from the bottom row
+    :return: see `solve`
+    """
+    wx, wy = pixel_to_workspace(x, y, geometry)
+    return solve(wx, wy, geometry.pick_height, geometry)
+
+
+def _plan(cli):
+    geometry = DEFAULT_GEOMETRY
+    if cli.geometry is not None:
+        geometry = load_geometry(cli.geometry)
+    ys, xs = np.mgrid[0:cli.height + 1, 0:cli.width]
+    start = time.time()
+    goals, valid = pixel_goals(xs, ys, geometry)
+    elapsed = time.time() - start
+    print("solved {0} points in {1:.2f}ms, {2} reachable".format(
+        valid.size, elapsed * 1000.0, np.count_nonzero(valid)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Inverse kinematics of the arm',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    subparsers = parser.add_subparsers()
+
+    plan_parser = subparsers.add_parser(
+        'plan',
+        description='Solve every pixel of the calibration frame.',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    plan_parser.add_argument('--width', default=96, type=int,
+                             help="The width of the calibration frame.")
+    plan_parser.add_argument('--height', default=96, type=int,
+                             help="The height of the calibration frame.")
+    plan_parser.add_argument('--geometry',
+                             help="The JSON file of the measured geometry of "
+                                  "the arm. [default: the nominal geometry]")
+    plan_parser.set_defaults(func=_plan)
+
+    args = parser.parse_args()
+    args.func(args)
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+
+# Copyright 2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You may not
+# use this file except in compliance with the License. A copy of the License is
+# located at
+#     http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is distributed on
+# an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+# express or implied. See the License for the specific language governing
+# permissions and limitations under the License.
+
+"""
+Connected-component labelling of black and white images.
+
+White pixels that are 8-neighbours of each other belong to the same object. The
+image is first broken into horizontal runs of white pixels. Runs on adjacent
+rows that touch are joined using a union-find over the runs, and a second pass
+hands each run to its object as a span, from which the object keeps its area,
+centroid and bounding box. The cost grows with the number of runs rather than
+with the number of pixel pairs.
+"""
+import numpy as np
+
+from pixel_object import PixelObject
+
+
+def find_runs(mask):
+    """
+    Find the horizontal runs of white pixels in a black and white image.
+
+    :param mask: a 2D array-like where non-zero pixels are white
+    :return: three int arrays `rows`, `starts` and `ends` in row order, where
+        each run covers columns `starts[n]` up to but excluding `ends[n]`
+    """
+    white = np.asarray(mask) != 0
+    padded = np.zeros((white.shape[0], white.shape[1] + 2), dtype=np.int8)
+    padded[:, 1:-1] = white
+    steps = np.diff(padded, axis=1)
+    rows, starts = np.nonzero(steps == 1)
+    _, ends = np.nonzero(steps == -1)
+    return rows, starts, ends
+
+
+def _find(parent, n):
+    # find the root of `n`, halving the path along the way
+    while parent[n] != n:
+        parent[n] = parent[parent[n]]
+        n = parent[n]
+    return n
+
+
+def _union(parent, a, b):
+    root_a = _find(parent, a)
+    root_b = _find(parent, b)
+    # the lower run index always wins, so a root is its object's first run
+    if root_a < root_b:
+        parent[root_b] = root_a
+    elif root_b < root_a:
+        parent[root_a] = root_b
+
+
+def label_runs(rows, starts, ends):
+    """
+    Join the runs that are 8-connected to each other.
+
+    :return: a list containing the root run index of every run
+    """
+    rows = rows.tolist()
+    starts = starts.tolist()
+    ends = ends.tolist()
+    parent = list(range(len(rows)))
+
+    prev_first = prev_last = 0  # runs of the previous row
+    cur_first = 0  # first run of the current row
+    for n in range(len(rows)):
+        if n > 0 and rows[n] != rows[n - 1]:
+            if rows[n] == rows[n - 1] + 1:
+                prev_first, prev_last = cur_first, n
+            else:
+                prev_first = prev_last = n
+            cur_first = n
+
+        # runs touch when they overlap or meet at a diagonal
+        for p in range(prev_first, prev_last):
+            if starts[p] > ends[n]:
+                break
+            if ends[p] >= starts[n]:
+                _union(parent, p, n)
+
+    return [_find(parent, n) for n in range(len(parent))]
+
+
+def label_objects(mask, origin=(0, 0), height=None):
+    """
+    Label the 8-connected objects of white pixels in a black and white image.
+
+    :param mask: a 2D array-like where non-zero pixels are white
+    :param origin: the (x, y) position of the mask within the frame, when the
+        mask covers only a region of the frame
+    :param height: the height of the frame [default: None, the mask's height]
+    :return: a list of `PixelObject`s in the order in which each object's first
+        pixel appears when reading the image row by row
+    """
+    if height is None:
+        height = np.asarray(mask).shape[0]
+    x_offset, y_offset = origin
+    rows, starts, ends = find_runs(mask)
+    roots = label_runs(rows, starts, ends)
+
+    objects = dict()
+    order = []
+    for n, root in enumerate(roots):
+        if root not in objects:
+            objects[root] = PixelObject(len(order) + 1, height=height)
+            order.append(root)
+        objects[root].add_span(int(rows[n]) + y_offset,
+                               int(starts[n]) + x_offset,
+                               int(ends[n]) + x_offset)
+
+    return [objects[root] for root in order]
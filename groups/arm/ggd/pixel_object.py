@@ -1,58 +1,209 @@
-from __future__ import print_function
-
 """
-A class that can both count the pixels contained within an instance and 
+A class that can both count the pixels contained within an instance and
 determine the mean x, y coordinates of the instance.
+
+The pixels of an instance are stored as horizontal spans, one span per run of
+pixels on a row, in compact arrays. Running sums of the pixel coordinates and
+of their squares and products are kept as spans are added, so the pixel count,
+mean coordinates, bounding box, second moments and orientation are read
+without visiting the pixels.
 """
+import math
+from array import array
+
+DEFAULT_HEIGHT = 96  # the height of the frames the arm finds objects in
+
 
+def _sum_of_squares(n):
+    # 0 ** 2 + 1 ** 2 + ... + n ** 2
+    return n * (n + 1) * (2 * n + 1) // 6
 
-class PixelObject:
 
-    def __init__(self, id_):
-        self.XYset = set()
+class PixelObject(object):
+    __slots__ = ('id_', 'height', 'rows', 'starts', 'ends', 'numberOfPixels',
+                 'sum_x', 'sum_y', 'sum_xx', 'sum_yy', 'sum_xy', 'min_x',
+                 'min_y', 'max_x', 'max_y')
+
+    def __init__(self, id_, height=DEFAULT_HEIGHT):
+        """
+
+        :param id_: the id of the object
+        :param height: the height of the image containing the object, used to
+            count `coord_y` up from the bottom row [default: 96]
+        """
         self.id_ = id_
+        self.height = height
+        # each span covers columns starts[n] up to but excluding ends[n]
+        self.rows = array('l')
+        self.starts = array('l')
+        self.ends = array('l')
         self.numberOfPixels = 0
-        self.coord_x = 0
-        self.coord_y = 0
-        self.coord_real_y = 0
-        print("new object made with id: ", self.id_)
+        self.sum_x = 0
+        self.sum_y = 0
+        self.sum_xx = 0
+        self.sum_yy = 0
+        self.sum_xy = 0
+        self.min_x = self.min_y = self.max_x = self.max_y = None
+
+    def add_span(self, y, x0, x1):
+        # add the pixels of row `y` from column `x0` up to but excluding `x1`
+        length = x1 - x0
+        span_x = (x0 + x1 - 1) * length // 2
+        self.rows.append(y)
+        self.starts.append(x0)
+        self.ends.append(x1)
+        self.numberOfPixels += length
+        self.sum_x += span_x
+        self.sum_y += y * length
+        self.sum_xx += _sum_of_squares(x1 - 1) - _sum_of_squares(x0 - 1)
+        self.sum_yy += y * y * length
+        self.sum_xy += y * span_x
+        if self.min_x is None:
+            self.min_x, self.min_y, self.max_x, self.max_y = x0, y, x1 - 1, y
+        else:
+            self.min_x = min(self.min_x, x0)
+            self.min_y = min(self.min_y, y)
+            self.max_x = max(self.max_x, x1 - 1)
+            self.max_y = max(self.max_y, y)
+
+    def add_pixel(self, x, y):
+        self.add_span(y, x, x + 1)
+
+    def contains(self, x, y):
+        for n in range(len(self.rows)):
+            if self.rows[n] == y and self.starts[n] <= x < self.ends[n]:
+                return True
+        return False
+
+    def pixels(self):
+        # generate the (x, y) coordinates of every pixel of the object
+        for y, x0, x1 in zip(self.rows, self.starts, self.ends):
+            for x in range(x0, x1):
+                yield x, y
+
+    @property
+    def XYset(self):
+        # the pixels as a set of (x, y) tuples, built on demand
+        return set(self.pixels())
+
+    @property
+    def bbox(self):
+        # (min_x, min_y, max_x, max_y), or None when the object is empty
+        if self.numberOfPixels == 0:
+            return None
+        return self.min_x, self.min_y, self.max_x, self.max_y
+
+    @property
+    def coord_x(self):
+        if self.numberOfPixels == 0:
+            return 0
+        return self.sum_x // self.numberOfPixels
+
+    @property
+    def coord_real_y(self):
+        if self.numberOfPixels == 0:
+            return 0
+        return self.sum_y // self.numberOfPixels
+
+    @property
+    def coord_y(self):
+        if self.numberOfPixels == 0:
+            return 0
+        return self.height - self.coord_real_y
+
+    @property
+    def area(self):
+        return self.numberOfPixels
+
+    @property
+    def centroid(self):
+        # the mean (x, y) of the pixels, with y counted down from the top row
+        if self.numberOfPixels == 0:
+            return None
+        return (float(self.sum_x) / self.numberOfPixels,
+                float(self.sum_y) / self.numberOfPixels)
+
+    @property
+    def moments(self):
+        """
+        The second moments of the pixels about the centroid, each divided by
+        the number of pixels.
+
+        :return: (mu20, mu02, mu11), or None when the object is empty
+        """
+        n = self.numberOfPixels
+        if n == 0:
+            return None
+        # central moments from the raw sums, kept exact until the division
+        mu20 = float(self.sum_xx * n - self.sum_x * self.sum_x) / (n * n)
+        mu02 = float(self.sum_yy * n - self.sum_y * self.sum_y) / (n * n)
+        mu11 = float(self.sum_xy * n - self.sum_x * self.sum_y) / (n * n)
+        return mu20, mu02, mu11
+
+    @property
+    def orientation(self):
+        # the angle in degrees of the major axis from the x axis, counted
+        # anticlockwise with y up as in `coord_y`, between -90 and 90
+        if self.numberOfPixels == 0:
+            return None
+        mu20, mu02, mu11 = self.moments
+        # moments are taken with y down, which mirrors the angle
+        return 0.0 - math.degrees(0.5 * math.atan2(2 * mu11, mu20 - mu02))
+
+    @property
+    def axes(self):
+        """
+        The lengths of the major and minor axes of the ellipse with the same
+        second moments as the object.
+
+        :return: (major, minor) in pixels, or None when the object is empty
+        """
+        if self.numberOfPixels == 0:
+            return None
+        mu20, mu02, mu11 = self.moments
+        mean = (mu20 + mu02) / 2
+        spread = math.sqrt(((mu20 - mu02) / 2) ** 2 + mu11 ** 2)
+        return (4 * math.sqrt(mean + spread),
+                4 * math.sqrt(max(mean - spread, 0.0)))
+
+    def features(self):
+        """
+        The features of the object used to pick it up.
+
+        :return: a dict of the object's area, centroid, bounding box, second
+            moments, orientation and axes, or None when the object is empty
+        """
+        if self.numberOfPixels == 0:
+            return None
+        major, minor = self.axes
+        return {
+            'area': self.area,
+            'centroid': self.centroid,
+            'bbox': self.bbox,
+            'moments': self.moments,
+            'orientation': self.orientation,
+            'major_axis': major,
+            'minor_axis': minor
+        }
 
     def check_xy_set(self, entry_list):
         flag = False
-        for entry in entry_list:
-            if len(self.XYset) is 0:
-                self.XYset.add(entry)
-            if entry in self.XYset:
+        if self.numberOfPixels == 0 and len(entry_list) > 0:
+            self.add_pixel(*entry_list[0])
+        for x, y in entry_list:
+            if self.contains(x, y):
                 flag = True
+                break
         if flag is True:
-            for entry in entry_list:
-                self.XYset.add(entry)
+            for x, y in entry_list:
+                if not self.contains(x, y):
+                    self.add_pixel(x, y)
         return flag
 
     def count_pixel(self):
-        self.numberOfPixels = len(self.XYset)
-        print("Object ID:{0}".format(self.id_))
-        print("Number of Pixels:{0}".format(self.numberOfPixels))
-
         return self.numberOfPixels
 
     def compute_mean_coord(self):
-        # This code assumes only one object.
-        print('my current object id is:{0}'.format(self.id_))
-        if len(self.XYset) is 0:
+        if self.numberOfPixels == 0:
             return
-        temp_x = 0
-        temp_y = 0
-        for ent in self.XYset:
-            x, y = ent
-            temp_x += x
-            temp_y += y
-
-        self.coord_x = int(temp_x / len(self.XYset))
-        tmp = int(temp_y / len(self.XYset))
-        self.coord_real_y = tmp
-        self.coord_y = 96 - tmp  # currently assumes 96 pixel wide images
-
-        print("X coord:{0}".format(self.coord_x))
-        print("Y coord:{0}".format(self.coord_y))
         return self.coord_x, self.coord_y
@@ -0,0 +1,326 @@
+#!/usr/bin/env python
+
+"""
+A software emulation of a bus of AX-12 servos, used as the backend of a
+`ServoProtocol` in place of the DynamixelSDK when there is no servo hardware.
+
+Each emulated servo holds the control table described by `dxl_control` and
+moves its `present_position` toward its `goal_position` at its
+`moving_speed`. The emulator answers Protocol 1.0 instruction packets, see
+`protocol1`, and every transaction is delayed by the time its instruction and
+status packets would take on the wire at the bus's baud rate plus the servo's
+return delay, so code using the emulator sees realistic bus timing.
+
+To use the emulator:
+```python
+with ServoProtocol(backend=BusEmulator([10, 11, 12])) as sp:
+    servo = Servo(sp=sp, servo_id=10)
+    servo['goal_position'] = 128
+```
+
+The emulator can also `serve` a pty, for testing a `PacketBus` over a real
+file descriptor.
+"""
+from __future__ import print_function
+
+import os
+import time
+import logging
+
+from .servode import dxl_control, BAUDRATE_PERM
+from . import protocol1
+from .protocol1 import PacketBackend, Status, COMM_SUCCESS, COMM_RX_TIMEOUT
+
+log = logging.getLogger('servode.emulator')
+log.addHandler(logging.NullHandler())
+
+AX_12_MODEL_NUMBER = 12
+AX_12_FIRMWARE = 24
+TABLE_SIZE = 50  # bytes of an AX-12 control table
+
+RANGE_ERROR = 0x08  # status error bit of an instruction out of range
+
+BITS_PER_BYTE = 10  # a start bit, eight data bits and a stop bit
+RETURN_DELAY_UNIT = 0.000002  # seconds per unit of the return_delay register
+
+UNITS_PER_SPEED = 0.111 * 6 * 1024 / 300.0  # positions/s per moving_speed
+MAX_SPEED = 1023  # a moving_speed of 0 moves at the fastest speed
+WHEEL_CW = 1024  # moving_speed bit set to turn clockwise in wheel mode
+
+AX_12_DEFAULTS = {
+    "model_number": AX_12_MODEL_NUMBER,
+    "firmware_version": AX_12_FIRMWARE,
+    "baud_rate": 1,
+    "return_delay": 250,
+    "cw_angle_limit": 0,
+    "ccw_angle_limit": 1023,
+    "highest_limit_temperature": 70,
+    "lowest_limit_voltage": 60,
+    "highest_limit_voltage": 140,
+    "max_torque": 1023,
+    "status_return_level": 2,
+    "alarm_LED": 36,
+    "alarm_shutdown": 36,
+    "cw_compliance_margin": 1,
+    "ccw_compliance_margin": 1,
+    "cw_compliance_slope": 32,
+    "ccw_compliance_slope": 32,
+    "goal_position": 512,
+    "torque_limit": 1023,
+    "present_position": 512,
+    "present_voltage": 120,
+    "present_temperature": 32,
+    "punch": 32
+}
+
+
+class EmulatedServo(object):
+    """
+    The control table and motion of one emulated AX-12.
+    """
+
+    def __init__(self, servo_id):
+        super(EmulatedServo, self).__init__()
+        self.table = bytearray(TABLE_SIZE)
+        for register, value in AX_12_DEFAULTS.items():
+            self._set(register, value)
+        self._set("ID", servo_id)
+        self._position = float(self._get("present_position"))
+        self._updated = time.time()
+
+    def _get(self, register):
+        address = dxl_control[register]['address']
+        value = self.table[address]
+        if dxl_control[register]['comm_bytes'] == 2:
+            value |= self.table[address + 1] << 8
+        return value
+
+    def _set(self, register, value):
+        address = dxl_control[register]['address']
+        self.table[address] = value & 0xFF
+        if dxl_control[register]['comm_bytes'] == 2:
+            self.table[address + 1] = (value >> 8) & 0xFF
+
+    @property
+    def servo_id(self):
+        return self._get("ID")
+
+    @property
+    def wheel_mode(self):
+        return self._get("cw_angle_limit") == 0 and \
+            self._get("ccw_angle_limit") == 0
+
+    def update(self, now=None):
+        """
+        Move the servo for the time since it was last updated.
+        """
+        if now is None:
+            now = time.time()
+        elapsed = now - self._updated
+        self._updated = now
+
+        speed = self._get("moving_speed")
+        moving = False
+        present_speed = 0
+        if self.wheel_mode:
+            wheel_speed = speed & MAX_SPEED
+            if self._get("torque_enable") and wheel_speed > 0:
+                step = wheel_speed * UNITS_PER_SPEED * elapsed
+                if speed & WHEEL_CW:
+                    step = -step
+                self._position = (self._position + step) % (MAX_SPEED + 1)
+                moving = True
+                present_speed = speed
+        elif self._get("torque_enable"):
+            if speed == 0:
+                speed = MAX_SPEED
+            goal = self._get("goal_position")
+            distance = goal - self._position
+            step = min(abs(distance), speed * UNITS_PER_SPEED * elapsed)
+            if distance < 0:
+                self._position -= step
+            else:
+                self._position += step
+            moving = self._position != goal
+            if moving:
+                present_speed = speed
+                if distance < 0:
+                    present_speed |= WHEEL_CW
+
+        self._set("present_position", int(round(self._position)))
+        self._set("present_speed", present_speed)
+        self._set("moving", 1 if moving else 0)
+
+    def read(self, address, length):
+        """
+        Read bytes of the control table.
+
+        :return: the bytes read and the status error
+        """
+        if address + length > TABLE_SIZE:
+            return bytearray(length), RANGE_ERROR
+        self.update()
+        return self.table[address:address + length], 0
+
+    def write(self, address, data):
+        """
+        Write bytes of the control table. Read-only registers keep their
+        values.
+
+        :return: the status error
+        """
+        if address + len(data) > TABLE_SIZE:
+            return RANGE_ERROR
+        self.update()
+        for register in dxl_control:
+            reg_address = dxl_control[register]['address']
+            comm_bytes = dxl_control[register]['comm_bytes']
+            if not address <= reg_address < address + len(data):
+                continue
+            if dxl_control[register]['access'] == "r":
+                continue
+            offset = reg_address - address
+            self.table[reg_address:reg_address + comm_bytes] = \
+                data[offset:offset + comm_bytes]
+            if register == "goal_position":
+                # an AX-12 enables its torque when given a goal
+                self._set("torque_enable", 1)
+        return 0
+
+    def reset(self):
+        """
+        Return the control table to its factory settings, keeping the ID.
+        """
+        servo_id = self.servo_id
+        self.__init__(servo_id)
+
+
+class BusEmulator(PacketBackend):
+    """
+    A bus of emulated AX-12 servos. As a `PacketBackend` it provides the
+    DynamixelSDK functions `ServoProtocol` calls, so a `BusEmulator` can be
+    given to a `ServoProtocol` as its backend.
+    """
+
+    def __init__(self, servo_ids, baud_rate=BAUDRATE_PERM, realtime=True):
+        """
+
+        :param servo_ids: the IDs of the servos on the bus
+        :param baud_rate: the baud rate of the bus until `setBaudRate`
+        :param realtime: when True each transaction takes as long as it would
+            on the wire, otherwise the wire time is only counted
+        """
+        super(BusEmulator, self).__init__()
+        self.servos = dict()
+        for servo_id in servo_ids:
+            self.servos[servo_id] = EmulatedServo(servo_id)
+        self.baud_rate = baud_rate
+        self.realtime = realtime
+        self.packets = 0
+        self.wire_time = 0.0
+
+    def _transfer(self, instruction, status=None, servo=None):
+        """
+        Account for an instruction packet and, from a servo, its status packet.
+
+        :return: the seconds the transfer took on the wire
+        """
+        wire_bytes = len(instruction)
+        self.packets += 1
+        seconds = 0.0
+        if status is not None:
+            wire_bytes += len(status)
+            self.packets += 1
+            seconds += servo._get("return_delay") * RETURN_DELAY_UNIT
+        seconds += wire_bytes * BITS_PER_BYTE / float(self.baud_rate)
+        self.wire_time += seconds
+        if self.realtime:
+            time.sleep(seconds)
+        return seconds
+
+    def _renumber(self):
+        # a write to the ID register moves the servo to its new ID
+        for servo_id, servo in list(self.servos.items()):
+            if servo.servo_id != servo_id:
+                del self.servos[servo_id]
+                self.servos[servo.servo_id] = servo
+
+    def respond(self, instruction):
+        """
+        Carry out an instruction packet.
+
+        :return: the status packet, or None when no servo answers
+        """
+        with self.lock:
+            servo_id, code, params = protocol1.decode(instruction)
+            if code == protocol1.SYNC_WRITE:
+                address, length = params[0], params[1]
+                for i in range(2, len(params), length + 1):
+                    servo = self.servos.get(params[i])
+                    if servo is not None:
+                        servo.write(address, params[i + 1:i + 1 + length])
+                self._renumber()
+                self._transfer(instruction)
+                return None
+
+            servo = self.servos.get(servo_id)
+            if servo is None:
+                # the instruction is sent but no status comes back
+                self._transfer(instruction)
+                return None
+            data = bytearray()
+            error = 0
+            if code == protocol1.READ_DATA:
+                data, error = servo.read(params[0], params[1])
+            elif code == protocol1.WRITE_DATA:
+                error = servo.write(params[0], params[1:])
+                self._renumber()
+            elif code == protocol1.RESET:
+                servo.reset()
+            elif code != protocol1.PING:
+                error = protocol1.INSTRUCTION_ERROR
+            status = protocol1.encode(servo_id, error, data)
+            self._transfer(instruction, status, servo)
+            return status
+
+    def transact(self, instructions):
+        statuses = list()
+        with self.lock:
+            for instruction in instructions:
+                servo_id = instruction[2]
+                status = self.respond(instruction)
+                if status is None:
+                    result = COMM_SUCCESS
+                    if servo_id != protocol1.BROADCAST_ID:
+                        result = COMM_RX_TIMEOUT
+                    statuses.append(Status(servo_id, 0, bytearray(), result))
+                else:
+                    _, error, params = protocol1.decode(status)
+                    statuses.append(
+                        Status(servo_id, error, params, COMM_SUCCESS))
+        return statuses
+
+    def serve(self, fd, should_run):
+        """
+        Answer the instruction packets arriving on a file descriptor, such as
+        the slave of a pty, until `should_run` is cleared.
+
+        :param fd: the file descriptor
+        :param should_run: a `threading.Event` that keeps the emulator serving
+            while `is_set()` is True
+        """
+        while should_run.is_set():
+            instruction = protocol1.read_packet(fd, 0.1)
+            if instruction is None:
+                continue
+            try:
+                status = self.respond(instruction)
+            except protocol1.ProtocolError as pe:
+                log.error("[BusEmulator.serve] {0}".format(pe))
+                continue
+            if status is not None:
+                os.write(fd, bytes(status))
+
+    def setBaudRate(self, port_num, baud_rate):
+        self.baud_rate = baud_rate
+        return True
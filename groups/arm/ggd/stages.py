@@ -24,7 +24,6 @@ Note: At this point in time, tuning of an arm requires modifications to the
 servo values contained in this file.
 """
 import math
-import time
 import logging
 import argparse
 import threading
@@ -32,8 +31,20 @@ import numpy.ma as ma
 
 from decimal import Decimal, ROUND_HALF_UP
 from servo.servode import Servo, ServoGroup, ServoProtocol
+from servo.emulator import BusEmulator
 
 from image_processor import ImageProcessor
+from edges import THRESHOLDS
+import chroma
+import calibration
+import goal_table
+import kinematics
+from calibration import CALIBRATION_WIDTH, CALIBRATION_HEIGHT
+from debug_images import DebugImageWriter
+from tracker import CentroidTracker
+from change_detector import ChangeDetector
+from vision_worker import VisionWorker
+from frame_source import PiCameraSource, DirectorySource, SyntheticSource
 from . import arm_servo_ids
 
 log = logging.getLogger('stages')
@@ -52,10 +63,16 @@ HOME_TIBIA = 420  # servo value of the 'home' position of the tibia
 OPEN_EFFECTOR = 500  # servo value of the 'open' position of the end effector
 GRAB_EFFECTOR = 290  # servo value of 'grab' position of the end effector
 POSITION_MARGIN = 75  # how close does the servo need to get the goal position
+EFFECTOR_MARGIN = 10  # how close the effector needs to get, for short moves
+MOTION_TIMEOUT = 5  # most seconds to wait for the servos to finish a motion
+NORMAL_SPEED = 200  # moving speed of the farthest travelling servo of a move
+PICK_SPEED = 140  # slower moving speed used to reach down for an object
+SORT_SPEED = 150  # slower moving speed used to reduce dropped objects
 NO_BOX_FOUND = {'x': None, 'y': None}
 MIN_OBJECT_SIZE = 200  # smallest object to try to pickup
-MAX_IMAGE_WIDTH = 96  # used for coordinate calculations and camera constraint
-MAX_IMAGE_HEIGHT = 96  # used for coordinate calculations and camera constraint
+MAX_IMAGE_WIDTH = 96  # default width of the frames used to find objects
+MAX_IMAGE_HEIGHT = 96  # default height of the frames used to find objects
+EMULATED_NOISE = 3.0  # sensor noise of the frames generated when emulating
 
 
 def cart2polar(x, y, degrees=True):
@@ -88,15 +105,83 @@ def polar2cart(rho, theta):
     return x, y
 
 
-def cartesian_goals(x, y):
+def min_object_size(width=MAX_IMAGE_WIDTH, height=MAX_IMAGE_HEIGHT):
+    """
+    The smallest object to try to pickup in frames of the given size.
+    """
+    # objects are found by their outlines, so their pixel count grows with
+    # the sides of the frame rather than its area
+    return MIN_OBJECT_SIZE * (width + height) // (
+        CALIBRATION_WIDTH + CALIBRATION_HEIGHT)
+
+
+def make_change_detector(width=MAX_IMAGE_WIDTH, height=MAX_IMAGE_HEIGHT):
+    """
+    Make a `ChangeDetector` suited to frames of the given size.
+    """
+    return ChangeDetector(min_size=min_object_size(width, height))
+
+
+def make_tracker(width=MAX_IMAGE_WIDTH, height=MAX_IMAGE_HEIGHT):
+    """
+    Make a `CentroidTracker` suited to frames of the given size.
+    """
+    return CentroidTracker(
+        min_size=min_object_size(width, height),
+        max_distance=12 * max(width, height) // CALIBRATION_WIDTH)
+
+
+def make_frame_source(width=MAX_IMAGE_WIDTH, height=MAX_IMAGE_HEIGHT,
+                      emulate=False, frames_dir=None):
+    """
+    Make the long-lived source of the frames objects are found in.
+
+    :param emulate: the servos are emulated, so there is no end-effector
+        camera and frames of a still box on the belt are generated instead
+        [default: False]
+    :param frames_dir: with `emulate`, use the frames recorded in this
+        directory, over and over, instead of generated frames
+        [default: None]
+    :return: a `FrameSource` of frames of the given size
+    """
+    if not emulate:
+        return PiCameraSource(width=width, height=height)
+    if frames_dir is not None:
+        return DirectorySource(frames_dir, width=width, height=height,
+                               loop=True)
+    return SyntheticSource(width=width, height=height, noise=EMULATED_NOISE,
+                           fixed=True)
+
+
+def calibration_coords(x, y, width=MAX_IMAGE_WIDTH, height=MAX_IMAGE_HEIGHT):
+    """
+    Scale X and Y found in a frame of the given size to the frame size the goal
+    calculations were tuned with.
+
+    :param x: x cartesian coordinate
+    :param y: y cartesian coordinate
+    :param width: the width of the frame the coordinates were found in
+    :param height: the height of the frame the coordinates were found in
+    :return: the scaled x, y
+    """
+    if width == CALIBRATION_WIDTH and height == CALIBRATION_HEIGHT:
+        return x, y
+    return (x * float(CALIBRATION_WIDTH) / width,
+            y * float(CALIBRATION_HEIGHT) / height)
+
+
+def cartesian_goals(x, y, width=MAX_IMAGE_WIDTH, height=MAX_IMAGE_HEIGHT):
     """
     Use a cartesian coordinate system to calculate goals from given X and Y
     values.
 
     :param x: x cartesian coordinate
     :param y: y cartesian coordinate
+    :param width: the width of the frame the coordinates were found in
+    :param height: the height of the frame the coordinates were found in
     :return: cartesian derived base, fibia, and tibia servo goal values
     """
+    x, y = calibration_coords(x, y, width, height)
     # Convert 2D X and Y into usable numbers
     two_d_y_as_float = float(y)
     two_d_y_as_percent = float(two_d_y_as_float / 100)
@@ -135,17 +220,21 @@ def cartesian_goals(x, y):
     return bg, fg, tg
 
 
-def polar_goals(x, y):
+def polar_goals(x, y, width=MAX_IMAGE_WIDTH, height=MAX_IMAGE_HEIGHT):
     """
     Use a polar coordinate system to calculate goals from given X and Y
     values.
 
     :param x: x cartesian coordinate
     :param y: y cartesian coordinate
+    :param width: the width of the frame the coordinates were found in
+    :param height: the height of the frame the coordinates were found in
     :return: polar coordinate derived base, fibia, and tibia servo goal values
     """
     if y < 0:
         raise ValueError("Cannot accept negative Y values.")
+    frame_x, frame_y = x, y
+    x, y = calibration_coords(x, y, width, height)
 
     # base servo value which represents 0 degrees. Strongly dependent upon
     # physical construction, servo installation and location of arm
@@ -153,10 +242,12 @@ def polar_goals(x, y):
     polar_180_deg = 810  # base servo value which represents 180 degrees
     polar_diff = polar_180_deg - polar_axis
 
-    x_shift = Decimal(MAX_IMAGE_WIDTH / 2).quantize(
+    x_shift = Decimal(CALIBRATION_WIDTH / 2).quantize(
         exp=Decimal('1.0'), rounding=ROUND_HALF_UP)
     log.info("[polar_goals] x_shift:{0}".format(x_shift))
     # shift origin of x, y to center of base
+    if isinstance(x, float):
+        x_shift = float(x_shift)
     shifted_x = x - x_shift
     log.info("[polar_goals] new_x:{0} new_y:{1}".format(shifted_x, y))
 
@@ -178,7 +269,7 @@ def polar_goals(x, y):
     if bg < polar_axis:
         bg = polar_axis
 
-    bg_cart, fg, tg = cartesian_goals(x, y)
+    bg_cart, fg, tg = cartesian_goals(frame_x, frame_y, width, height)
     # Return polar coordinates for base and cartesian for arm goals. We found
     # this combination to work best through experimentation over hours of
     # operation.
@@ -186,30 +277,148 @@ def polar_goals(x, y):
 
 
 class ArmStages(object):
-    def __init__(self, servo_group):
+    def __init__(self, servo_group, debug_writer=None, frame_source=None,
+                 tracker=None, image_width=MAX_IMAGE_WIDTH,
+                 image_height=MAX_IMAGE_HEIGHT, coarse_scale=1,
+                 vision_worker=None, change_detector=None, threshold='fixed',
+                 chroma_table=None, remap_table=None, goals=None,
+                 geometry=None):
+        """
+
+        :param servo_group: the `ServoGroup` of the arm's five servos
+        :param debug_writer: a started `DebugImageWriter` that will save the
+            images processed while finding objects. [default: None]
+        :param frame_source: the long-lived frame source, such as a
+            `PiCameraSource`, used to find objects. [default: None, a camera is
+            opened for each find]
+        :param tracker: a long-lived `CentroidTracker` that follows the object
+            found from one find to the next. An object is only reported once
+            its track is confirmed. [default: None, objects are not tracked]
+        :param image_width: the width of the frames used to find objects
+        :param image_height: the height of the frames used to find objects
+        :param coarse_scale: find objects in frames this many times smaller
+            before refining their position at full size. [default: 1, find
+            objects at full size]
+        :param vision_worker: a started `VisionWorker` that finds objects in
+            another process. Its frame size, coarse scale, tracker and change
+            detector are used instead of this object's. [default: None,
+            objects are found in this process]
+        :param change_detector: a long-lived `ChangeDetector` that skips the
+            frames of a static, empty scene. Its counters are added to the
+            results of a find. [default: None, every frame is processed]
+        :param threshold: how the edge threshold of each frame is chosen,
+            'fixed', 'otsu' or 'percentile'. [default: 'fixed']
+        :param chroma_table: a chroma table of the box colour used to find
+            objects by colour instead of by their edges. [default: None]
+        :param remap_table: a remap table of the frame size, see
+            `calibration`, that corrects the coordinates of the objects found
+            before they are picked. [default: None, coordinates are only
+            scaled to the calibration frame]
+        :param goals: a goal table, see `goal_table`, from which the goals of
+            a pick are looked up when it was built for the size of the frame
+            the object was found in. Build it with the remap table when there
+            is one. [default: None, goals are calculated for each pick]
+        :param geometry: the `ArmGeometry` measured for the arm, see
+            `kinematics.load_geometry`. Without a goal table, the goals of a
+            pick are then solved by inverse kinematics and a pick that cannot
+            be reached is not attempted. [default: None, the goals are
+            interpolated by `cartesian_goals` or `polar_goals`]
+        """
         super(ArmStages, self).__init__()
         self.sg = servo_group
+        self.debug_writer = debug_writer
+        self.frame_source = frame_source
+        self.tracker = tracker
+        self.image_width = image_width
+        self.image_height = image_height
+        self.coarse_scale = coarse_scale
+        self.change_detector = change_detector
+        self.threshold = threshold
+        self.chroma_table = chroma_table
+        self.vision_worker = vision_worker
+        if vision_worker is not None:
+            self.image_width = vision_worker.width
+            self.image_height = vision_worker.height
+            self.tracker = vision_worker.tracker
+            self.change_detector = vision_worker.change_detector
+        self.min_object_size = min_object_size(self.image_width,
+                                               self.image_height)
+        if remap_table is not None and remap_table.shape[:2] != (
+                self.image_height, self.image_width):
+            raise ValueError("Remap table is {0}x{1} not {2}x{3}".format(
+                remap_table.shape[1], remap_table.shape[0],
+                self.image_width, self.image_height))
+        if geometry is kinematics.DEFAULT_GEOMETRY:
+            raise ValueError("The nominal geometry does not match the arm, "
+                             "use the geometry measured for it")
+        self.remap_table = remap_table
+        self.goals = goals
+        self.geometry = geometry
+
+    def _move(self, goal_positions, should_run=None, max_speed=NORMAL_SPEED,
+              margin=POSITION_MARGIN):
+        """
+        Move the arm and wait until it has finished moving.
+
+        :param goal_positions: the goal position of each servo
+        :param should_run: a `threading.Event` that interrupts the wait when
+            cleared [default: None, the wait is not interrupted]
+        :return: True if the arm finished moving, False if the wait timed out
+            or was interrupted
+        """
+        self.sg.move(goal_positions, max_speed=max_speed)
+        # wait here, as a blocking move would clear should_run once arrived
+        return self.sg.wait_for_motion(goal_positions, margin=margin,
+                                       timeout=MOTION_TIMEOUT,
+                                       should_run=should_run)
+
+    def _move_effector(self, goal, speed=NORMAL_SPEED, should_run=None):
+        """
+        Move the end effector and wait until it has finished moving, which it
+        also has when it closes on an object short of the goal. The effector's
+        moves are short, so it must get closer to its goal than the arm.
+
+        :return: see `_move`
+        """
+        # the last planned move may have left the effector moving slowly
+        self.sg['effector']['moving_speed'] = speed
+        self.sg['effector']['goal_position'] = goal
+        return self.sg.wait_for_motion({'effector': goal},
+                                       margin=EFFECTOR_MARGIN,
+                                       timeout=MOTION_TIMEOUT,
+                                       should_run=should_run)
+
+    @staticmethod
+    def _unfinished(stage, motion, should_run, stage_results):
+        """
+        Record in the stage results a motion that did not finish.
+
+        :return: the stage results
+        """
+        if should_run is not None and not should_run.is_set():
+            log.info("[{0}] interrupted during:{1}".format(stage, motion))
+            stage_results['interrupted'] = motion
+        else:
+            log.error("[{0}] timed out during:{1}".format(stage, motion))
+            stage_results['timed_out'] = motion
+        return stage_results
 
     def stage_stop(self):
         log.info("[stage_stop] _begin_")
 
-        self.sg.goal_position([
+        self._move([
             512,  # first servo value
             500,  # second servo value
             500,  # third servo value
             135,  # fourth servo value
             OPEN_EFFECTOR  # fifth servo value
-        ], block=True, margin=POSITION_MARGIN)
+        ])
 
         # add little sleepy motion in end effector for fun
-        self.sg['effector']['goal_position'] = GRAB_EFFECTOR
-        time.sleep(0.4)
-        self.sg['effector']['goal_position'] = GRAB_EFFECTOR + 100
-        time.sleep(0.4)
-        self.sg['effector']['goal_position'] = GRAB_EFFECTOR
-        time.sleep(0.4)
-        self.sg['effector']['goal_position'] = GRAB_EFFECTOR + 30
-        time.sleep(0.4)
+        self._move_effector(GRAB_EFFECTOR)
+        self._move_effector(GRAB_EFFECTOR + 100)
+        self._move_effector(GRAB_EFFECTOR)
+        self._move_effector(GRAB_EFFECTOR + 30)
         self.sg['effector']['goal_position'] = GRAB_EFFECTOR
 
         log.info("[stage_stop] _end_")
@@ -230,45 +439,92 @@ class ArmStages(object):
             return stage_results
 
         # start at the middle-out position for all servos
-        self.sg.goal_position([
+        if not self._move([
             HOME_BASE,  # first servo value
             HOME_FEMUR_1,  # second servo value
             HOME_FEMUR_2,  # third servo value
             HOME_TIBIA,  # fourth servo value
             OPEN_EFFECTOR  # fifth servo value
-        ], block=True, margin=POSITION_MARGIN)
+        ], should_run):
+            return self._unfinished('stage_home', 'home', should_run,
+                                    stage_results)
 
         stage_results['reached_home'] = True
         log.info("[stage_home] _end_")
         return stage_results
 
-    def stage_find(self, should_run=None):
+    def stage_find(self, should_run=None, stream=False):
         """
         The arm is actively using the end-effector camera to find objects of the
         correct size.
 
         :param should_run: a `threading.Event` that tells the stage to continue
             if `is_set()` is True
-        :return: a dict containing this stage's results
+        :param stream: process frames continuously from the camera and return
+            as soon as an object is found or `should_run` is cleared.
+            [default: False, process a single frame]
+        :return: a dict containing this stage's results. A found object is
+            described by its 'x', 'y' and the features of `PixelObject`.
         """
         log.info("[stage_find] _begin_")
         r = dict()
 
-        ip = ImageProcessor(res_width=MAX_IMAGE_WIDTH,
-                            res_height=MAX_IMAGE_HEIGHT)
-        ip.capture_frame()
+        if self.vision_worker is not None:
+            ip = self.vision_worker.processor(source=self.frame_source)
+        else:
+            ip = ImageProcessor(res_width=self.image_width,
+                                res_height=self.image_height,
+                                debug_writer=self.debug_writer,
+                                source=self.frame_source,
+                                tracker=self.tracker,
+                                coarse_scale=self.coarse_scale,
+                                change_detector=self.change_detector,
+                                threshold=self.threshold,
+                                chroma_table=self.chroma_table)
+        if stream:
+            frames = ip.stream_frames()
+            for max_pixel_count in frames:
+                if (max_pixel_count > self.min_object_size and
+                        self._confirmed()):
+                    break
+                if should_run is not None and not should_run.is_set():
+                    break
+            frames.close()
+        else:
+            ip.capture_frame()
+            # a newly tracked object must be seen again before it is reported
+            for _ in range(1, self._needed_hits()):
+                if (ip.max_pixel_count <= self.min_object_size or
+                        self._confirmed()):
+                    break
+                ip.capture_frame()
 
         log.info('[stage_find] max_pixel_count is:{0}'.format(
             ip.max_pixel_count))
+        if self.change_detector is not None:
+            r.update(self.change_detector.counters())
+            log.info("[stage_find] frames processed:{0} skipped:{1}".format(
+                r['frames_processed'], r['frames_skipped']))
         # check to see if the image processor found an object that is larger
         # than the minimum object size we want to try to pickup
-        if ip.max_pixel_count > MIN_OBJECT_SIZE:
+        if ip.max_pixel_count > self.min_object_size and self._confirmed():
             print('largest object is:{0}'.format(ip.largest_object_id))
             print('largest object X coord is:{0}'.format(ip.largest_X))
             print('largest object Y coord is:{0}'.format(ip.largest_Y))
             r['x'] = ip.largest_X
             r['y'] = ip.largest_Y
+            r['width'] = self.image_width
+            r['height'] = self.image_height
             r['filename'] = ip.filename
+            if self.remap_table is not None:
+                r['calibrated_x'], r['calibrated_y'] = calibration.remap(
+                    self.remap_table, ip.largest_X, ip.largest_Y)
+            # the shape of the object, gathered while it was labelled
+            r.update(ip.largest_features())
+            if self.tracker is not None:
+                r['track_id'] = self.tracker.track.id_
+                r['track_hits'] = self.tracker.track.hits
+                r['roi'] = ip.roi
             log.info("[stage_find] found object at x:{0} y:{1}".format(
                 r['x'], r['y']))
             ip.close()
@@ -278,11 +534,20 @@ class ArmStages(object):
             # did not find an object larger than the minimum size - return
             # NO_BOX_FOUND
             log.info("[stage_find] no object larger than:{0}".format(
-                MIN_OBJECT_SIZE))
+                self.min_object_size))
             ip.close()
             log.info("[stage_find] _end_")
+            if self.change_detector is not None:
+                r.update(NO_BOX_FOUND)
+                return r
             return NO_BOX_FOUND
 
+    def _confirmed(self):
+        return self.tracker is None or self.tracker.confirmed
+
+    def _needed_hits(self):
+        return 1 if self.tracker is None else self.tracker.min_hits
+
     def stage_pick(self, should_run=None,
                    cli=None, previous_results=None, cartesian=True):
         """
@@ -301,6 +566,8 @@ class ArmStages(object):
 
         stage_results = dict()
         x = y = 0
+        width = self.image_width
+        height = self.image_height
 
         # if value is received from the CLI, use that as pickup goal target
         if cli is not None:
@@ -313,17 +580,58 @@ class ArmStages(object):
         if previous_results is not None:
             x = previous_results['x']
             y = previous_results['y']
-
-        if cartesian:
+            width = previous_results.get('width', width)
+            height = previous_results.get('height', height)
+            if previous_results.get('orientation') is not None:
+                log.info("[stage_pick] area:{0} orientation:{1:.1f}".format(
+                    previous_results['area'],
+                    previous_results['orientation']))
+                stage_results['area'] = previous_results['area']
+                stage_results['orientation'] = previous_results['orientation']
+
+        table_goals = None
+        if (self.goals is not None and
+                goal_table.frame_size(self.goals) == (width, height)):
+            # the goals of every pixel were calculated when the table was built
+            table_goals = goal_table.lookup(self.goals, x, y, cartesian)
+        elif (previous_results is not None and
+                previous_results.get('calibrated_x') is not None):
+            # the coordinates were corrected into the calibration frame
+            x = previous_results['calibrated_x']
+            y = previous_results['calibrated_y']
+            width = CALIBRATION_WIDTH
+            height = CALIBRATION_HEIGHT
+
+        if table_goals is not None:
+            base_goal, femur_goal, tibia_goal = table_goals
+            log.info("[stage_pick] x:{0} y:{1} table base:{2} femur:{3} "
+                     "tibia:{4}".format(x, y, base_goal, femur_goal,
+                                        tibia_goal))
+        elif self.geometry is not None:
+            goals, reachable = kinematics.pixel_goals(
+                *calibration_coords(x, y, width, height),
+                geometry=self.geometry)
+            base_goal, femur_goal, tibia_goal = goals[0].tolist()
+            log.info("[stage_pick] x:{0} y:{1} ik base:{2} femur:{3} "
+                     "tibia:{4}".format(x, y, base_goal, femur_goal,
+                                        tibia_goal))
+            if not reachable[0]:
+                log.error("[stage_pick] x:{0} y:{1} cannot be reached".format(
+                    x, y))
+                stage_results['unreachable'] = True
+                return stage_results
+        elif cartesian:
             # use cartesian coordinates to calculate goals
             log.info("[stage_pick] x:{0} y:{1} cartesian pickup".format(x, y))
-            base_goal, femur_goal, tibia_goal = cartesian_goals(x, y)
+            base_goal, femur_goal, tibia_goal = cartesian_goals(
+                x, y, width, height)
             log.info("[stage_pick] cart base:{0} femur:{1} tibia:{2}".format(
                 base_goal, femur_goal, tibia_goal))
         else:
             # use polar coordinates to calculate goals
             log.info("[stage_pick] x:{0} y:{1} polar pickup".format(x, y))
-            base_goal, femur_goal, tibia_goal = polar_goals(x, y)
+            base_goal, femur_goal, tibia_goal = polar_goals(
+                x, y, width, height)
             log.info(
                 "[stage_pick] polar base:{0} femur:{1} tibia:{2}".format(
                     base_goal, femur_goal, tibia_goal))
@@ -336,44 +644,47 @@ class ArmStages(object):
 
         # OPEN EFFECTOR/CLAW
         #####################################################
-        self.sg.goal_position([
+        if not self._move([
             HOME_BASE,
             HOME_FEMUR_1,
             HOME_FEMUR_2,
             HOME_TIBIA,
             OPEN_EFFECTOR
-        ], block=False, margin=POSITION_MARGIN)
-        time.sleep(.5)
+        ], should_run):
+            return self._unfinished('stage_pick', 'open', should_run,
+                                    stage_results)
 
         # go to PICK READY location
         ######################################################
-        self.sg.goal_position([
+        if not self._move([
             base_goal,
             HOME_FEMUR_1,
             HOME_FEMUR_2,
             HOME_TIBIA,
             OPEN_EFFECTOR
-        ], block=False, margin=POSITION_MARGIN)
-        time.sleep(.5)
+        ], should_run):
+            return self._unfinished('stage_pick', 'ready', should_run,
+                                    stage_results)
 
-        self.sg.write_values("moving_speed", [140, 140, 140, 140, 140])
         stage_results['slow_down'] = True
 
         # go to down-most open PICK location
         ######################################################
-        self.sg.goal_position([
+        if not self._move([
             base_goal,
             femur_goal,
             femur_goal,
             tibia_goal,
             OPEN_EFFECTOR
-        ], block=False, margin=POSITION_MARGIN)
-        time.sleep(.5)
+        ], should_run, max_speed=PICK_SPEED):
+            return self._unfinished('stage_pick', 'reach', should_run,
+                                    stage_results)
 
         # change effector to the GRAB location
         ######################################################
-        self.sg['effector']['goal_position'] = GRAB_EFFECTOR
-        time.sleep(.5)
+        if not self._move_effector(GRAB_EFFECTOR, PICK_SPEED, should_run):
+            return self._unfinished('stage_pick', 'grab', should_run,
+                                    stage_results)
 
         # TODO: ensure something has been grabbed using torque feedback
 
@@ -408,51 +719,49 @@ class ArmStages(object):
 
         # slow down the move speed of all servos to reduce dropped objects
         ######################################################
-        self.sg.write_values("moving_speed", [150, 150, 150, 150, 150])
         stage_results['slow_down'] = True
 
         # go to SORT "high" location
         ######################################################
-        self.sg.goal_position([
+        if not self._move([
             sort_base,  # first servo value
             HOME_FEMUR_1,  # second servo value
             HOME_FEMUR_2,  # third servo value
             sort_tibia,  # fourth servo value
             GRAB_EFFECTOR  # fifth servo value
-        ], block=False, margin=POSITION_MARGIN)
-        time.sleep(0.5)
+        ], should_run, max_speed=SORT_SPEED):
+            return self._unfinished('stage_sort', 'raise', should_run,
+                                    stage_results)
         stage_results['raise_complete'] = True
 
         # go to SORT "extended" location
         ######################################################
-        self.sg.goal_position([
+        if not self._move([
             sort_base,  # first servo value
             sort_femur_1,  # second servo value
             sort_femur_2,  # third servo value
             sort_tibia,  # fourth servo value
             GRAB_EFFECTOR  # fifth servo value
-        ], block=True, margin=POSITION_MARGIN + 15)
-        time.sleep(0.5)
+        ], should_run, max_speed=SORT_SPEED, margin=POSITION_MARGIN + 15):
+            return self._unfinished('stage_sort', 'reach', should_run,
+                                    stage_results)
         stage_results['reach_complete'] = True
 
         # open the end effector/claw to drop object
         ######################################################
-        self.sg['effector']['goal_position'] = OPEN_EFFECTOR
-        time.sleep(0.5)
+        if not self._move_effector(OPEN_EFFECTOR, SORT_SPEED, should_run):
+            return self._unfinished('stage_sort', 'drop', should_run,
+                                    stage_results)
 
-        # go to SORT "away" location
+        # go to SORT "away" location at the normal move speed
         ######################################################
-        self.sg.goal_position([
+        self.sg.move([
             sort_base,  # first servo value
             sort_femur_1 + 150,  # second servo value
             sort_femur_2 + 150,  # third servo value
             HOME_TIBIA,  # fourth servo value
             OPEN_EFFECTOR  # fifth servo value
-        ], block=False, margin=POSITION_MARGIN)
-
-        # increase move speed of all servos to normal
-        ######################################################
-        self.sg.write_values("moving_speed", [200, 200, 200, 200, 200])
+        ], max_speed=NORMAL_SPEED, block=False, margin=POSITION_MARGIN)
         stage_results['slow_down'] = False
 
         # the sort stage is now complete
@@ -475,12 +784,71 @@ def cli_home(servo_group, should_run, cli=None, previous_results=None):
 
 
 def cli_find(servo_group, should_run, cli=None, previous_results=None):
-    arm_stage = ArmStages(servo_group=servo_group)
-    arm_stage.stage_find(should_run)
+    debug_writer = None
+    if cli is not None and cli.debug_images and not cli.worker:
+        debug_writer = DebugImageWriter()
+        debug_writer.start()
+
+    tracker = None
+    if cli is not None and cli.track:
+        tracker = make_tracker(cli.width, cli.height)
+
+    change_detector = None
+    if cli is not None and cli.skip_static:
+        change_detector = make_change_detector(cli.width, cli.height)
+
+    chroma_table = None
+    if cli is not None and cli.chroma_table is not None:
+        chroma_table = chroma.load_table(cli.chroma_table)
+
+    remap_table = None
+    if cli is not None and cli.remap_table is not None:
+        remap_table = calibration.load_table(cli.remap_table)
+
+    vision_worker = None
+    if cli is not None and cli.worker:
+        vision_worker = VisionWorker(
+            width=cli.width, height=cli.height,
+            coarse_scale=cli.coarse_scale, tracker=tracker,
+            change_detector=change_detector, debug_images=cli.debug_images,
+            threshold=cli.threshold, chroma_table=chroma_table)
+        vision_worker.start()
+
+    frame_source = None
+    if cli is not None and cli.emulate:
+        frame_source = make_frame_source(cli.width, cli.height, emulate=True,
+                                         frames_dir=cli.frames_dir)
+
+    arm_stage = ArmStages(servo_group=servo_group, debug_writer=debug_writer,
+                          frame_source=frame_source,
+                          tracker=tracker, image_width=cli.width,
+                          image_height=cli.height,
+                          coarse_scale=cli.coarse_scale,
+                          vision_worker=vision_worker,
+                          change_detector=change_detector,
+                          threshold=cli.threshold,
+                          chroma_table=chroma_table,
+                          remap_table=remap_table)
+    find_res = arm_stage.stage_find(should_run, stream=cli.stream)
+
+    if frame_source is not None:
+        frame_source.close()
+    if vision_worker is not None:
+        vision_worker.close()
+    if debug_writer is not None:
+        debug_writer.close()
+    return find_res
 
 
 def cli_pick(servo_group, should_run, cli=None, previous_results=None):
-    arm_stage = ArmStages(servo_group=servo_group)
+    goals = None
+    if cli is not None and cli.goal_table is not None:
+        goals = goal_table.load_table(cli.goal_table)
+    geometry = None
+    if cli is not None and cli.kinematics:
+        geometry = kinematics.load_geometry(cli.geometry)
+    arm_stage = ArmStages(servo_group=servo_group, goals=goals,
+                          geometry=geometry)
     arm_stage.stage_pick(should_run, cli, previous_results)
 
 
@@ -498,6 +866,12 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser(
         description='Mini Fulfillment Arm stages - command line interface',
         formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--emulate', action='store_true',
+                        help="Drive emulated servos instead of the servo bus, "
+                             "and find objects in generated frames.")
+    parser.add_argument('--frames_dir',
+                        help="With --emulate, find objects in the frames "
+                             "recorded in this directory.")
     subparsers = parser.add_subparsers()
 
     home_parser = subparsers.add_parser(
@@ -509,6 +883,36 @@ if __name__ == '__main__':
         'find',
         description='Tell arm to FIND a box.'
     )
+    find_parser.add_argument('--debug_images', action='store_true',
+                             help="Save the processed images to 'img/'.")
+    find_parser.add_argument('--stream', action='store_true',
+                             help="Stream frames until a box is found.")
+    find_parser.add_argument('--track', action='store_true',
+                             help="Only report a box seen in consecutive "
+                                  "frames.")
+    find_parser.add_argument('--width', default=MAX_IMAGE_WIDTH, type=int,
+                             help="The width of the captured frames.")
+    find_parser.add_argument('--height', default=MAX_IMAGE_HEIGHT, type=int,
+                             help="The height of the captured frames.")
+    find_parser.add_argument('--coarse_scale', default=1, type=int,
+                             help="Find boxes in frames this many times "
+                                  "smaller, then refine at full size.")
+    find_parser.add_argument('--worker', action='store_true',
+                             help="Find boxes in a separate process.")
+    find_parser.add_argument('--skip_static', action='store_true',
+                             help="Skip frames while the scene is static and "
+                                  "empty.")
+    find_parser.add_argument('--threshold', default='fixed',
+                             choices=THRESHOLDS,
+                             help="How the edge threshold of each frame is "
+                                  "chosen.")
+    find_parser.add_argument('--chroma_table',
+                             help="Find boxes by their colour using the "
+                                  "chroma table in this '.npy' file.")
+    find_parser.add_argument('--remap_table',
+                             help="Correct the coordinates of the box found "
+                                  "with the remap table in this '.npy' "
+                                  "file.")
     find_parser.set_defaults(func=cli_find)
 
     pick_parser = subparsers.add_parser(
@@ -521,6 +925,14 @@ if __name__ == '__main__':
                              help="The 'Y' coordinate to pickup a box.")
     pick_parser.add_argument('--polar', action='store_true',
                              help="Use polar coordinates to pickup a box.")
+    pick_parser.add_argument('--goal_table',
+                             help="Look up the goals in the goal table in "
+                                  "this '.npy' file.")
+    pick_parser.add_argument('--kinematics', action='store_true',
+                             help="Solve the goals by inverse kinematics.")
+    pick_parser.add_argument('--geometry',
+                             help="The JSON file of the measured geometry of "
+                                  "the arm, needed by --kinematics.")
     pick_parser.set_defaults(func=cli_pick)
 
     sort_parser = subparsers.add_parser(
@@ -530,8 +942,14 @@ if __name__ == '__main__':
     sort_parser.set_defaults(func=cli_sort)
 
     args = parser.parse_args()
+    if getattr(args, 'kinematics', False) and args.geometry is None:
+        parser.error("--kinematics needs the --geometry of the arm")
+
+    backend = None
+    if args.emulate:
+        backend = BusEmulator(arm_servo_ids)
 
-    with ServoProtocol() as sp:
+    with ServoProtocol(backend=backend) as sp:
         sg = ServoGroup()
         sg['base'] = Servo(sp, arm_servo_ids[0])
         sg['femur01'] = Servo(sp, arm_servo_ids[1])
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+
+# Copyright 2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You may not
+# use this file except in compliance with the License. A copy of the License is
+# located at
+#     http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is distributed on
+# an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+# express or implied. See the License for the specific language governing
+# permissions and limitations under the License.
+
+"""
+Centroid tracking of the largest object found by the `ImageProcessor`.
+
+The tracker follows one object from frame to frame. A detection whose centroid
+is close to the tracked object's last centroid continues the same track and
+keeps its id. A distant detection starts a new track, so a single noisy frame
+cannot move the arm. A track becomes confirmed once it has been seen in enough
+frames and is dropped after too many frames without a detection.
+
+While a track is alive the tracker gives the region of interest, the padded
+bounding box of the tracked object, in which the next frame is searched first.
+"""
+import math
+import logging
+
+log = logging.getLogger('tracker')
+log.addHandler(logging.NullHandler())
+
+
+class Track(object):
+    """
+    An object followed across frames.
+    """
+    __slots__ = ('id_', 'x', 'y', 'bbox', 'size', 'hits', 'missed')
+
+    def __init__(self, id_, obj):
+        self.id_ = id_
+        self.hits = 0
+        self.missed = 0
+        self.see(obj)
+
+    def see(self, obj):
+        self.x = obj.coord_x
+        self.y = obj.coord_real_y
+        self.bbox = obj.bbox
+        self.size = obj.numberOfPixels
+        self.hits += 1
+        self.missed = 0
+
+
+class CentroidTracker(object):
+    """
+    Tracker of the centroid of the largest object found in each frame.
+    """
+
+    def __init__(self, min_size=200, max_distance=12, min_hits=2,
+                 max_missed=3):
+        """
+
+        :param min_size: detections with this many pixels or fewer are misses
+        :param max_distance: the furthest in pixels the centroid may move
+            between frames and still be the same object
+        :param min_hits: the frames an object must be seen in before its track
+            is confirmed
+        :param max_missed: the frames in a row an object may be missed before
+            its track is dropped
+        """
+        super(CentroidTracker, self).__init__()
+        self.min_size = min_size
+        self.max_distance = max_distance
+        self.min_hits = min_hits
+        self.max_missed = max_missed
+        self.track = None
+        self.next_id = 1
+
+    @property
+    def confirmed(self):
+        return self.track is not None and self.track.hits >= self.min_hits
+
+    def is_detection(self, obj):
+        return obj is not None and obj.numberOfPixels > self.min_size
+
+    def update(self, obj):
+        """
+        Update the track with the largest object found in a frame.
+
+        :param obj: the largest `PixelObject` of the frame, or None
+        :return: the current `Track`, or None if no object is tracked
+        """
+        if not self.is_detection(obj):
+            if self.track is not None:
+                self.track.missed += 1
+                if self.track.missed >= self.max_missed:
+                    log.debug("[update] dropped track:{0}".format(
+                        self.track.id_))
+                    self.track = None
+            return self.track
+
+        if self.track is not None:
+            distance = math.hypot(obj.coord_x - self.track.x,
+                                  obj.coord_real_y - self.track.y)
+            if distance <= self.max_distance:
+                self.track.see(obj)
+                return self.track
+            log.debug("[update] track:{0} jumped:{1:.1f} pixels".format(
+                self.track.id_, distance))
+
+        self.track = Track(self.next_id, obj)
+        self.next_id += 1
+        log.debug("[update] new track:{0} at x:{1} y:{2}".format(
+            self.track.id_, self.track.x, self.track.y))
+        return self.track
+
+    def roi(self, margin, width, height):
+        """
+        The region of interest in which to look for the tracked object.
+
+        :param margin: the pixels added around the tracked object's bounding
+            box
+        :param width: the width of the frame
+        :param height: the height of the frame
+        :return: the region as (x0, y0, x1, y1) where x1 and y1 are excluded,
+            or None if no object is tracked
+        """
+        if self.track is None:
+            return None
+        min_x, min_y, max_x, max_y = self.track.bbox
+        return (max(min_x - margin, 0), max(min_y - margin, 0),
+                min(max_x + 1 + margin, width),
+                min(max_y + 1 + margin, height))
+
+    def reset(self):
+        self.track = None
@@ -0,0 +1,683 @@
+#!/usr/bin/env python
+
+# Copyright 2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You may not
+# use this file except in compliance with the License. A copy of the License is
+# located at
+#     http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is distributed on
+# an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+# express or implied. See the License for the specific language governing
+# permissions and limitations under the License.
+
+"""
+Benchmark suite of the arm's vision pipeline.
+
+This command-line has six commands:
+* `compare` - compare the reference pure-Python edge engine with the NumPy edge
+    engine on generated or recorded frames. The black and white masks of both
+    engines are checked to be bit-identical and the time taken by each engine
+    and by labelling is reported, followed by the frame rate of the whole
+    `ImageProcessor` when driven by the same frames.
+* `jitter` - measure how late a telemetry-like thread ticks while frames are
+    processed in the same process or by a `VisionWorker`
+* `golden` - generate a corpus of golden frames with known box centres
+* `suite` - run the `ImageProcessor` over a golden corpus and report, as JSON,
+    the wall time of each pipeline stage, the frame rate and the detection
+    accuracy against the known box centres. Given the report of an earlier
+    run, speed or accuracy regressions make the command fail.
+* `thresholds` - compare the fixed and adaptive edge thresholds on a golden
+    corpus, in each band of lighting, by detection rate, objects and spurious
+    objects per frame, frame time and the modelled latency of a find
+* `segmentation` - compare finding boxes by their edges with finding them by
+    their colour using a chroma table, in the same way as `thresholds`. The
+    corpus must be in colour, see the `--colour` option of `golden`.
+
+A golden corpus is a directory of frames readable by a `DirectorySource` and a
+'golden.json' file describing them:
+    { "width": 96, "height": 96,
+      "frames": [
+        { "file": "frame_0000.png", "boxes": [[x, y], ...] },
+        ...
+      ]
+    }
+where each box is the (x, y) pixel centre of a box in the frame, with y counted
+down from the top row. Recorded frames can be labelled by hand in the same
+format.
+
+The suite imports the arm's `stages`, so it is run as a module from the
+'groups' directory:
+    python -m arm.ggd.vision_bench suite corpus/ [--baseline report.json]
+
+To learn more about the command line type:
+`python -m arm.ggd.vision_bench --help`
+"""
+from __future__ import print_function
+
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+import numpy as np
+import png
+
+import edges
+import chroma
+import labeller
+from image_processor import ImageProcessor
+from frame_source import DirectorySource, SyntheticSource, yuv_to_rgb
+from vision_worker import VisionWorker
+from stages import min_object_size
+
+GOLDEN_FILE = 'golden.json'
+STAGES = ['coarse', 'segment', 'edge', 'fuse', 'threshold', 'dilate',
+          'label', 'centroid']
+MIN_TIMING_NOISE_MS = 0.05  # stages quicker than this cannot be timed apart
+LIGHTING_BANDS = [  # (name, lowest, highest) scene brightness of each band
+    ('dim', 0.0, 0.8),
+    ('normal', 0.8, 1.1),
+    ('bright', 1.1, float('inf'))
+]
+
+
+def make_source(cli):
+    """
+    Make the frame source described by the command line.
+    """
+    if cli.frames_dir is not None:
+        return DirectorySource(cli.frames_dir, width=cli.width,
+                               height=cli.height)
+    return SyntheticSource(width=cli.width, height=cli.height,
+                           box_size=(cli.width // 6, cli.width // 3),
+                           noise=cli.noise, seed=cli.seed, fixed=False)
+
+
+def run_engine(engine, luma):
+    """
+    Run the edge pipeline of the given engine over one frame.
+
+    :return: the black and white mask after white pixels have been spread
+    """
+    return engine.spread(
+        engine.black_and_white(
+            engine.fuse(engine.horizontal(luma), engine.vertical(luma))))
+
+
+def compare_engines(cli):
+    source = make_source(cli)
+    if isinstance(source, DirectorySource):
+        cli.frames = min(cli.frames, len(source))
+    frames = [source.capture() for _ in range(cli.frames)]
+    python_engine = edges.get_engine('python')
+    numpy_engine = edges.get_engine('numpy')
+
+    timings = {python_engine.name: 0.0, numpy_engine.name: 0.0,
+               'label': 0.0}
+    objects = 0
+    mismatches = 0
+    for luma in frames:
+        start = time.time()
+        expected = run_engine(python_engine, luma.tolist())
+        timings[python_engine.name] += time.time() - start
+
+        start = time.time()
+        actual = run_engine(numpy_engine, luma)
+        timings[numpy_engine.name] += time.time() - start
+
+        if not np.array_equal(np.asarray(expected, dtype=np.uint8), actual):
+            mismatches += 1
+
+        start = time.time()
+        objects += len(labeller.label_objects(actual))
+        timings['label'] += time.time() - start
+
+    for name in sorted(timings):
+        print("stage:{0:<6} frames:{1} total:{2:.4f}s "
+              "per_frame:{3:.6f}s".format(name, len(frames), timings[name],
+                                          timings[name] / len(frames)))
+    print("speedup:{0:.1f}x mismatched_frames:{1} "
+          "objects_per_frame:{2:.1f}".format(
+              timings['python'] / timings['numpy'], mismatches,
+              float(objects) / len(frames)))
+    return mismatches
+
+
+def processor_rate(cli):
+    source = make_source(cli)
+    if isinstance(source, DirectorySource):
+        source.loop = True
+    ip = ImageProcessor(res_width=cli.width, res_height=cli.height,
+                        source=source)
+    start = time.time()
+    for _ in range(cli.frames):
+        ip.capture_frame()
+    elapsed = time.time() - start
+    ip.close()
+    print("image_processor frames:{0} fps:{1:.1f}".format(
+        cli.frames, cli.frames / elapsed))
+
+
+def compare(cli):
+    if compare_engines(cli):
+        raise SystemExit("Edge engines produced different masks.")
+    processor_rate(cli)
+
+
+def _tick(period, should_run, lateness):
+    # tick every period like the telemetry thread and record how late it was
+    next_tick = time.time()
+    while should_run.is_set():
+        next_tick += period
+        delay = next_tick - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        lateness.append(time.time() - next_tick)
+
+
+def telemetry_jitter(cli):
+    """
+    Compare the lateness of a ticking thread while frames are processed in
+    this process and while they are processed by a worker process.
+    """
+    for mode in ('thread', 'worker'):
+        source = SyntheticSource(width=cli.width, height=cli.height,
+                                 box_size=(cli.width // 6, cli.width // 3),
+                                 noise=8.0, seed=cli.seed, fixed=False)
+        worker = None
+        if mode == 'worker':
+            worker = VisionWorker(width=cli.width, height=cli.height,
+                                  engine=cli.engine)
+            worker.start()
+            ip = worker.processor(source=source)
+        else:
+            ip = ImageProcessor(res_width=cli.width, res_height=cli.height,
+                                engine=cli.engine, source=source)
+
+        should_run = threading.Event()
+        should_run.set()
+        lateness = []
+        ticker = threading.Thread(target=_tick, name="ticker",
+                                  args=(1.0 / cli.frequency, should_run,
+                                        lateness))
+        ticker.start()
+        start = time.time()
+        for _ in range(cli.frames):
+            ip.capture_frame()
+        elapsed = time.time() - start
+        should_run.clear()
+        ticker.join()
+        if worker is not None:
+            worker.close()
+
+        late = _summary(lateness)
+        print("mode:{0:<6} fps:{1:.1f} ticks:{2} late_p50:{3:.2f}ms "
+              "late_p95:{4:.2f}ms late_max:{5:.2f}ms".format(
+                  mode, cli.frames / elapsed, len(lateness), late['p50_ms'],
+                  late['p95_ms'], late['max_ms']))
+
+
+def make_golden(cli):
+    """
+    Generate a golden corpus of synthetic frames under varied noise and
+    lighting.
+    """
+    if not os.path.isdir(cli.corpus_dir):
+        os.makedirs(cli.corpus_dir)
+
+    rs = np.random.RandomState(cli.seed)
+    golden = {"width": cli.width, "height": cli.height, "frames": []}
+    for n in range(cli.count):
+        noise = rs.uniform(0, cli.noise)
+        lighting = rs.uniform(cli.min_lighting, cli.max_lighting)
+        source = SyntheticSource(
+            width=cli.width, height=cli.height,
+            box_size=(cli.width // 6, cli.width // 3),
+            noise=noise, lighting=lighting,
+            gradient=rs.uniform(0, cli.gradient),
+            seed=rs.randint(2 ** 31 - 1))
+        luma = source.capture()
+        name = 'frame_{0:04d}.png'.format(n)
+        if cli.colour:
+            rgb = yuv_to_rgb(luma, *source.chroma())
+            png.from_array(rgb.reshape(cli.height, -1).tolist(), 'RGB').save(
+                os.path.join(cli.corpus_dir, name))
+        else:
+            png.from_array(luma.tolist(), 'L').save(
+                os.path.join(cli.corpus_dir, name))
+        golden['frames'].append({
+            "file": name,
+            "boxes": [[x, y] for x, y in source.truth],
+            "lighting": lighting,
+            "noise": noise
+        })
+
+    with open(os.path.join(cli.corpus_dir, GOLDEN_FILE), 'w') as f:
+        json.dump(golden, f, indent=2, sort_keys=True)
+    print("wrote {0} golden frames to:{1}".format(cli.count, cli.corpus_dir))
+
+
+def _summary(seconds):
+    ms = np.asarray(seconds) * 1000.0
+    return {
+        "mean_ms": float(ms.mean()),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "max_ms": float(ms.max())
+    }
+
+
+def find_latencies(records, retry_interval):
+    """
+    Model the time a find takes when started at each frame of a corpus. A find
+    that does not correctly find a box is retried on the next frame after the
+    retry interval, as the arm does.
+
+    :param records: the per frame records of one pass over the corpus
+    :param retry_interval: the seconds between find attempts
+    :return: a list of the seconds taken by each find that succeeded
+    """
+    latencies = []
+    for start in range(len(records)):
+        elapsed = 0.0
+        for record in records[start:]:
+            elapsed += record['seconds']
+            if record['correct']:
+                latencies.append(elapsed)
+                break
+            elapsed += retry_interval
+    return latencies
+
+
+def load_golden(corpus_dir):
+    """
+    Read the 'golden.json' of a corpus.
+
+    :return: the golden description and a dict of each frame's description
+        keyed by the path of its file
+    """
+    with open(os.path.join(corpus_dir, GOLDEN_FILE)) as f:
+        golden = json.load(f)
+    frames = dict((os.path.join(corpus_dir, frame['file']), frame)
+                  for frame in golden['frames'])
+    return golden, frames
+
+
+def run_suite(cli, chroma_table=None):
+    """
+    Run the ImageProcessor over a golden corpus.
+
+    :param chroma_table: find boxes by colour with this chroma table
+        [default: None, find boxes by their edges]
+    :return: the report of the run as a dict, and a list with a record of
+        each frame of the first pass over the corpus
+    """
+    golden, frames = load_golden(cli.corpus_dir)
+    width = golden['width']
+    height = golden['height']
+
+    source = DirectorySource(cli.corpus_dir, width=width, height=height)
+    ip = ImageProcessor(res_width=width, res_height=height,
+                        engine=cli.engine, source=source,
+                        coarse_scale=cli.coarse_scale,
+                        threshold=cli.threshold, chroma_table=chroma_table)
+    min_size = cli.min_size
+    if min_size is None:
+        min_size = min_object_size(width, height)
+
+    def distance(x, y, boxes):
+        # distance in pixels from x, y to the closest box centre
+        return min([np.hypot(x - bx, y - by) for bx, by in boxes] or
+                   [np.inf])
+
+    stage_times = dict((stage, []) for stage in STAGES)
+    frame_times = []
+    errors = []
+    objects = []
+    spurious = []
+    records = []
+    counts = {"frames": 0, "correct": 0, "wrong": 0, "missed": 0,
+              "false": 0}
+    for n in range(-cli.warmup, cli.repeat):
+        source.index = 0
+        while source.index < len(source):
+            start = time.time()
+            ip.capture_frame()
+            seconds = time.time() - start
+            if n < 0:
+                # warm-up passes fill caches and are not measured
+                continue
+            frame_times.append(seconds)
+            for stage in STAGES:
+                stage_times[stage].append(ip.timings.get(stage, 0.0))
+
+            frame = frames.get(source.filename)
+            if frame is None:
+                continue
+            boxes = frame['boxes']
+            counts['frames'] += 1
+            # the processor counts Y up from the bottom row
+            objects.append(len(ip.pixelObjList))
+            spurious.append(len([
+                obj for obj in ip.pixelObjList
+                if distance(obj.coord_x, height - obj.coord_y,
+                            boxes) > cli.tolerance]))
+            correct = False
+            if ip.max_pixel_count <= min_size:
+                if len(boxes) > 0:
+                    counts['missed'] += 1
+            elif len(boxes) == 0:
+                counts['false'] += 1
+            else:
+                error = distance(ip.largest_X, height - ip.largest_Y, boxes)
+                errors.append(float(error))
+                correct = error <= cli.tolerance
+                counts['correct' if correct else 'wrong'] += 1
+            if n == 0:
+                records.append({
+                    "lighting": frame.get('lighting'),
+                    "seconds": seconds,
+                    "correct": correct,
+                    "objects": objects[-1],
+                    "spurious": spurious[-1]
+                })
+
+    latencies = find_latencies(records, cli.retry_interval)
+    report = {
+        "engine": cli.engine,
+        "coarse_scale": cli.coarse_scale,
+        "threshold": cli.threshold,
+        "segmentation": "edges" if chroma_table is None else "chroma",
+        "corpus": cli.corpus_dir,
+        "frames": len(frame_times),
+        "fps": len(frame_times) / sum(frame_times),
+        "frame": _summary(frame_times),
+        "stages": dict((stage, _summary(stage_times[stage]))
+                       for stage in STAGES),
+        "accuracy": {
+            "tolerance_px": cli.tolerance,
+            "detection_rate":
+                float(counts['correct']) / max(counts['frames'], 1),
+            "mean_error_px": float(np.mean(errors)) if errors else None,
+            "counts": counts
+        },
+        "objects_per_frame": float(np.mean(objects)),
+        "spurious_per_frame": float(np.mean(spurious)),
+        "find_latency": _summary(latencies) if latencies else None
+    }
+    return report, records
+
+
+def _slowed(now, then, max_slowdown):
+    """
+    Whether a timing summary is slower than an earlier one by more than
+    `max_slowdown` and by more than the noise of either run.
+    """
+    # medians are not moved by the odd frame delayed by the rest of the
+    # system, and the spread of each run above its median is how far apart
+    # two runs of the same code can be
+    noise = max(now['p95_ms'] - now['p50_ms'], then['p95_ms'] - then['p50_ms'],
+                MIN_TIMING_NOISE_MS)
+    return now['p50_ms'] > then['p50_ms'] * max_slowdown + noise
+
+
+def check_regressions(report, baseline, max_slowdown, max_accuracy_drop):
+    """
+    Compare a report with the report of an earlier run. Frame and stage times
+    are compared by their medians, allowing for the noise of each run, so a
+    run compared with itself never regresses.
+
+    :return: a list describing each regression found
+    """
+    regressions = []
+    if _slowed(report['frame'], baseline['frame'], max_slowdown):
+        regressions.append("frame slowed from {0:.3f}ms to {1:.3f}ms".format(
+            baseline['frame']['p50_ms'], report['frame']['p50_ms']))
+    for stage in STAGES:
+        if stage not in baseline['stages']:
+            continue
+        now = report['stages'][stage]
+        then = baseline['stages'][stage]
+        if _slowed(now, then, max_slowdown):
+            regressions.append(
+                "stage:{0} slowed from {1:.3f}ms to {2:.3f}ms".format(
+                    stage, then['p50_ms'], now['p50_ms']))
+    rate = report['accuracy']['detection_rate']
+    baseline_rate = baseline['accuracy']['detection_rate']
+    if rate < baseline_rate - max_accuracy_drop:
+        regressions.append("detection_rate dropped from {0:.3f} to "
+                           "{1:.3f}".format(baseline_rate, rate))
+    return regressions
+
+
+def suite(cli):
+    chroma_table = None
+    if cli.chroma_table is not None:
+        chroma_table = chroma.load_table(cli.chroma_table)
+    report, _ = run_suite(cli, chroma_table)
+    if cli.baseline is not None:
+        with open(cli.baseline) as f:
+            baseline = json.load(f)
+        report['regressions'] = check_regressions(
+            report, baseline, cli.max_slowdown, cli.max_accuracy_drop)
+
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if cli.output is not None:
+        with open(cli.output, 'w') as f:
+            f.write(output)
+    else:
+        print(output)
+
+    if report.get('regressions'):
+        for regression in report['regressions']:
+            print("REGRESSION: {0}".format(regression), file=sys.stderr)
+        raise SystemExit(1)
+
+
+def compare_thresholds(cli):
+    """
+    Run the suite once per threshold method and compare the methods in each
+    band of lighting of the corpus.
+    """
+    _print_band_header('threshold')
+    for method in edges.THRESHOLDS:
+        cli.threshold = method
+        report, records = run_suite(cli)
+        _print_bands(method, records, cli.retry_interval)
+
+
+def compare_segmentation(cli):
+    """
+    Run the suite finding boxes by their edges, then by their colour, and
+    compare the two in each band of lighting of the corpus.
+    """
+    if cli.chroma_table is not None:
+        chroma_table = chroma.load_table(cli.chroma_table)
+    else:
+        chroma_table = chroma.ellipse_table(chroma.BOX_U, chroma.BOX_V)
+    _print_band_header('segment')
+    for name, table in [('edges', None), ('chroma', chroma_table)]:
+        report, records = run_suite(cli, table)
+        _print_bands(name, records, cli.retry_interval)
+
+
+def _print_band_header(variant):
+    print("{0:<10} {1:<8} {2:>6} {3:>9} {4:>9} {5:>9} {6:>11} {7:>11}".format(
+        variant, 'lighting', 'frames', 'detected', 'objects', 'spurious',
+        'frame_ms', 'find_ms'))
+
+
+def _print_bands(variant, records, retry_interval):
+    # print one line for the whole corpus and one for each band of lighting
+    bands = [('all', records)]
+    for name, low, high in LIGHTING_BANDS:
+        bands.append((name, [
+            r for r in records if r['lighting'] is not None and
+            low <= r['lighting'] < high]))
+    for name, band in bands:
+        if not band:
+            continue
+        latencies = find_latencies(band, retry_interval)
+        print("{0:<10} {1:<8} {2:>6} {3:>9.3f} {4:>9.2f} {5:>9.2f} "
+              "{6:>11.3f} {7:>11.1f}".format(
+                  variant, name, len(band),
+                  np.mean([r['correct'] for r in band]),
+                  np.mean([r['objects'] for r in band]),
+                  np.mean([r['spurious'] for r in band]),
+                  np.mean([r['seconds'] for r in band]) * 1000.0,
+                  np.mean(latencies) * 1000.0 if latencies else np.nan))
+
+
+def _add_suite_arguments(parser):
+    parser.add_argument('corpus_dir',
+                        help="The directory containing the corpus.")
+    parser.add_argument('--engine', default='numpy',
+                        choices=sorted(edges.ENGINES),
+                        help="The edge engine to benchmark.")
+    parser.add_argument('--repeat', default=1, type=int,
+                        help="Times to process the whole corpus.")
+    parser.add_argument('--warmup', default=1, type=int,
+                        help="Times to process the whole corpus before it is "
+                             "measured.")
+    parser.add_argument('--tolerance', default=3.0, type=float,
+                        help="Largest centre error in pixels of a correct "
+                             "detection.")
+    parser.add_argument('--coarse_scale', default=1, type=int,
+                        help="Find objects in frames this many times smaller, "
+                             "then refine at full size.")
+    parser.add_argument('--min_size', type=int,
+                        help="Smallest object counted as a detection. "
+                             "[default: the arm's smallest object, scaled to "
+                             "the frame size]")
+    parser.add_argument('--retry_interval', default=1.0, type=float,
+                        help="Seconds between find attempts when modelling "
+                             "the latency of a find.")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Arm vision pipeline benchmark suite',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    subparsers = parser.add_subparsers()
+
+    compare_parser = subparsers.add_parser(
+        'compare',
+        description='Compare the Python and NumPy edge engines.',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    compare_parser.add_argument('--frames', default=20, type=int,
+                                help="The number of frames to process.")
+    compare_parser.add_argument('--width', default=96, type=int,
+                                help="The width of each generated frame.")
+    compare_parser.add_argument('--height', default=96, type=int,
+                                help="The height of each generated frame.")
+    compare_parser.add_argument('--noise', default=8.0, type=float,
+                                help="Std deviation of noise added to each "
+                                     "frame.")
+    compare_parser.add_argument('--seed', default=0, type=int,
+                                help="Seed used to generate the frames.")
+    compare_parser.add_argument('--frames_dir',
+                                help="Use the recorded frames in this "
+                                     "directory instead of generated frames.")
+    compare_parser.set_defaults(func=compare)
+
+    jitter_parser = subparsers.add_parser(
+        'jitter',
+        description='Measure telemetry lateness with and without the vision '
+                    'worker process.',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    jitter_parser.add_argument('--frames', default=100, type=int,
+                               help="The number of frames to process.")
+    jitter_parser.add_argument('--width', default=96, type=int,
+                               help="The width of each generated frame.")
+    jitter_parser.add_argument('--height', default=96, type=int,
+                               help="The height of each generated frame.")
+    jitter_parser.add_argument('--engine', default='python',
+                               choices=sorted(edges.ENGINES),
+                               help="The edge engine used to process frames.")
+    jitter_parser.add_argument('--frequency', default=100.0, type=float,
+                               help="Ticks per second of the ticking thread.")
+    jitter_parser.add_argument('--seed', default=0, type=int,
+                               help="Seed used to generate the frames.")
+    jitter_parser.set_defaults(func=telemetry_jitter)
+
+    golden_parser = subparsers.add_parser(
+        'golden',
+        description='Generate a golden corpus of synthetic frames.',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    golden_parser.add_argument('corpus_dir',
+                               help="The directory to write the corpus to.")
+    golden_parser.add_argument('--count', default=200, type=int,
+                               help="The number of frames to generate.")
+    golden_parser.add_argument('--width', default=96, type=int,
+                               help="The width of each frame.")
+    golden_parser.add_argument('--height', default=96, type=int,
+                               help="The height of each frame.")
+    golden_parser.add_argument('--noise', default=12.0, type=float,
+                               help="Largest std deviation of frame noise.")
+    golden_parser.add_argument('--min_lighting', default=0.5, type=float,
+                               help="Darkest scene brightness.")
+    golden_parser.add_argument('--max_lighting', default=1.3, type=float,
+                               help="Brightest scene brightness.")
+    golden_parser.add_argument('--gradient', default=0.4, type=float,
+                               help="Largest lighting gradient.")
+    golden_parser.add_argument('--seed', default=0, type=int,
+                               help="Seed used to generate the corpus.")
+    golden_parser.add_argument('--colour', action='store_true',
+                               help="Write colour frames, needed to find "
+                                    "boxes by their colour.")
+    golden_parser.set_defaults(func=make_golden)
+
+    suite_parser = subparsers.add_parser(
+        'suite',
+        description='Benchmark the ImageProcessor against a golden corpus.',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    _add_suite_arguments(suite_parser)
+    suite_parser.add_argument('--threshold', default='fixed',
+                              choices=edges.THRESHOLDS,
+                              help="How the edge threshold of each frame is "
+                                   "chosen.")
+    suite_parser.add_argument('--output',
+                              help="Write the JSON report to this file.")
+    suite_parser.add_argument('--baseline',
+                              help="The JSON report of an earlier run to "
+                                   "check for regressions.")
+    suite_parser.add_argument('--max_slowdown', default=1.2, type=float,
+                              help="Allowed slowdown relative to baseline.")
+    suite_parser.add_argument('--max_accuracy_drop', default=0.02,
+                              type=float,
+                              help="Allowed drop in detection rate relative "
+                                   "to baseline.")
+    suite_parser.add_argument('--chroma_table',
+                              help="Find boxes by their colour using the "
+                                   "chroma table in this '.npy' file.")
+    suite_parser.set_defaults(func=suite)
+
+    thresholds_parser = subparsers.add_parser(
+        'thresholds',
+        description='Compare the edge threshold methods on a golden corpus, '
+                    'by lighting.',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    _add_suite_arguments(thresholds_parser)
+    thresholds_parser.set_defaults(func=compare_thresholds)
+
+    segmentation_parser = subparsers.add_parser(
+        'segmentation',
+        description='Compare finding boxes by their edges and by their '
+                    'colour on a colour golden corpus, by lighting.',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    _add_suite_arguments(segmentation_parser)
+    segmentation_parser.add_argument('--threshold', default='fixed',
+                                     choices=edges.THRESHOLDS,
+                                     help="How the edge threshold of each "
+                                          "frame is chosen.")
+    segmentation_parser.add_argument('--chroma_table',
+                                     help="The chroma table in this '.npy' "
+                                          "file. [default: a table built "
+                                          "around the usual box colour]")
+    segmentation_parser.set_defaults(func=compare_segmentation)
+
+    args = parser.parse_args()
+    args.func(args)
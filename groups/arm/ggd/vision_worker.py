@@ -0,0 +1,282 @@
+#!/usr/bin/env python
+
+# Copyright 2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You may not
+# use this file except in compliance with the License. A copy of the License is
+# located at
+#     http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is distributed on
+# an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+# express or implied. See the License for the specific language governing
+# permissions and limitations under the License.
+
+"""
+Worker process that runs the `ImageProcessor` off the arm's main process.
+
+Finding objects is CPU bound Python that holds the GIL, which stalls the arm's
+telemetry and shadow callbacks while a frame is processed. A `VisionWorker`
+runs the processor in its own process instead, so the detector uses another
+core of the Pi while the arm's threads keep talking to the servos.
+
+Each frame, and its chroma when boxes are found by colour, is copied into a
+shared memory buffer that the worker reads in place, and the worker answers
+over a pipe with a small `Detection`. The arm's process only waits on the pipe,
+which releases the GIL, while a frame is processed.
+
+A `RemoteImageProcessor` captures frames in the arm's process and hands them to
+the worker, and can be used by a find in place of an `ImageProcessor`.
+"""
+import signal
+import logging
+import collections
+import multiprocessing
+import numpy as np
+
+from image_processor import ImageProcessor
+from frame_source import FrameSource, PiCameraSource, chroma_size_of
+from debug_images import DebugImageWriter
+
+log = logging.getLogger('vision_worker')
+log.addHandler(logging.NullHandler())
+
+Detection = collections.namedtuple('Detection', [
+    'max_pixel_count', 'largest_object_id', 'largest_X', 'largest_Y', 'bbox',
+    'roi', 'filename', 'timings', 'track', 'skipped', 'features'
+])
+
+_PROCESS = 'process'
+
+
+def _serve(conn, frame_buffer, chroma_buffer, width, height, options,
+           tracker, change_detector):
+    # the arm's process tells the worker when to stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    luma = np.frombuffer(frame_buffer, dtype=np.uint8).reshape(height, width)
+    uv = None
+    if options['chroma_table'] is not None:
+        uv = np.frombuffer(chroma_buffer, dtype=np.uint8).reshape(
+            (2,) + chroma_size_of(width, height))
+
+    debug_writer = None
+    if options['debug_images']:
+        debug_writer = DebugImageWriter()
+        debug_writer.start()
+
+    # frames are handed over by the arm's process, never captured here
+    ip = ImageProcessor(res_width=width, res_height=height,
+                        engine=options['engine'], debug_writer=debug_writer,
+                        source=FrameSource(width, height), tracker=tracker,
+                        coarse_scale=options['coarse_scale'],
+                        change_detector=change_detector,
+                        threshold=options['threshold'],
+                        chroma_table=options['chroma_table'])
+    while True:
+        request = conn.recv()
+        if request is None:
+            break
+        try:
+            ip.process_frame(luma, uv)
+            bbox = None
+            if ip.largest_object is not None:
+                bbox = ip.largest_object.bbox
+            track = None
+            if tracker is not None:
+                track = tracker.track
+            conn.send(Detection(ip.max_pixel_count, ip.largest_object_id,
+                                ip.largest_X, ip.largest_Y, bbox, ip.roi,
+                                ip.filename, ip.timings, track, ip.skipped,
+                                ip.largest_features()))
+        except Exception as e:
+            log.exception("[_serve] could not process frame")
+            conn.send(e)
+
+    if debug_writer is not None:
+        debug_writer.close()
+    conn.close()
+
+
+class VisionWorker(object):
+    """
+    A long-lived process that finds objects in the frames handed to it.
+    """
+
+    def __init__(self, width=96, height=96, engine='numpy', coarse_scale=1,
+                 tracker=None, change_detector=None, debug_images=False,
+                 threshold='fixed', chroma_table=None):
+        """
+
+        :param width: the width of the frames
+        :param height: the height of the frames
+        :param engine: the edge engine to use, 'numpy' or 'python'
+        :param coarse_scale: see `ImageProcessor` [default: 1]
+        :param tracker: a `CentroidTracker` that is kept in the worker and
+            mirrored in this process after every frame. [default: None]
+        :param change_detector: a `ChangeDetector` that is kept in the worker
+            and whose counters are mirrored in this process. [default: None]
+        :param debug_images: save the image of each processing step from the
+            worker. [default: False]
+        :param threshold: see `ImageProcessor` [default: 'fixed']
+        :param chroma_table: see `ImageProcessor` [default: None]
+        """
+        super(VisionWorker, self).__init__()
+        self.width = width
+        self.height = height
+        self.tracker = tracker
+        self.change_detector = change_detector
+        self._buffer = multiprocessing.RawArray('B', width * height)
+        self.frame = np.frombuffer(self._buffer, dtype=np.uint8).reshape(
+            height, width)
+        self.chroma_table = chroma_table
+        chroma_size = chroma_size_of(width, height)
+        self._chroma_buffer = multiprocessing.RawArray(
+            'B', 2 * chroma_size[0] * chroma_size[1])
+        self.uv = np.frombuffer(self._chroma_buffer, dtype=np.uint8).reshape(
+            (2,) + chroma_size)
+        self._conn, child_conn = multiprocessing.Pipe()
+        options = {
+            'engine': engine,
+            'coarse_scale': coarse_scale,
+            'debug_images': debug_images,
+            'threshold': threshold,
+            'chroma_table': chroma_table
+        }
+        self._process = multiprocessing.Process(
+            target=_serve, name="vision_worker",
+            args=(child_conn, self._buffer, self._chroma_buffer, width, height,
+                  options, tracker, change_detector))
+        self._process.daemon = True
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def start(self):
+        self._process.start()
+        log.info("[start] worker pid:{0}".format(self._process.pid))
+
+    def process(self, luma, uv=None):
+        """
+        Find the objects in a frame using the worker.
+
+        :param luma: the luminance plane of the frame
+        :param uv: the U and V planes of the frame, needed when the worker
+            segments by chroma [default: None]
+        :return: the `Detection` of the largest object in the frame
+        """
+        np.copyto(self.frame, luma)
+        if self.chroma_table is not None:
+            if uv is None:
+                raise ValueError("Segmenting by chroma needs the U, V planes.")
+            np.copyto(self.uv[0], uv[0])
+            np.copyto(self.uv[1], uv[1])
+        self._conn.send(_PROCESS)
+        detection = self._conn.recv()
+        if isinstance(detection, Exception):
+            raise detection
+        if self.tracker is not None:
+            self.tracker.track = detection.track
+        if self.change_detector is not None:
+            if detection.skipped:
+                self.change_detector.skipped += 1
+            else:
+                self.change_detector.processed += 1
+        return detection
+
+    def processor(self, source=None):
+        """
+        Make a `RemoteImageProcessor` that uses this worker.
+
+        :param source: see `ImageProcessor`
+        """
+        return RemoteImageProcessor(self, source=source)
+
+    def close(self):
+        """
+        Stop the worker process.
+        """
+        if self._process.is_alive():
+            self._conn.send(None)
+            self._process.join()
+        self._conn.close()
+        log.info("[close] worker stopped")
+
+
+class RemoteImageProcessor(object):
+    """
+    An `ImageProcessor` whose frames are processed by a `VisionWorker`.
+    """
+
+    def __init__(self, worker, source=None):
+        """
+
+        :param worker: a started `VisionWorker`
+        :param source: a long-lived `FrameSource` which stays open when this
+            processor is closed. [default: None, the processor opens and closes
+            its own camera]
+        """
+        super(RemoteImageProcessor, self).__init__()
+        self.worker = worker
+        self.owns_source = source is None
+        if source is None:
+            source = PiCameraSource(width=worker.width, height=worker.height)
+        self.source = source
+        self.tracker = worker.tracker
+        self.detection = None
+        self._clear()
+
+    def _clear(self):
+        self.max_pixel_count = 0
+        self.largest_object_id = 0
+        self.largest_X = 0
+        self.largest_Y = 0
+        self.filename = ''
+        self.roi = None
+        self.timings = dict()
+        self.skipped = False
+
+    def close(self):
+        self._clear()
+        if self.owns_source:
+            self.source.close()
+
+    def capture_frame(self):
+        luma = self.source.capture()
+        self.process_frame(luma, self._chroma())
+
+    def stream_frames(self):
+        """
+        Process frames continuously as the source delivers them.
+
+        :return: a generator that yields the `max_pixel_count` of each frame
+            once the frame has been processed
+        """
+        for luma in self.source.frames():
+            self.process_frame(luma, self._chroma())
+            yield self.max_pixel_count
+
+    def _chroma(self):
+        if self.worker.chroma_table is None:
+            return None
+        return self.source.chroma()
+
+    def largest_features(self):
+        if self.detection is None:
+            return None
+        return self.detection.features
+
+    def process_frame(self, luma, uv=None):
+        detection = self.worker.process(luma, uv)
+        self.detection = detection
+        self.max_pixel_count = detection.max_pixel_count
+        self.largest_object_id = detection.largest_object_id
+        self.largest_X = detection.largest_X
+        self.largest_Y = detection.largest_Y
+        self.filename = detection.filename
+        self.roi = detection.roi
+        self.timings = detection.timings
+        self.skipped = detection.skipped
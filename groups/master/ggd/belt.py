@@ -22,7 +22,8 @@ import collections
 import logging
 
 from cachetools import TTLCache
-from .servo.servode import ServoProtocol, ServoGroup, Servo
+from .servo.servode import ServoProtocol, ServoGroup, Servo, RegisterCache
+from .servo.emulator import BusEmulator
 
 import utils
 
@@ -61,6 +62,10 @@ log.setLevel(logging.INFO)
 BELT_TELEMETRY_TOPIC = "convey/telemetry"
 BELT_ERRORS_TOPIC = "convey/errors"
 STAGE_TOPIC = "convey/stages"
+BELT_TELEMETRY_REGISTERS = [
+    'present_speed', 'present_position', 'present_load', 'goal_position',
+    'moving', 'torque_limit'
+]
 
 commands = ['run', 'stop']
 belt_ids = [10]  # when there is one conveyor, there is one servo ID
@@ -95,22 +100,19 @@ def stage_message(stage, text='', stage_result=None):
 def belt_message(servo_group):
     data = []
     for servo in servo_group:
+        # the registers lie together in the control table, so they are read
+        # with one block read per servo
+        values = servo_group[servo].read_registers(BELT_TELEMETRY_REGISTERS)
         data.append({
             "sensor_id": "belt_id_{0:02d}".format(
                 servo_group[servo].servo_id),
             "ts": datetime.datetime.now().isoformat(),
-            "present_speed":
-                servo_group[servo]['present_speed'],
-            "present_position":
-                servo_group[servo]['present_position'],
-            "present_load":
-                servo_group[servo]['present_load'],
-            "goal_position":
-                servo_group[servo]['goal_position'],
-            "moving":
-                servo_group[servo]['moving'],
-            "torque_limit":
-                servo_group[servo]['torque_limit']
+            "present_speed": values['present_speed'],
+            "present_position": values['present_position'],
+            "present_load": values['present_load'],
+            "goal_position": values['goal_position'],
+            "moving": values['moving'],
+            "torque_limit": values['torque_limit']
         })
 
     msg = {
@@ -319,10 +321,15 @@ class BeltTelemetryThread(threading.Thread):
 def operate_belt(cli, mqtt_client, master_shadow):
     global should_loop
 
-    with ServoProtocol() as sproto:
+    backend = None
+    if cli.emulate:
+        backend = BusEmulator(belt_ids)
+
+    register_cache = RegisterCache(max_age=cli.sensor_max_age)
+    with ServoProtocol(backend=backend) as sproto:
         for servo_id in belt_ids:
             sproto.ping(servo=servo_id)
-    with ServoProtocol() as sp:
+    with ServoProtocol(backend=backend, cache=register_cache) as sp:
         sg = ServoGroup()
         sg['bone'] = Servo(sp, belt_ids[0], bone_servo_cache)
 
@@ -351,6 +358,8 @@ def operate_belt(cli, mqtt_client, master_shadow):
         btt.join()
         bct.join()
 
+    log.info("[operate_belt] register cache:{0}".format(
+        register_cache.stats()))
     mqtt_client.disconnect()
     time.sleep(2)
 
@@ -383,6 +392,13 @@ if __name__ == "__main__":
                         help="Modify the default belt speed.")
     parser.add_argument('--debug', default=False, action='store_true',
                         help="Activate debug output.")
+    parser.add_argument('--emulate', default=False, action='store_true',
+                        help="Drive emulated servos instead of the servo "
+                             "bus.")
+    parser.add_argument('--sensor_max_age', default=0.0, type=float,
+                        help="Answer reads of the servo's sensor registers "
+                             "from values read at most this many seconds "
+                             "ago.")
     pa = parser.parse_args()
     if pa.debug:
         log.setLevel(logging.DEBUG)
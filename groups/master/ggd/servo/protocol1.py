@@ -0,0 +1,450 @@
+#!/usr/bin/env python
+
+"""
+Dynamixel Protocol 1.0 packets in Python, and a `ServoProtocol` backend that
+sends them over a serial port without the DynamixelSDK.
+
+Every packet is framed as:
+    0xFF 0xFF id length instruction|error parameters... checksum
+
+A `PacketBackend` provides the DynamixelSDK functions `ServoProtocol` calls in
+terms of `transact`, which sends instruction packets back to back while the
+bus is locked and returns each one's status. The result of a transfer and the
+error of its status are kept in Python, so checking them costs nothing on the
+wire or across ctypes. Several instructions may be queued in a `Batch` and
+flushed with one acquisition of the bus lock:
+```python
+bus = PacketBus()
+with ServoProtocol(backend=bus) as sp:
+    batch = bus.batch()
+    batch.read(10, 36, 2)
+    batch.read(11, 36, 2)
+    positions = [from_bytes(status.params) for status in batch.flush()]
+```
+"""
+from __future__ import print_function
+
+import os
+import tty
+import time
+import select
+import logging
+import termios
+import threading
+import collections
+
+log = logging.getLogger('servode.protocol1')
+log.addHandler(logging.NullHandler())
+
+HEADER = bytearray([0xFF, 0xFF])
+BROADCAST_ID = 254
+PACKET_OVERHEAD = 6  # header, id, length, instruction or error and checksum
+
+PING = 0x01
+READ_DATA = 0x02
+WRITE_DATA = 0x03
+RESET = 0x06
+SYNC_WRITE = 0x83
+
+INSTRUCTION_ERROR = 0x40  # status error bit of an unknown instruction
+
+# transfer results, as in the DynamixelSDK
+COMM_SUCCESS = 0
+COMM_TX_FAIL = -1001
+COMM_RX_TIMEOUT = -3001
+COMM_RX_CORRUPT = -3002
+
+# termios of older Pythons lacks the higher Linux baud rates
+LINUX_BAUD_RATES = {
+    500000: 0o010005,
+    1000000: 0o010010
+}
+
+MODEL_NUMBER_ADDRESS = 0
+STATUS_TIMEOUT = 0.034  # two USB latency timers and 2ms, as in the SDK
+
+
+class ProtocolError(IOError):
+    pass
+
+
+Status = collections.namedtuple(
+    'Status', ['servo_id', 'error', 'params', 'result'])
+
+
+def checksum(body):
+    """
+    The checksum of the id, length, instruction and parameters of a packet.
+    """
+    return ~sum(body) & 0xFF
+
+
+def encode(servo_id, instruction, params=()):
+    """
+    Frame an instruction, or the error of a status, as a packet.
+
+    :return: the packet as a bytearray
+    """
+    body = bytearray([servo_id, len(params) + 2, instruction])
+    body.extend(params)
+    return HEADER + body + bytearray([checksum(body)])
+
+
+def decode(packet):
+    """
+    Unframe a packet.
+
+    :return: the servo_id, the instruction or error, and the parameters
+    """
+    packet = bytearray(packet)
+    if len(packet) < PACKET_OVERHEAD or packet[:2] != HEADER:
+        raise ProtocolError("Packet:{0} is not framed".format(list(packet)))
+    if packet[3] != len(packet) - 4:
+        raise ProtocolError("Packet:{0} has length:{1}".format(
+            list(packet), packet[3]))
+    if checksum(packet[2:-1]) != packet[-1]:
+        raise ProtocolError("Packet:{0} fails its checksum".format(
+            list(packet)))
+    return packet[2], packet[4], packet[5:-1]
+
+
+def to_bytes(value, length):
+    return bytearray((value >> (8 * i)) & 0xFF for i in range(length))
+
+
+def from_bytes(data):
+    value = 0
+    for i, byte in enumerate(bytearray(data)):
+        value |= byte << (8 * i)
+    return value
+
+
+def ping(servo_id):
+    return encode(servo_id, PING)
+
+
+def read_data(servo_id, address, length):
+    return encode(servo_id, READ_DATA, [address, length])
+
+
+def write_data(servo_id, address, data):
+    return encode(servo_id, WRITE_DATA, bytearray([address]) + data)
+
+
+def reset(servo_id):
+    return encode(servo_id, RESET)
+
+
+def sync_write(address, length, servo_data):
+    """
+    :param address: the address the data of each servo is written to
+    :param length: the bytes of data of each servo
+    :param servo_data: a list of (servo_id, data) of each servo
+    """
+    params = bytearray([address, length])
+    for servo_id, data in servo_data:
+        params.append(servo_id)
+        params.extend(data)
+    return encode(BROADCAST_ID, SYNC_WRITE, params)
+
+
+def read_packet(fd, timeout):
+    """
+    Read one packet from a file descriptor, skipping any bytes before its
+    header.
+
+    :return: the packet, or None if no whole packet arrived within the timeout
+    """
+    deadline = time.time() + timeout
+    packet = bytearray()
+    while True:
+        # 0xFF is not an ID, so a third 0xFF means the header starts later
+        if (len(packet) >= 2 and packet[:2] != HEADER) or (
+                len(packet) >= 3 and packet[2] == 0xFF):
+            del packet[0]
+            continue
+        length = 4 if len(packet) < 4 else 4 + packet[3]
+        if len(packet) >= length:
+            return packet
+        remaining = deadline - time.time()
+        if len(packet) > 0:
+            # a packet that has begun to arrive is given time to finish
+            remaining = max(remaining, timeout)
+        if remaining <= 0:
+            return None
+        ready, _, _ = select.select([fd], [], [], remaining)
+        if not ready:
+            return None
+        packet.extend(bytearray(os.read(fd, length - len(packet))))
+
+
+class Batch(object):
+    """
+    Instructions queued to be sent back to back by `flush`.
+    """
+
+    def __init__(self, backend):
+        super(Batch, self).__init__()
+        self.backend = backend
+        self.instructions = list()
+
+    def __len__(self):
+        return len(self.instructions)
+
+    def ping(self, servo_id):
+        self.instructions.append(ping(servo_id))
+
+    def read(self, servo_id, address, length):
+        self.instructions.append(read_data(servo_id, address, length))
+
+    def write(self, servo_id, address, data):
+        self.instructions.append(write_data(servo_id, address, data))
+
+    def sync_write(self, address, length, servo_data):
+        self.instructions.append(sync_write(address, length, servo_data))
+
+    def flush(self):
+        """
+        Send the queued instructions.
+
+        :return: the `Status` of each instruction in the order queued
+        """
+        instructions, self.instructions = self.instructions, list()
+        return self.backend.transact(instructions)
+
+
+class PacketBackend(object):
+    """
+    The DynamixelSDK functions `ServoProtocol` calls, built on `transact`.
+    """
+    # sync write data of any length fits a Python int, so only the packet
+    # limits it
+    max_param_bytes = 255
+
+    def __init__(self):
+        super(PacketBackend, self).__init__()
+        self.lock = threading.RLock()
+        self._last_result = COMM_SUCCESS
+        self._last_error = 0
+        self._data_read = bytearray()
+        self._groups = dict()
+        self._next_group = 0
+
+    def transact(self, instructions):
+        """
+        Send instruction packets back to back with the bus locked.
+
+        :param instructions: a list of instruction packets
+        :return: the `Status` of each instruction in order. An instruction
+            without a status packet, such as a broadcast, has an empty
+            successful `Status`.
+        """
+        raise NotImplementedError()
+
+    def batch(self):
+        return Batch(self)
+
+    def _txrx(self, instruction):
+        with self.lock:
+            status = self.transact([instruction])[0]
+            self._last_result = status.result
+            self._last_error = status.error
+            return status
+
+    def _read(self, servo_id, address, length):
+        status = self._txrx(read_data(servo_id, address, length))
+        if status.result != COMM_SUCCESS:
+            return 0
+        return from_bytes(status.params)
+
+    def portHandler(self, device_name):
+        return 0
+
+    def packetHandler(self):
+        pass
+
+    def openPort(self, port_num):
+        return True
+
+    def setBaudRate(self, port_num, baud_rate):
+        return True
+
+    def closePort(self, port_num):
+        pass
+
+    def getLastTxRxResult(self, port_num, protocol_version):
+        return self._last_result
+
+    def getLastRxPacketError(self, port_num, protocol_version):
+        return self._last_error
+
+    def printTxRxResult(self, protocol_version, result):
+        log.error("[printTxRxResult] result:{0}".format(result))
+
+    def printRxPacketError(self, protocol_version, error):
+        log.error("[printRxPacketError] error:{0}".format(error))
+
+    def pingGetModelNum(self, port_num, protocol_version, servo_id):
+        with self.lock:
+            status = self._txrx(ping(servo_id))
+            if status.result != COMM_SUCCESS:
+                return 0
+            # as the SDK does, read the model number of the answering servo
+            return self._read(servo_id, MODEL_NUMBER_ADDRESS, 2)
+
+    def factoryReset(self, port_num, protocol_version, servo_id, option):
+        self._txrx(reset(servo_id))
+
+    def read1ByteTxRx(self, port_num, protocol_version, servo_id, address):
+        return self._read(servo_id, address, 1)
+
+    def read2ByteTxRx(self, port_num, protocol_version, servo_id, address):
+        return self._read(servo_id, address, 2)
+
+    def readTxRx(self, port_num, protocol_version, servo_id, address, length):
+        with self.lock:
+            status = self._txrx(read_data(servo_id, address, length))
+            self._data_read = bytearray(length)
+            if status.result == COMM_SUCCESS:
+                self._data_read = status.params
+
+    def getDataRead(self, port_num, protocol_version, data_length, data_pos):
+        return from_bytes(self._data_read[data_pos:data_pos + data_length])
+
+    def write1ByteTxRx(self, port_num, protocol_version, servo_id, address,
+                       value):
+        self._txrx(write_data(servo_id, address, to_bytes(value, 1)))
+
+    def write2ByteTxRx(self, port_num, protocol_version, servo_id, address,
+                       value):
+        self._txrx(write_data(servo_id, address, to_bytes(value, 2)))
+
+    def groupSyncWrite(self, port_num, protocol_version, address,
+                       data_length):
+        with self.lock:
+            group_num = self._next_group
+            self._next_group += 1
+            self._groups[group_num] = {"address": address,
+                                       "length": data_length,
+                                       "params": list()}
+            return group_num
+
+    def groupSyncWriteAddParam(self, group_num, servo_id, data, data_length):
+        with self.lock:
+            group = self._groups[group_num]
+            if data_length != group['length']:
+                return False
+            group['params'].append((servo_id, to_bytes(data, data_length)))
+            return True
+
+    def groupSyncWriteClearParam(self, group_num):
+        with self.lock:
+            self._groups[group_num]['params'] = list()
+
+    def groupSyncWriteTxPacket(self, group_num):
+        with self.lock:
+            # `ServoProtocol` sends each group once, so it is then forgotten
+            group = self._groups.pop(group_num)
+            self._txrx(sync_write(group['address'], group['length'],
+                                  group['params']))
+
+
+class PacketBus(PacketBackend):
+    """
+    A `PacketBackend` sending packets over a serial port, or any other file
+    descriptor such as a pty.
+    """
+
+    def __init__(self, fd=None, status_return_level=2,
+                 timeout=STATUS_TIMEOUT):
+        """
+
+        :param fd: an open file descriptor of the bus [default: None, open
+            the device given to `portHandler` in `openPort`]
+        :param status_return_level: the status_return_level of the servos, 2
+            when every instruction is answered, 1 when only reads and pings
+            are answered and 0 when only pings are answered
+        :param timeout: the seconds to wait for a status packet
+        """
+        super(PacketBus, self).__init__()
+        self.fd = fd
+        self.status_return_level = status_return_level
+        self.timeout = timeout
+        self.device_name = None
+
+    def _expects_status(self, instruction):
+        if instruction[2] == BROADCAST_ID:
+            return False
+        if instruction[4] == PING:
+            return True
+        if instruction[4] == READ_DATA:
+            return self.status_return_level >= 1
+        return self.status_return_level >= 2
+
+    def _receive(self, servo_id):
+        deadline = time.time() + self.timeout
+        while True:
+            packet = read_packet(self.fd, deadline - time.time())
+            if packet is None:
+                return Status(servo_id, 0, bytearray(), COMM_RX_TIMEOUT)
+            try:
+                status_id, error, params = decode(packet)
+            except ProtocolError as pe:
+                log.error("[PacketBus._receive] {0}".format(pe))
+                return Status(servo_id, 0, bytearray(), COMM_RX_CORRUPT)
+            if status_id == servo_id:
+                return Status(servo_id, error, params, COMM_SUCCESS)
+            # a late status of an earlier instruction
+            log.debug("[PacketBus._receive] skipped status of id:{0}".format(
+                status_id))
+
+    def transact(self, instructions):
+        statuses = list()
+        with self.lock:
+            for instruction in instructions:
+                servo_id = instruction[2]
+                try:
+                    os.write(self.fd, bytes(instruction))
+                except OSError as ose:
+                    log.error("[PacketBus.transact] {0}".format(ose))
+                    statuses.append(
+                        Status(servo_id, 0, bytearray(), COMM_TX_FAIL))
+                    continue
+                if self._expects_status(instruction):
+                    statuses.append(self._receive(servo_id))
+                else:
+                    statuses.append(
+                        Status(servo_id, 0, bytearray(), COMM_SUCCESS))
+        return statuses
+
+    def portHandler(self, device_name):
+        self.device_name = device_name
+        return 0
+
+    def openPort(self, port_num):
+        if self.fd is not None:
+            return True
+        try:
+            self.fd = os.open(self.device_name, os.O_RDWR | os.O_NOCTTY)
+        except OSError as ose:
+            log.error("[PacketBus.openPort] {0}".format(ose))
+            return False
+        tty.setraw(self.fd)
+        return True
+
+    def setBaudRate(self, port_num, baud_rate):
+        speed = getattr(termios, 'B{0}'.format(baud_rate),
+                        LINUX_BAUD_RATES.get(baud_rate))
+        if speed is None:
+            log.error("[PacketBus.setBaudRate] unsupported baud rate:{0}"
+                      .format(baud_rate))
+            return False
+        attributes = termios.tcgetattr(self.fd)
+        attributes[4] = attributes[5] = speed
+        termios.tcsetattr(self.fd, termios.TCSANOW, attributes)
+        return True
+
+    def closePort(self, port_num):
+        if self.fd is not None and self.device_name is not None:
+            os.close(self.fd)
+            self.fd = None
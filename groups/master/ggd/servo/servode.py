@@ -3,12 +3,17 @@
 from __future__ import print_function
 
 import time
+import struct
 import logging
 import datetime
 import argparse
 import threading
 import collections
-from .dynamixel_functions import *
+try:
+    from . import dynamixel_functions
+except (ImportError, OSError):
+    # the DynamixelSDK loads its shared library when it is imported
+    dynamixel_functions = None
 
 __version__ = '0.1.0'
 
@@ -35,6 +40,10 @@ DEVICENAME = "/dev/ttyUSB0".encode('utf-8')
 COMM_SUCCESS = 0  # Communication Success result value
 COMM_TX_FAIL = -1001  # Communication Tx Failed
 
+SDK_PARAM_BYTES = 4  # the DynamixelSDK takes each servo's data as a uint32
+SDK_DATA_LENGTHS = (1, 2, 4)  # the data lengths the DynamixelSDK can pack
+MAX_PACKET_PARAMS = 253  # a packet's length byte counts its parameters + 2
+
 # Dynamixel control table addresses
 dxl_control = {
     "model_number": {
@@ -263,6 +272,165 @@ dxl_control = {
     }
 }
 
+# reading a few unwanted bytes costs less than another instruction and status
+# packet and the servo's return delay
+MAX_BLOCK_GAP = 16
+
+BlockRead = collections.namedtuple(
+    'BlockRead', ['address', 'length', 'registers', 'fmt'])
+
+
+def plan_block_reads(registers, max_gap=MAX_BLOCK_GAP):
+    """
+    Merge registers into the fewest reads of contiguous blocks of the control
+    table, joining registers at most `max_gap` bytes apart.
+
+    :param registers: the names of the registers to read
+    :param max_gap: the most unwanted bytes read between two registers
+    :return: a list of `BlockRead`, each with the `struct` format that decodes
+        the registers of its block in order
+    """
+    ordered = sorted(set(registers), key=lambda r: dxl_control[r]['address'])
+    blocks = list()
+    spans = list()
+    for register in ordered:
+        address = dxl_control[register]['address']
+        end = address + dxl_control[register]['comm_bytes']
+        if spans and address - spans[-1][1] <= max_gap:
+            spans[-1][1] = max(spans[-1][1], end)
+            spans[-1][2].append(register)
+        else:
+            spans.append([address, end, [register]])
+
+    for start, end, block_registers in spans:
+        fmt = '<'
+        position = start
+        for register in block_registers:
+            address = dxl_control[register]['address']
+            if address > position:
+                fmt += '{0}x'.format(address - position)
+            fmt += 'H' if dxl_control[register]['comm_bytes'] == 2 else 'B'
+            position = address + dxl_control[register]['comm_bytes']
+        blocks.append(BlockRead(start, end - start, block_registers, fmt))
+    return blocks
+
+
+# RAM registers that only change when written, so their values stay known
+# until the servo reports an error, such as an alarm shutdown that zeroes
+# torque_limit. torque_enable is not one, as a goal_position write enables it.
+WRITTEN_REGISTERS = frozenset([
+    'cw_compliance_margin', 'ccw_compliance_margin', 'cw_compliance_slope',
+    'ccw_compliance_slope', 'goal_position', 'moving_speed', 'torque_limit',
+    'punch'
+])
+
+
+class RegisterCache(object):
+    """
+    A read-through cache of the register values of the servos on a bus, used
+    by a `ServoProtocol` to answer reads without a bus transaction.
+
+    Registers that are not volatile, such as the EEPROM registers, and the
+    `WRITTEN_REGISTERS` are kept from their first read or write until the
+    servo is reset or reports an error. Volatile registers, such as the
+    present_* sensor registers, are kept for at most their max-age.
+    """
+
+    def __init__(self, max_age=0.0, max_ages=None):
+        """
+
+        :param max_age: the most seconds a volatile register's value is kept
+            [default: 0.0, volatile registers are always read from the bus]
+        :param max_ages: a dict of the max-age of particular volatile
+            registers, overriding `max_age` [default: None]
+        """
+        super(RegisterCache, self).__init__()
+        self.max_age = max_age
+        self.max_ages = dict() if max_ages is None else dict(max_ages)
+        self.hits = 0
+        self.misses = 0
+        self._values = dict()
+        self._lock = threading.Lock()
+
+    def max_age_of(self, register):
+        """
+        :return: the most seconds a value of the register is kept, None when
+            it is kept until invalidated
+        """
+        if not dxl_control[register]['volatile'] or \
+                register in WRITTEN_REGISTERS:
+            return None
+        return self.max_ages.get(register, self.max_age)
+
+    def get(self, servo_id, register):
+        """
+        Look up a register value, counting a hit or a miss.
+
+        :return: the value, or None when it is not cached or is too old
+        """
+        max_age = self.max_age_of(register)
+        with self._lock:
+            entry = self._values.get((servo_id, register))
+            if entry is not None and (
+                    max_age is None or time.time() - entry[1] < max_age):
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+            return None
+
+    def put(self, servo_id, register, value):
+        with self._lock:
+            self._values[(servo_id, register)] = (value, time.time())
+
+    def put_data(self, servo_id, address, data, written=False):
+        """
+        Cache the registers wholly within a block of the control table.
+
+        :param servo_id: the servo
+        :param address: the address of the first byte of the block
+        :param data: the bytes of the block, as read or written
+        :param written: the block was written, so its read-only registers are
+            unchanged and not cached
+        """
+        for register in dxl_control:
+            reg_address = dxl_control[register]['address']
+            comm_bytes = dxl_control[register]['comm_bytes']
+            if reg_address < address or \
+                    reg_address + comm_bytes > address + len(data):
+                continue
+            if written and dxl_control[register]['access'] == "r":
+                continue
+            offset = reg_address - address
+            value = data[offset]
+            if comm_bytes == 2:
+                value |= data[offset + 1] << 8
+            self.put(servo_id, register, value)
+
+    def invalidate(self, servo_id=None):
+        """
+        Forget the cached values of a servo.
+
+        :param servo_id: the servo [default: None, every servo]
+        """
+        with self._lock:
+            if servo_id is None:
+                self._values.clear()
+                return
+            for key in list(self._values):
+                if key[0] == servo_id:
+                    del self._values[key]
+
+    def stats(self):
+        """
+        :return: a dict of the hits, misses and cached values of the cache
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._values)
+            }
+
 
 class Servo(object):
 
@@ -349,6 +517,18 @@ class Servo(object):
             self.read_cache[register] = result['value']
         return result['value']
 
+    def read_registers(self, registers):
+        """
+        Read several registers in as few bus transactions as possible.
+
+        :param registers: the names of the registers to read
+        :return: a dict of the value of each register
+        """
+        result = self.sp.read_registers(self.servo_id, registers)
+        if self.read_cache is not None:
+            self.read_cache.update(result['values'])
+        return result['values']
+
     def write(self, register, value):
         result = self.sp.write_register(self.servo_id, register, value)
         # self._fill_status(result)
@@ -360,12 +540,50 @@ class Servo(object):
         self.write(key, val)
 
 
+def _within(position, goal, margin):
+    # we are close enough when servo position is between horseshoes and hand
+    # grenades
+    horseshoes = margin + goal
+    hand_grenades = max(goal - margin, 0)
+    return horseshoes > position > hand_grenades
+
+
+def plan_speeds(present_positions, goal_positions, max_speed):
+    """
+    Plan the moving speed of each servo so that every servo reaches its goal
+    position at the same time, the servo with the farthest to travel moving at
+    `max_speed`.
+
+    :param present_positions: the list of present positions in servo order
+    :param goal_positions: the list of goal positions in servo order
+    :param max_speed: the moving speed of the servo with the farthest to travel
+    :return: the list of moving speeds in servo order
+    """
+    travel = [abs(goal - pos)
+              for pos, goal in zip(present_positions, goal_positions)]
+    if len(travel) == 0:
+        return []
+    farthest = max(travel)
+    speeds = list()
+    for distance in travel:
+        if distance == 0:
+            speeds.append(max_speed)
+        else:
+            # a moving speed of 0 is the servo's fastest, so plan at least 1
+            speeds.append(
+                max(int(round(max_speed * distance / float(farthest))), 1))
+    return speeds
+
+
 class ServoGroup(object):
     """
     A Group of Servos that will remain in order while interacting with or
     iterating over them.
     """
     POSITION_MARGIN = 50
+    MAX_SPEED = 1023
+    MIN_POLL_INTERVAL = 0.01  # seconds between polls of a moving group
+    MAX_POLL_INTERVAL = 0.1
 
     def __init__(self):
         super(ServoGroup, self).__init__()
@@ -463,38 +681,90 @@ class ServoGroup(object):
             servo_list=self.servo_ids
         )
 
-    def write_values(self, register, values):
+    def write_values(self, register, values, checked=False):
         """
         Write the list of values to the register on every servo in the
         ServoGroup.
         Note: the length of the values list should equal the length of the
         ServoGroup
+        Note: servos do not answer a sync write, so unless `checked` there is
+        no status or error byte from each servo, only whether the packet was
+        sent.
 
         :param register:
         :param values: the list of values to write in servo order
-        :return: None
+        :param checked: write each servo in turn and return the result of
+            each write, see `ServoProtocol.write_register`, for callers that
+            need each servo's error byte [default: False, all servos in one
+            sync write]
+        :return: True if the sync write was sent, False if not, or when
+            `checked` the list of each servo's result in servo order
         """
-        t = 0
         log.debug(
             '[ServoGroup.write_values] len(self):{0} len(values):{1}'.format(
                 len(self), len(values)))
+        count = min(len(self), len(values))
+        if count < len(self):
+            log.warn(
+                "[ServoGroup.write_values] more group members than values.")
 
-        for servo in self.servos.values():
-            if t < min(len(self), len(values)):
-                log.info(
-                    "[ServoGroup.write_values] servo:{0} values[{1}]:{2}".format(
-                        servo, t, values[t]
-                    ))
-                servo.write(register, values[t])
-            else:
-                log.warn(
-                    "[ServoGroup.write_values] more group members than values.")
-            t += 1
+        sp = self._get_sp()
+        if checked:
+            return [sp.write_register(sid, register, value)
+                    for sid, value in zip(self.servo_ids, values[:count])]
+
+        # every servo is sent its value in one sync write, so they all act on
+        # their values at the same moment
+        return sp.sync_write_values(
+            register=register,
+            values=list(values[:count]),
+            servo_list=self.servo_ids[:count]
+        )
+
+    def read_registers(self, registers, names=None):
+        """
+        Read several registers of every servo in the ServoGroup, see
+        `ServoProtocol.read_group`.
+
+        :param registers: the names of the registers to read
+        :param names: the names of the servos to read, in servo order
+            [default: None, every servo in the group]
+        :return: the list in servo order of a dict of the value of each
+            register
+        """
+        if names is None:
+            names = list(self.servos)
+        servos = [self.servos[name] for name in names]
+        sp = self._get_sp()
+        result = sp.read_group(servos, registers)
+        for servo, values in zip(servos, result['values']):
+            if servo.read_cache is not None:
+                servo.read_cache.update(values)
+        return result['values']
+
+    def write_registers(self, registers, values):
+        """
+        Write values to adjacent registers on every servo in the ServoGroup,
+        in as few sync writes as the backend allows. Like `write_values`
+        there is no status or error byte from each servo.
+
+        :param registers: the names of adjacent registers in address order
+        :param values: the list in servo order of each servo's list of values,
+            one per register
+        :return: True if success, False if not
+        """
+        sp = self._get_sp()
+        return sp.sync_write_registers(
+            registers=registers,
+            values=values,
+            servo_list=self.servo_ids
+        )
 
     def goal_position(self, goal_positions,
                       block=False,
                       should_run=None,
-                      margin=POSITION_MARGIN):
+                      margin=POSITION_MARGIN,
+                      timeout=None):
         """
 
         :param goal_positions: the list of goal position values to write in
@@ -504,50 +774,148 @@ class ServoGroup(object):
         :param should_run: `threading.Event` used to interrupt block if
             necessary, will be cleared when goal position is met.
         :param margin:
-        :return:
+        :param timeout: the most seconds to block for [default: None, block
+            until the goal position is met]
+        :return: when blocking, see `wait_for_motion`
         """
         log.info("[goal_position] requested positions:{0}".format(
             goal_positions))
 
         self.write_values('goal_position', goal_positions)
 
-        event = should_run
-        if block is True and event is None:
-            log.info("[goal_position] using local event")
-            event = threading.Event()
-            event.clear()
-            event.set()
+        if block:
+            return self._block(goal_positions, should_run, margin, timeout)
+
+    def move(self, goal_positions,
+             max_speed=MAX_SPEED,
+             block=False,
+             should_run=None,
+             margin=POSITION_MARGIN,
+             timeout=None):
+        """
+        Move the servos to their goal positions so that they all arrive at the
+        same time. The moving speed of each servo is planned from how far it
+        has to travel, see `plan_speeds`, and the goal positions and moving
+        speeds of every servo are written in one synchronized write.
+
+        :param goal_positions: the list of goal position values to write in
+            servo order
+        :param max_speed: the moving speed of the servo with the farthest to
+            travel
+        :param block: see `goal_position`
+        :param should_run: see `goal_position`
+        :param margin: see `goal_position`
+        :param timeout: see `goal_position`
+        :return: when blocking, see `wait_for_motion`
+        """
+        if len(self.servos) == 0 or len(goal_positions) == 0:
+            log.warning("[move] no servos to move")
+            return True if block else None
+
+        present_positions = [values['present_position'] for values in
+                             self.read_registers(['present_position'])]
+        speeds = plan_speeds(present_positions, goal_positions, max_speed)
+        log.info("[move] requested positions:{0} speeds:{1}".format(
+            goal_positions, speeds))
+
+        # moving_speed follows goal_position in the control table, so each
+        # servo is sent its goal and speed together
+        self.write_registers(['goal_position', 'moving_speed'],
+                             [[goal, speed] for goal, speed in zip(
+                                 goal_positions, speeds)])
 
         if block:
-            while event.is_set():
-                close = dict()
-                i = 0
-                for servo in self.servos:
-                    s = self.servos[servo]
-                    pos = s['present_position']
-                    goal = goal_positions[i]
-                    log.debug(
-                        "[goal_position] 'present_position' id:{0} is:{1}".format(
-                            s.servo_id, pos))
-
-                    horseshoes = margin + goal
-                    hand_grenades = goal - margin
-                    if hand_grenades < 0:
-                        hand_grenades = 0
-
-                    # we are close enough when servo position is between
-                    # horseshoes and hand grenades
-                    if horseshoes > pos > hand_grenades:
-                        close[servo] = pos
-                    i += 1
-
-                if len(close) == len(self.servos):
-                    # all servos close when the dict has a value per servo
-                    event.clear()
-
-                log.info("[goal_position] actual close positions:{0}".format(
-                    close))
-                time.sleep(0.5)
+            return self._block(goal_positions, should_run, margin, timeout)
+
+    def _block(self, goal_positions, should_run, margin, timeout):
+        settled = self.wait_for_motion(goal_positions, margin=margin,
+                                       timeout=timeout, should_run=should_run)
+        if settled and should_run is not None:
+            should_run.clear()
+        return settled
+
+    def wait_for_motion(self, goal_positions, margin=POSITION_MARGIN,
+                        timeout=None, should_run=None):
+        """
+        Wait until the servos have finished moving to their goal positions.
+
+        The servos are polled quickly while they are about to arrive and less
+        often while they are far from their goals, judged by how fast they
+        moved since the last poll. A servo that has stopped short of its goal,
+        such as an effector closed on an object, has also finished moving.
+
+        :param goal_positions: the list of goal position values in servo order,
+            or a dict of the goal position of some servos keyed by name
+        :param margin: how close to its goal position a servo must be
+        :param timeout: the most seconds to wait [default: None, wait until
+            the servos have finished moving]
+        :param should_run: `threading.Event` used to interrupt the wait if
+            necessary. [default: None]
+        :return: True if every servo finished moving, False if the wait timed
+            out or was interrupted
+        """
+        if isinstance(goal_positions, dict):
+            goals = collections.OrderedDict(
+                (name, goal_positions[name]) for name in self.servos
+                if name in goal_positions)
+        else:
+            goals = collections.OrderedDict(zip(self.servos, goal_positions))
+
+        start = time.time()
+        polled = None
+        last = dict()
+        polls = 0
+        while True:
+            polls += 1
+            now = time.time()
+            # every servo is polled in one batched read
+            states = dict(zip(goals, self.read_registers(
+                ['present_position', 'moving'], names=list(goals))))
+            positions = dict()
+            for name, goal in goals.items():
+                pos = states[name]['present_position']
+                if not _within(pos, goal, margin):
+                    positions[name] = pos
+            log.debug("[wait_for_motion] unsettled positions:{0}".format(
+                positions))
+
+            if len(positions) == 0:
+                log.info("[wait_for_motion] settled in:{0:.3f}s polls:{1}"
+                         .format(now - start, polls))
+                return True
+
+            moved = [abs(pos - last[name]) for name, pos in positions.items()
+                     if name in last]
+            if len(moved) == len(positions) and max(moved) == 0 and not any(
+                    states[name]['moving'] for name in positions):
+                log.info("[wait_for_motion] stopped short:{0} in:{1:.3f}s "
+                         "polls:{2}".format(positions, now - start, polls))
+                return True
+
+            if timeout is not None and now - start >= timeout:
+                log.warning("[wait_for_motion] timed out:{0} after:{1:.3f}s"
+                            .format(positions, now - start))
+                return False
+            if should_run is not None and not should_run.is_set():
+                log.info("[wait_for_motion] interrupted")
+                return False
+
+            interval = self.MAX_POLL_INTERVAL
+            if len(moved) > 0 and max(moved) > 0:
+                # poll twice before the slowest servo is due to arrive
+                speed = max(moved) / max(now - polled, 1e-6)
+                remaining = max(abs(goals[name] - pos) - margin
+                                for name, pos in positions.items())
+                interval = remaining / speed / 2
+            elif polled is None:
+                interval = self.MIN_POLL_INTERVAL
+            interval = min(max(interval, self.MIN_POLL_INTERVAL),
+                           self.MAX_POLL_INTERVAL)
+            if timeout is not None:
+                interval = min(interval, max(start + timeout - now, 0))
+            last = positions
+            polled = now
+            time.sleep(interval)
 
 
 class ServoProtocol(object):
@@ -586,13 +954,18 @@ class ServoProtocol(object):
 
     def __init__(self, baud_rate=BAUDRATE_PERM, manufacturer=ROBOTIS,
                  servo_type=AX_12_TYPE, protocol_version=PROTOCOL_V,
-                 lock=threading.Lock()):
+                 lock=threading.Lock(), backend=None, cache=None):
         """
 
         :param baud_rate:
         :param manufacturer:
         :param servo_type:
         :param protocol_version:
+        :param backend: the object providing the DynamixelSDK functions used to
+            talk to the servo bus, such as a `BusEmulator` [default: None, the
+            DynamixelSDK's dynamixel_functions]
+        :param cache: a `RegisterCache` answering register reads and kept up
+            to date by register writes [default: None, every read uses the bus]
         """
         super(ServoProtocol, self).__init__()
         if servo_type == AX_12_TYPE:
@@ -606,24 +979,46 @@ class ServoProtocol(object):
             raise NotImplementedError("protocol_version:{0} not supported.".format(
                 protocol_version))
 
+        if backend is None:
+            if dynamixel_functions is None:
+                raise ImportError(
+                    "The DynamixelSDK's dynamixel_functions could not be "
+                    "imported. Use an emulated backend without hardware.")
+            backend = dynamixel_functions
+
         self.lock = lock
         self.baud_rate = baud_rate
         self.manufacturer = manufacturer
-        self.port_num = portHandler(DEVICENAME)
-        packetHandler()  # Initialize PacketHandler Structs
+        self.dxl = backend
+        self._block_plans = dict()
+        self.cache = cache
+        self.port_num = self.dxl.portHandler(DEVICENAME)
+        self.dxl.packetHandler()  # Initialize PacketHandler Structs
+
+    def _cache_result(self, sid, last_result, error_result, values):
+        # keep values that were surely read or written, and forget what is
+        # known of a servo reporting an error, which may have changed its
+        # registers itself
+        if self.cache is None:
+            return
+        if error_result:
+            self.cache.invalidate(sid)
+        elif last_result == COMM_SUCCESS:
+            for register, value in values.items():
+                self.cache.put(sid, register, value)
 
     def __enter__(self):
         log.debug("[ServoProtocol.__enter__] Connection information")
 
         # Open port
-        if openPort(self.port_num):
+        if self.dxl.openPort(self.port_num):
             log.debug("[ServoProtocol.__enter__] opened port:{0}".format(
                 self.port_num))
         else:
             raise IOError("[ServoProtocol.__enter__] Failed to open the port!")
 
         # Set port baudrate to PERM
-        if setBaudRate(self.port_num, self.baud_rate):
+        if self.dxl.setBaudRate(self.port_num, self.baud_rate):
             log.debug("[ServoProtocol.__enter__] Set baud rate to: {0}".format(
                 self.baud_rate))
         else:
@@ -635,7 +1030,7 @@ class ServoProtocol(object):
 
     def __exit__(self, exc_type, exc_value, traceback):
         log.debug("[ServoProtocol.__exit__] closing dxl port")
-        closePort(self.port_num)
+        self.dxl.closePort(self.port_num)
         # self.lock.release()
 
     def factory_reset(self, servo):
@@ -650,19 +1045,23 @@ class ServoProtocol(object):
             sid = servo
 
         log.debug("[factory_reset] Try reset:{0}".format(sid))
-        factoryReset(self.port_num, self.protocol_version, sid, 0x00)
+        if self.cache is not None:
+            # a reset servo returns to ID 1 and its factory settings
+            self.cache.invalidate()
+        self.dxl.factoryReset(self.port_num, self.protocol_version, sid, 0x00)
         with self.lock:
-            last_result = getLastTxRxResult(
+            last_result = self.dxl.getLastTxRxResult(
                 self.port_num, self.protocol_version)
             if last_result != COMM_SUCCESS:
                 log.error("[factory_reset] Aborted")
-                printTxRxResult(self.protocol_version, last_result)
+                self.dxl.printTxRxResult(self.protocol_version, last_result)
 
-            error_result = getLastRxPacketError(
+            error_result = self.dxl.getLastRxPacketError(
                 self.port_num, self.protocol_version)
             if error_result:
                 self._result_to_status(error_result)
-                printRxPacketError(self.protocol_version, error_result)
+                self.dxl.printRxPacketError(
+                    self.protocol_version, error_result)
                 log.error("[factory_reset] Error:{0}".format(error_result))
 
         # Wait for reset
@@ -682,21 +1081,22 @@ class ServoProtocol(object):
             sid = servo
 
         with self.lock:
-            dxl_model_number = pingGetModelNum(
+            dxl_model_number = self.dxl.pingGetModelNum(
                 self.port_num, self.protocol_version, sid)
 
-            last_result = getLastTxRxResult(self.port_num,
-                                                self.protocol_version)
+            last_result = self.dxl.getLastTxRxResult(self.port_num,
+                                                     self.protocol_version)
             if last_result != COMM_SUCCESS:
-                printTxRxResult(self.protocol_version, last_result)
+                self.dxl.printTxRxResult(self.protocol_version, last_result)
                 log.error(
                     "[ping] Communication unsuccessful:{0}".format(last_result))
 
-            error_result = getLastRxPacketError(
+            error_result = self.dxl.getLastRxPacketError(
                 self.port_num, self.protocol_version)
             if error_result:
                 self._result_to_status(error_result)
-                printRxPacketError(self.protocol_version, error_result)
+                self.dxl.printRxPacketError(
+                    self.protocol_version, error_result)
                 log.error("[ping] Error:{0}".format(error_result))
 
         return dxl_model_number
@@ -722,41 +1122,233 @@ class ServoProtocol(object):
         else:
             sid = servo
 
+        if self.cache is not None:
+            cached = self.cache.get(sid, register)
+            if cached is not None:
+                result['value'] = cached
+                return result
+
         with self.lock:
             if dxl_control[register]['comm_bytes'] == 1:
-                value = read1ByteTxRx(
+                value = self.dxl.read1ByteTxRx(
                     self.port_num, self.protocol_version, sid,
                     dxl_control[register]['address']
                 )
             elif dxl_control[register]['comm_bytes'] == 2:
-                value = read2ByteTxRx(
+                value = self.dxl.read2ByteTxRx(
                     self.port_num, self.protocol_version, sid,
                     dxl_control[register]['address']
                 )
 
-            last_result = getLastTxRxResult(
+            last_result = self.dxl.getLastTxRxResult(
                 self.port_num, self.protocol_version
             )
             if last_result != COMM_SUCCESS:
-                printTxRxResult(self.protocol_version, last_result)
+                self.dxl.printTxRxResult(self.protocol_version, last_result)
                 log.error("[read_register] Comm unsuccessful:{0}".format(
                     last_result))
 
             # Comms might be successful but we could still be in an error
             # state. So, check for error packet after every read
-            error_result = getLastRxPacketError(
+            error_result = self.dxl.getLastRxPacketError(
                 self.port_num, self.protocol_version)
             if error_result:
                 result['status'] = self._result_to_status(error_result)
-                printRxPacketError(self.protocol_version, error_result)
+                self.dxl.printRxPacketError(
+                    self.protocol_version, error_result)
                 log.error("[read_register] Error:{0}".format(error_result))
             else:
                 log.debug(
                     "[read_register] error_result:{0}".format(error_result))
+            self._cache_result(sid, last_result, error_result,
+                               {register: value})
 
         result['value'] = value
         return result
 
+    def read_block(self, servo, address, length):
+        """
+        Read a contiguous block of the control table with one READ_DATA.
+
+        :param servo: a Servo object or an integer servo_id
+        :param address: the address of the first byte to read
+        :param length: the number of bytes to read
+        :return: a dict containing:
+            { "data": <the bytes read, zeros if the read failed>,
+              "status": <a dict containing the status bit states>
+            }
+        """
+        result = {
+            "data": bytearray(length),
+            "status": {}
+        }
+
+        if isinstance(servo, Servo):
+            sid = servo.servo_id
+        else:
+            sid = servo
+
+        with self.lock:
+            self.dxl.readTxRx(
+                self.port_num, self.protocol_version, sid, address, length)
+
+            last_result = self.dxl.getLastTxRxResult(
+                self.port_num, self.protocol_version
+            )
+            if last_result != COMM_SUCCESS:
+                self.dxl.printTxRxResult(self.protocol_version, last_result)
+                log.error("[read_block] Comm unsuccessful:{0}".format(
+                    last_result))
+            else:
+                result['data'] = bytearray(
+                    self.dxl.getDataRead(
+                        self.port_num, self.protocol_version, 1, i)
+                    for i in range(length))
+
+            error_result = self.dxl.getLastRxPacketError(
+                self.port_num, self.protocol_version)
+            if error_result:
+                result['status'] = self._result_to_status(error_result)
+                self.dxl.printRxPacketError(
+                    self.protocol_version, error_result)
+                log.error("[read_block] Error:{0}".format(error_result))
+            if self.cache is not None:
+                if error_result:
+                    self.cache.invalidate(sid)
+                elif last_result == COMM_SUCCESS:
+                    self.cache.put_data(sid, address, result['data'])
+
+        return result
+
+    def read_registers(self, servo, registers):
+        """
+        Read several registers, merged into the fewest block reads by
+        `plan_block_reads`.
+
+        :param servo: a Servo object or an integer servo_id
+        :param registers: the names of the registers to read
+        :return: a dict containing:
+            { "values": <a dict of the value read from each register>,
+              "status": <a dict containing the status bit states>
+            }
+        """
+        result = {
+            "values": {},
+            "status": {}
+        }
+
+        if isinstance(servo, Servo):
+            sid = servo.servo_id
+        else:
+            sid = servo
+
+        if self.cache is not None:
+            # only the registers not in the cache are read from the bus
+            missing = list()
+            for register in registers:
+                cached = self.cache.get(sid, register)
+                if cached is None:
+                    missing.append(register)
+                else:
+                    result['values'][register] = cached
+            registers = missing
+            if len(registers) == 0:
+                return result
+
+        key = tuple(registers)
+        blocks = self._block_plans.get(key)
+        if blocks is None:
+            blocks = plan_block_reads(registers)
+            self._block_plans[key] = blocks
+
+        for block in blocks:
+            block_result = self.read_block(sid, block.address, block.length)
+            result['status'].update(block_result['status'])
+            result['values'].update(zip(
+                block.registers,
+                struct.unpack(block.fmt, bytes(block_result['data']))))
+        return result
+
+    def read_group(self, servo_list, registers):
+        """
+        Read several registers of each Servo in the servo_list. With a backend
+        that batches instructions, such as a `PacketBus`, the block reads of
+        every servo are sent back to back in one batch, and otherwise each
+        servo is read in turn with `read_registers`.
+
+        :param servo_list:
+        :param registers: the names of the registers to read
+        :return: a dict containing:
+            { "values": <the list in servo_list order of a dict of the value
+                         read from each register>,
+              "status": <the list in servo_list order of a dict containing
+                         the status bit states>
+            }
+        """
+        sids = [servo.servo_id if isinstance(servo, Servo) else servo
+                for servo in servo_list]
+        if not hasattr(self.dxl, 'batch'):
+            results = [self.read_registers(sid, registers) for sid in sids]
+            return {
+                "values": [r['values'] for r in results],
+                "status": [r['status'] for r in results]
+            }
+
+        result = {
+            "values": [dict() for _ in sids],
+            "status": [dict() for _ in sids]
+        }
+        wanted = list()
+        for n, sid in enumerate(sids):
+            missing = list()
+            for register in registers:
+                cached = None
+                if self.cache is not None:
+                    cached = self.cache.get(sid, register)
+                if cached is None:
+                    missing.append(register)
+                else:
+                    result['values'][n][register] = cached
+            if missing:
+                key = tuple(missing)
+                if key not in self._block_plans:
+                    self._block_plans[key] = plan_block_reads(missing)
+                for block in self._block_plans[key]:
+                    wanted.append((n, sid, block))
+        if len(wanted) == 0:
+            return result
+
+        with self.lock:
+            batch = self.dxl.batch()
+            for n, sid, block in wanted:
+                batch.read(sid, block.address, block.length)
+            statuses = batch.flush()
+
+            for (n, sid, block), status in zip(wanted, statuses):
+                data = bytearray(block.length)
+                if status.result != COMM_SUCCESS:
+                    self.dxl.printTxRxResult(
+                        self.protocol_version, status.result)
+                    log.error("[read_group] servo_id:{0} Comm unsuccessful:"
+                              "{1}".format(sid, status.result))
+                elif len(status.params) == block.length:
+                    data = bytearray(status.params)
+                if status.error:
+                    result['status'][n].update(
+                        self._result_to_status(status.error))
+                    self.dxl.printRxPacketError(
+                        self.protocol_version, status.error)
+                    log.error("[read_group] servo_id:{0} Error:{1}".format(
+                        sid, status.error))
+                if self.cache is not None:
+                    if status.error:
+                        self.cache.invalidate(sid)
+                    elif status.result == COMM_SUCCESS:
+                        self.cache.put_data(sid, block.address, data)
+                result['values'][n].update(zip(
+                    block.registers, struct.unpack(block.fmt, bytes(data))))
+        return result
+
     def bulk_read(self, read_blocks):
         """
 
@@ -783,14 +1375,15 @@ class ServoProtocol(object):
             raise NotImplementedError("AX-12 Servos do not support bulk_read.")
 
         response = {"blocks": []}
-        group_num = groupBulkRead(self.port_num, self.protocol_version)
+        group_num = self.dxl.groupBulkRead(
+            self.port_num, self.protocol_version)
         log.info("[bulk_read] read group_num:{0}".format(group_num))
 
         for block in read_blocks['blocks']:
             # loop through blocks to add each as a param to the bulk_read group
             sid = block['servo_id']
             register = block['register']
-            last_result = groupBulkReadAddParam(
+            last_result = self.dxl.groupBulkReadAddParam(
                 group_num, sid,
                 dxl_control[register]['address'],
                 dxl_control[register]['comm_bytes']
@@ -802,19 +1395,19 @@ class ServoProtocol(object):
                 log.error(err)
                 raise IOError(err)
 
-        groupBulkReadTxRxPacket(group_num)
+        self.dxl.groupBulkReadTxRxPacket(group_num)
         ts = datetime.datetime.now().isoformat()
 
-        last_result = getLastTxRxResult(self.port_num,
-                                            self.protocol_version)
+        last_result = self.dxl.getLastTxRxResult(self.port_num,
+                                                 self.protocol_version)
         if last_result != COMM_SUCCESS:
-            printTxRxResult(self.protocol_version, last_result)
+            self.dxl.printTxRxResult(self.protocol_version, last_result)
 
         for block in read_blocks['blocks']:
             # loop through each block to see if the bulk result is available
             sid = block['servo_id']
             register = block['register']
-            last_result = groupBulkReadIsAvailable(
+            last_result = self.dxl.groupBulkReadIsAvailable(
                 group_num, sid,
                 dxl_control[register]['address'],
                 dxl_control[register]['comm_bytes']
@@ -830,7 +1423,7 @@ class ServoProtocol(object):
         for block in read_blocks['blocks']:
             sid = block['servo_id']
             register = block['register']
-            val = groupBulkReadGetData(
+            val = self.dxl.groupBulkReadGetData(
                 group_num, sid,
                 dxl_control[register]['address'],
                 dxl_control[register]['comm_bytes']
@@ -870,33 +1463,42 @@ class ServoProtocol(object):
                     "register:'{0}' cannot be written".format(register))
 
             if dxl_control[register]['comm_bytes'] == 1:
-                write1ByteTxRx(
+                self.dxl.write1ByteTxRx(
                     self.port_num, self.protocol_version, sid,
                     dxl_control[register]['address'], value)
             elif dxl_control[register]['comm_bytes'] == 2:
-                write2ByteTxRx(
+                self.dxl.write2ByteTxRx(
                     self.port_num, self.protocol_version, sid,
                     dxl_control[register]['address'], value)
 
-            last_result = getLastTxRxResult(
+            last_result = self.dxl.getLastTxRxResult(
                 self.port_num, self.protocol_version
             )
             if last_result != COMM_SUCCESS:
-                printTxRxResult(self.protocol_version, last_result)
+                self.dxl.printTxRxResult(self.protocol_version, last_result)
                 log.error("[write_register] Comm unsuccessful:{0}".format(
                     last_result))
 
             # Comms might be successful but we could still be in an error
             # state. So, check for error packet after every read
-            error_result = getLastRxPacketError(
+            error_result = self.dxl.getLastRxPacketError(
                 self.port_num, self.protocol_version)
             if error_result:
                 result['status'] = self._result_to_status(error_result)
-                printRxPacketError(self.protocol_version, error_result)
+                self.dxl.printRxPacketError(
+                    self.protocol_version, error_result)
                 log.error("[write_register] Error:{0}".format(error_result))
             else:
                 log.debug(
                     "[write_register] register:'{0}' written".format(register))
+            if register == 'ID' and self.cache is not None:
+                # the servo now answers to its new ID, and nothing known of
+                # either ID describes it any longer
+                self.cache.invalidate(sid)
+                self.cache.invalidate(value)
+                sid = value
+            self._cache_result(sid, last_result, error_result,
+                               {register: value})
 
         return result
 
@@ -912,7 +1514,7 @@ class ServoProtocol(object):
         """
         result = False
         with self.lock:
-            group_num = groupSyncWrite(
+            group_num = self.dxl.groupSyncWrite(
                 self.port_num, self.protocol_version,
                 dxl_control[register]['address'],
                 dxl_control[register]['comm_bytes']
@@ -927,7 +1529,7 @@ class ServoProtocol(object):
                 else:
                     sid = servo
 
-                add_parm = groupSyncWriteAddParam(
+                add_parm = self.dxl.groupSyncWriteAddParam(
                     group_num, sid,
                     value,
                     dxl_control[register]['comm_bytes']
@@ -940,20 +1542,151 @@ class ServoProtocol(object):
                 else:
                     log.debug("[sync_write] added param to sync write")
 
-            groupSyncWriteTxPacket(group_num)
+            self.dxl.groupSyncWriteTxPacket(group_num)
 
-            last_result = getLastTxRxResult(
+            last_result = self.dxl.getLastTxRxResult(
                 self.port_num, self.protocol_version
             )
             if last_result != COMM_SUCCESS:
-                printTxRxResult(self.protocol_version, last_result)
+                self.dxl.printTxRxResult(self.protocol_version, last_result)
                 log.error(
                     "[sync_write] Comm unsuccessful:{0}".format(last_result))
             else:
                 result = True
+                if self.cache is not None:
+                    for servo in servo_list:
+                        sid = servo.servo_id if isinstance(
+                            servo, Servo) else servo
+                        self.cache.put(sid, register, value)
+
+        return result
+
+    def sync_write_values(self, register, values, servo_list,
+                          data_length=None):
+        """
+        Write a different value to each Servo in the servo_list, synchronously
+        in one packet.
+
+        :param register: the register at which the values start
+        :param values: the list of values to write in servo_list order
+        :param servo_list:
+        :param data_length: the number of bytes of each value, which may span
+            the registers following `register`, up to the backend's
+            `max_param_bytes`, or 1, 2 or 4 for the DynamixelSDK
+            [default: None, the bytes of `register`]
+        :return: True if success, False if not
+        """
+        if data_length is None:
+            data_length = dxl_control[register]['comm_bytes']
+        if len(values) != len(servo_list):
+            raise ValueError("{0} values for {1} servos".format(
+                len(values), len(servo_list)))
+
+        result = False
+        with self.lock:
+            group_num = self.dxl.groupSyncWrite(
+                self.port_num, self.protocol_version,
+                dxl_control[register]['address'],
+                data_length
+            )
+            log.info("[sync_write_values] reg:'{0}' values:{1}".format(
+                register, values))
+
+            for servo, value in zip(servo_list, values):
+                if isinstance(servo, Servo):
+                    sid = servo.servo_id
+                else:
+                    sid = servo
+
+                add_parm = self.dxl.groupSyncWriteAddParam(
+                    group_num, sid, value, data_length)
+
+                if add_parm is False:
+                    log.error(
+                        "[sync_write_values] ERROR servo_id:{0} add "
+                        "register:{1}".format(sid, register))
+                    return False
+
+            self.dxl.groupSyncWriteTxPacket(group_num)
+
+            last_result = self.dxl.getLastTxRxResult(
+                self.port_num, self.protocol_version
+            )
+            if last_result != COMM_SUCCESS:
+                self.dxl.printTxRxResult(self.protocol_version, last_result)
+                log.error("[sync_write_values] Comm unsuccessful:{0}".format(
+                    last_result))
+            else:
+                result = True
+                if self.cache is not None:
+                    address = dxl_control[register]['address']
+                    for servo, value in zip(servo_list, values):
+                        sid = servo.servo_id if isinstance(
+                            servo, Servo) else servo
+                        data = bytearray((value >> 8 * i) & 0xFF
+                                         for i in range(data_length))
+                        self.cache.put_data(sid, address, data, written=True)
 
         return result
 
+    def sync_write_registers(self, registers, values, servo_list):
+        """
+        Write different values to adjacent registers of each Servo in the
+        servo_list. The registers are written in one packet when the backend
+        takes data that long, and otherwise in as few packets as it allows.
+
+        :param registers: the names of adjacent registers in address order
+        :param values: the list in servo_list order of each servo's list of
+            values, one per register
+        :param servo_list:
+        :return: True if success, False if not
+        """
+        end = None
+        for register in registers:
+            address = dxl_control[register]['address']
+            if end is not None and address != end:
+                raise ValueError("register:'{0}' does not follow:{1}".format(
+                    register, registers))
+            if dxl_control[register]['access'] == "r":
+                raise IOError(
+                    "register:'{0}' cannot be written".format(register))
+            end = address + dxl_control[register]['comm_bytes']
+
+        max_bytes = min(
+            getattr(self.dxl, 'max_param_bytes', SDK_PARAM_BYTES),
+            (MAX_PACKET_PARAMS - 2) // len(servo_list) - 1)
+        # the DynamixelSDK packs each servo's data as a uint8, uint16 or uint32
+        lengths = None
+        if not hasattr(self.dxl, 'max_param_bytes'):
+            lengths = SDK_DATA_LENGTHS
+        # split the registers into chunks of whole registers that fit the
+        # data of one sync write
+        chunks = list()
+        for i, register in enumerate(registers):
+            comm_bytes = dxl_control[register]['comm_bytes']
+            length = chunks[-1][1] + comm_bytes if chunks else None
+            if chunks and length <= max_bytes and (
+                    lengths is None or length in lengths):
+                chunks[-1][1] += comm_bytes
+                chunks[-1][2].append(i)
+            else:
+                chunks.append([register, comm_bytes, [i]])
+
+        result = True
+        for register, data_length, indexes in chunks:
+            chunk_values = list()
+            for servo_values in values:
+                value = 0
+                shift = 0
+                for i in indexes:
+                    value |= servo_values[i] << shift
+                    shift += 8 * dxl_control[registers[i]]['comm_bytes']
+                chunk_values.append(value)
+            result = self.sync_write_values(
+                register, chunk_values, servo_list,
+                data_length=data_length) and result
+        return result
+
 
 def read_all_servo_registers(cli, servo_type='AX-12'):
     with ServoProtocol(servo_type=servo_type) as sp:
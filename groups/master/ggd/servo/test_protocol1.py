@@ -0,0 +1,159 @@
+"""
+Tests of the Dynamixel Protocol 1.0 packets, and of a `PacketBus` talking to a
+`BusEmulator` over a pty.
+
+Run from the directory above the package, for example:
+    python -m unittest ggd.servo.test_protocol1
+"""
+import os
+import pty
+import tty
+import unittest
+import threading
+
+from . import protocol1
+from .protocol1 import PacketBus, ProtocolError, from_bytes, to_bytes
+from .protocol1 import COMM_SUCCESS, COMM_RX_TIMEOUT
+from .emulator import BusEmulator, AX_12_MODEL_NUMBER
+from .servode import Servo, ServoProtocol
+
+# the manual's example, read one byte at 0x2B of servo 1
+READ_EXAMPLE = bytearray([0xFF, 0xFF, 0x01, 0x04, 0x02, 0x2B, 0x01, 0xCC])
+SERVO_IDS = [10, 11, 12]
+MISSING_ID = 13
+
+
+class PacketTest(unittest.TestCase):
+
+    def test_checksum(self):
+        self.assertEqual(protocol1.checksum(READ_EXAMPLE[2:-1]), 0xCC)
+
+    def test_encode(self):
+        self.assertEqual(protocol1.read_data(1, 0x2B, 1), READ_EXAMPLE)
+
+    def test_decode(self):
+        servo_id, instruction, params = protocol1.decode(READ_EXAMPLE)
+        self.assertEqual(servo_id, 1)
+        self.assertEqual(instruction, protocol1.READ_DATA)
+        self.assertEqual(params, bytearray([0x2B, 0x01]))
+
+    def test_round_trip(self):
+        data = to_bytes(1023, 2)
+        packet = protocol1.write_data(10, 30, data)
+        servo_id, instruction, params = protocol1.decode(packet)
+        self.assertEqual(servo_id, 10)
+        self.assertEqual(instruction, protocol1.WRITE_DATA)
+        self.assertEqual(params[0], 30)
+        self.assertEqual(from_bytes(params[1:]), 1023)
+
+    def test_decode_bad_checksum(self):
+        packet = bytearray(READ_EXAMPLE)
+        packet[-1] ^= 0x01
+        self.assertRaises(ProtocolError, protocol1.decode, packet)
+
+    def test_decode_bad_length(self):
+        packet = bytearray(READ_EXAMPLE)
+        packet[3] += 1
+        self.assertRaises(ProtocolError, protocol1.decode, packet)
+
+    def test_decode_unframed(self):
+        self.assertRaises(ProtocolError, protocol1.decode, READ_EXAMPLE[1:])
+
+
+class ReadPacketTest(unittest.TestCase):
+
+    def setUp(self):
+        self.read_fd, self.write_fd = os.pipe()
+
+    def tearDown(self):
+        os.close(self.read_fd)
+        os.close(self.write_fd)
+
+    def test_read_packet(self):
+        os.write(self.write_fd, bytes(READ_EXAMPLE))
+        self.assertEqual(protocol1.read_packet(self.read_fd, 0.1),
+                         READ_EXAMPLE)
+
+    def test_resync_after_noise(self):
+        os.write(self.write_fd, bytes(bytearray([0x00, 0xFF, 0x12])))
+        os.write(self.write_fd, bytes(READ_EXAMPLE))
+        self.assertEqual(protocol1.read_packet(self.read_fd, 0.1),
+                         READ_EXAMPLE)
+
+    def test_resync_after_extra_header_byte(self):
+        os.write(self.write_fd, bytes(bytearray([0xFF]) + READ_EXAMPLE))
+        self.assertEqual(protocol1.read_packet(self.read_fd, 0.1),
+                         READ_EXAMPLE)
+
+    def test_back_to_back(self):
+        status = protocol1.encode(1, 0, [0x20])
+        os.write(self.write_fd, bytes(READ_EXAMPLE + status))
+        self.assertEqual(protocol1.read_packet(self.read_fd, 0.1),
+                         READ_EXAMPLE)
+        self.assertEqual(protocol1.read_packet(self.read_fd, 0.1), status)
+
+    def test_timeout(self):
+        self.assertIsNone(protocol1.read_packet(self.read_fd, 0.01))
+
+
+class PacketBusTest(unittest.TestCase):
+
+    def setUp(self):
+        self.master, self.slave = pty.openpty()
+        tty.setraw(self.master)
+        tty.setraw(self.slave)
+        self.emulator = BusEmulator(SERVO_IDS, realtime=False)
+        self.should_run = threading.Event()
+        self.should_run.set()
+        self.server = threading.Thread(
+            target=self.emulator.serve, args=(self.slave, self.should_run))
+        self.server.daemon = True
+        self.server.start()
+        self.bus = PacketBus(fd=self.master)
+
+    def tearDown(self):
+        self.should_run.clear()
+        self.server.join()
+        if self.bus.fd is not None:
+            # otherwise a ServoProtocol closed it with the port
+            os.close(self.bus.fd)
+        os.close(self.slave)
+
+    def test_ping(self):
+        status, = self.bus.transact([protocol1.ping(10)])
+        self.assertEqual(status.result, COMM_SUCCESS)
+        self.assertEqual(status.servo_id, 10)
+        self.assertEqual(status.error, 0)
+
+    def test_missing_servo_times_out(self):
+        status, = self.bus.transact([protocol1.ping(MISSING_ID)])
+        self.assertEqual(status.result, COMM_RX_TIMEOUT)
+
+    def test_batch(self):
+        batch = self.bus.batch()
+        batch.write(10, 30, to_bytes(600, 2))
+        batch.sync_write(30, 2, [(11, to_bytes(700, 2)),
+                                 (12, to_bytes(800, 2))])
+        for servo_id in SERVO_IDS + [MISSING_ID]:
+            batch.read(servo_id, 30, 2)
+        self.assertEqual(len(batch), 6)
+        statuses = batch.flush()
+        self.assertEqual(len(batch), 0)
+        self.assertEqual([s.result for s in statuses],
+                         [COMM_SUCCESS] * 5 + [COMM_RX_TIMEOUT])
+        self.assertEqual([s.servo_id for s in statuses],
+                         [10, protocol1.BROADCAST_ID] + SERVO_IDS +
+                         [MISSING_ID])
+        self.assertEqual([from_bytes(s.params) for s in statuses[2:5]],
+                         [600, 700, 800])
+
+    def test_servo_protocol(self):
+        with ServoProtocol(backend=self.bus) as sp:
+            servo = Servo(sp, 10)
+            servo['goal_position'] = 600
+            self.assertEqual(servo['goal_position'], 600)
+            self.assertEqual(sp.ping(10), AX_12_MODEL_NUMBER)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+"""
+Tests of the `RegisterCache` of a `ServoProtocol` talking to a `BusEmulator`.
+
+Run from the directory above the package, for example:
+    python -m unittest ggd.servo.test_servode
+"""
+import time
+import unittest
+
+from .emulator import BusEmulator
+from .servode import Servo, ServoProtocol, RegisterCache
+
+SERVO_IDS = [1, 2, 3]
+NEW_ID = 9
+SHORT_AGE = 0.01  # seconds, short enough to wait out in a test
+LONG_AGE = 60  # seconds, longer than any test
+
+
+class RegisterCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.bus = BusEmulator(SERVO_IDS, realtime=False)
+        self.cache = RegisterCache(
+            max_ages={'present_temperature': LONG_AGE,
+                      'present_voltage': SHORT_AGE})
+        self.sp = ServoProtocol(backend=self.bus, cache=self.cache)
+        self.sp.__enter__()
+        self.servo = Servo(self.sp, SERVO_IDS[0])
+
+    def tearDown(self):
+        self.sp.__exit__(None, None, None)
+
+    def read_packets(self, register, servo=None):
+        # the value of the register and the packets sent to read it
+        servo = self.servo if servo is None else servo
+        packets = self.bus.packets
+        value = servo[register]
+        return value, self.bus.packets - packets
+
+    def test_eeprom_read_once(self):
+        _, packets = self.read_packets('model_number')
+        self.assertGreater(packets, 0)
+        self.assertEqual(self.read_packets('model_number')[1], 0)
+        self.assertEqual(self.cache.stats()['hits'], 1)
+
+    def test_read_after_write(self):
+        self.servo['goal_position'] = 600
+        self.assertEqual(self.read_packets('goal_position'), (600, 0))
+
+    def test_volatile_not_cached(self):
+        self.read_packets('present_position')
+        self.assertGreater(self.read_packets('present_position')[1], 0)
+
+    def test_volatile_max_age(self):
+        self.read_packets('present_temperature')
+        self.assertEqual(self.read_packets('present_temperature')[1], 0)
+
+        self.read_packets('present_voltage')
+        time.sleep(SHORT_AGE * 2)
+        self.assertGreater(self.read_packets('present_voltage')[1], 0)
+
+    def test_error_invalidates(self):
+        self.servo['goal_position'] = 600
+        other = Servo(self.sp, SERVO_IDS[1])
+        other['goal_position'] = 700
+
+        # a block running past the end of the control table is refused
+        result = self.sp.read_block(self.servo.servo_id, 45, 10)
+        self.assertTrue(result['status'].get('range_error'))
+
+        self.assertGreater(self.read_packets('goal_position')[1], 0)
+        self.assertEqual(self.read_packets('goal_position', other),
+                         (700, 0))
+
+    def test_id_change_invalidates(self):
+        self.servo['goal_position'] = 600
+        self.cache.put(NEW_ID, 'goal_position', 100)
+
+        self.servo.new_id(NEW_ID)
+        self.assertIsNone(self.cache.get(SERVO_IDS[0], 'goal_position'))
+        self.assertEqual(self.read_packets('ID'), (NEW_ID, 0))
+        value, packets = self.read_packets('goal_position')
+        self.assertEqual(value, 600)
+        self.assertGreater(packets, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()